@@ -0,0 +1,172 @@
+"""
+Moves idle chats from Redis into the compressed `chat_archives` table.
+
+Chat metadata and the recency indexes stay in Redis so listing is unaffected;
+only the message list is evicted. get_chat_history rehydrates archived chats
+on access (see redis_client.get_chat_history).
+"""
+import json
+import time
+import uuid
+import zlib
+import redis
+import models
+from database import SessionLocal
+from chat_codec import decode_message
+from single_flight import release_script
+from redis_client import (
+    get_redis_client, get_redis_binary_client, restore_chat_messages,
+    CHAT_ACTIVITY_KEY, ARCHIVED_CHATS_KEY
+)
+from config import CHAT_ARCHIVE_IDLE_SECONDS, CHAT_ARCHIVE_BATCH_SIZE, CHAT_HOT_TTL_SECONDS
+
+ARCHIVE_STATS_KEY = "chats:archive:stats"
+REHYDRATE_LATENCY_KEY = "chats:archive:rehydrate_latencies"
+ARCHIVER_LOCK_KEY = "chats:archiver:lock"
+
+
+def archive_chat(db, user_id: str, chat_id: str, last_active: float):
+    """
+    Copies one chat's messages to Postgres, then drops them from Redis unless a
+    new message arrived meanwhile. Returns the Redis bytes reclaimed.
+    """
+    redis_client = get_redis_client()
+    redis_bin = get_redis_binary_client()
+    key = f"chat:{chat_id}:messages"
+    member = f"{user_id}:{chat_id}"
+
+    with redis_bin.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            entries = pipe.lrange(key, 0, -1)
+            if not entries:
+                # Nothing to evict (empty chat or already archived)
+                pipe.unwatch()
+                redis_client.zrem(CHAT_ACTIVITY_KEY, member)
+                return 0
+            try:
+                reclaimed = pipe.memory_usage(key, samples=0) or 0
+            except redis.ResponseError:
+                # MEMORY is disabled on some managed Redis offerings: estimate from payloads
+                reclaimed = sum(len(e) for e in entries)
+
+            messages = [decode_message(e) for e in entries]
+            db.merge(models.ChatArchive(
+                chat_id=chat_id,
+                user_id=int(user_id),
+                message_count=len(messages),
+                data=zlib.compress(json.dumps(messages).encode("utf-8")),
+                last_active=last_active,
+            ))
+            db.commit()
+
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(ARCHIVED_CHATS_KEY, chat_id)
+            pipe.zrem(CHAT_ACTIVITY_KEY, member)
+            pipe.hincrby(ARCHIVE_STATS_KEY, "archived_chats", 1)
+            pipe.hincrby(ARCHIVE_STATS_KEY, "archived_messages", len(messages))
+            pipe.hincrby(ARCHIVE_STATS_KEY, "bytes_reclaimed", reclaimed)
+            pipe.execute()
+            return reclaimed
+        except redis.WatchError:
+            # The chat became active again while we were copying it; try next round
+            return 0
+
+
+def archive_idle_chats(idle_seconds: int = CHAT_ARCHIVE_IDLE_SECONDS, batch_size: int = CHAT_ARCHIVE_BATCH_SIZE):
+    """Archives up to batch_size chats idle for longer than idle_seconds."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {"archived": 0, "bytes_reclaimed": 0}
+
+    # Only one archiver at a time across all workers
+    token = uuid.uuid4().hex
+    if not redis_client.set(ARCHIVER_LOCK_KEY, token, nx=True, ex=600):
+        return {"archived": 0, "bytes_reclaimed": 0}
+
+    archived = 0
+    reclaimed = 0
+    db = SessionLocal()
+    try:
+        cutoff = time.time() - idle_seconds
+        idle = redis_client.zrangebyscore(CHAT_ACTIVITY_KEY, "-inf", cutoff, start=0, num=batch_size, withscores=True)
+        for member, last_active in idle:
+            user_id, chat_id = member.split(":", 1)
+            try:
+                freed = archive_chat(db, user_id, chat_id, last_active)
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Failed to archive chat {chat_id}: {e}")
+                continue
+            if freed:
+                archived += 1
+                reclaimed += freed
+    finally:
+        db.close()
+        # Only release our own lock: a run that outlived the TTL must not free another worker's
+        release_script(keys=[ARCHIVER_LOCK_KEY], args=[token])
+
+    if archived:
+        print(f"📦 Archived {archived} idle chats, reclaimed {reclaimed / 1024:.1f} KiB of Redis memory")
+    return {"archived": archived, "bytes_reclaimed": reclaimed}
+
+
+def load_archived_messages(chat_id: str):
+    """Reads an archived chat straight from Postgres; None if there is no archive row."""
+    return load_archived_messages_many([chat_id]).get(chat_id)
+
+
+def load_archived_messages_many(chat_ids):
+    """Reads several archived chats in one query: {chat_id: messages} for those with an archive row."""
+    if not chat_ids:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(models.ChatArchive).filter(models.ChatArchive.chat_id.in_(list(chat_ids))).all()
+    finally:
+        db.close()
+    return {row.chat_id: json.loads(zlib.decompress(row.data)) for row in rows}
+
+
+def rehydrate_chat(chat_id: str):
+    """Loads an archived chat back into Redis (with a TTL) and returns its messages."""
+    started = time.perf_counter()
+    messages = load_archived_messages(chat_id)
+    if messages is None:
+        get_redis_client().srem(ARCHIVED_CHATS_KEY, chat_id)
+        return []
+
+    restore_chat_messages(chat_id, messages, CHAT_HOT_TTL_SECONDS)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    pipe = get_redis_client().pipeline()
+    pipe.hincrby(ARCHIVE_STATS_KEY, "rehydrations", 1)
+    pipe.lpush(REHYDRATE_LATENCY_KEY, round(elapsed_ms, 2))
+    pipe.ltrim(REHYDRATE_LATENCY_KEY, 0, 199)
+    pipe.execute()
+    return messages
+
+
+def get_archive_stats():
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    raw = redis_client.hgetall(ARCHIVE_STATS_KEY)
+    latencies = sorted(float(x) for x in redis_client.lrange(REHYDRATE_LATENCY_KEY, 0, -1))
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        "archived_chats": int(raw.get("archived_chats", 0)),
+        "archived_messages": int(raw.get("archived_messages", 0)),
+        "redis_bytes_reclaimed": int(raw.get("bytes_reclaimed", 0)),
+        "currently_archived": redis_client.scard(ARCHIVED_CHATS_KEY),
+        "rehydrations": int(raw.get("rehydrations", 0)),
+        "rehydrate_ms_p50": percentile(0.50),
+        "rehydrate_ms_p95": percentile(0.95),
+    }
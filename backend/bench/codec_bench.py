@@ -0,0 +1,101 @@
+"""
+Compares the chat message codecs: bytes per 1k messages, Redis memory per 1k
+messages (when a Redis server is reachable) and encode/decode throughput.
+
+    python bench/codec_bench.py [--messages 1000] [--rounds 5]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_codec
+from chat_codec import encode_message_with, decode_message, CODEC_JSON, CODEC_MSGPACK, COMPRESS_ZLIB, COMPRESS_ZSTD
+
+WORDS = (
+    "the of and to in is that for it as with was on be by this are or from at an "
+    "function variable derivative integral matrix eigenvector recursion algorithm "
+    "student exam study plan week practice concept example step proof because "
+    "let's consider first second then finally remember great question you can try"
+).split()
+
+
+def sample_conversation(n, seed=7):
+    """Alternating user/model messages with chat-like length distributions."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n):
+        if i % 2 == 0:
+            length = int(rng.lognormvariate(3.0, 0.7))        # ~20 words
+            role = "user"
+        else:
+            length = int(rng.lognormvariate(5.2, 0.6))        # ~180 words, markdown-ish
+            role = "model"
+        text = " ".join(rng.choice(WORDS) for _ in range(max(1, length)))
+        if role == "model":
+            text = "**Answer**\n\n" + text.replace(" step ", "\n- step ")
+        messages.append((role, text))
+    return messages
+
+
+def variants():
+    out = [("legacy json", None, 0), ("compact json", CODEC_JSON, 0), ("compact json+zlib", CODEC_JSON, COMPRESS_ZLIB)]
+    if chat_codec.zstandard:
+        out.append(("compact json+zstd", CODEC_JSON, COMPRESS_ZSTD))
+    if chat_codec.msgpack:
+        out.append(("msgpack", CODEC_MSGPACK, 0))
+        if chat_codec.zstandard:
+            out.append(("msgpack+zstd", CODEC_MSGPACK, COMPRESS_ZSTD))
+    return out
+
+
+def redis_memory(entries):
+    try:
+        import redis
+        from config import REDIS_HOST, REDIS_PORT
+        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+        r.ping()
+    except Exception:
+        return None
+    key = "bench:codec:messages"
+    r.delete(key)
+    r.rpush(key, *entries)
+    usage = r.memory_usage(key, samples=0)
+    r.delete(key)
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = sample_conversation(args.messages)
+    print(f"{args.messages} messages, orjson={bool(chat_codec.orjson)} msgpack={bool(chat_codec.msgpack)} zstd={bool(chat_codec.zstandard)}\n")
+    print(f"{'codec':<20} {'bytes/1k':>10} {'redis/1k':>10} {'enc msg/s':>12} {'dec msg/s':>12}")
+
+    scale = 1000 / args.messages
+    for name, codec, compression in variants():
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            entries = [encode_message_with(role, [text], codec, compression) for role, text in messages]
+        encode_rate = args.rounds * len(messages) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            decoded = [decode_message(e) for e in entries]
+        decode_rate = args.rounds * len(messages) / (time.perf_counter() - start)
+        assert decoded[1] == {"role": messages[1][0], "parts": [messages[1][1]]}
+
+        size = sum(len(e) for e in entries) * scale
+        memory = redis_memory(entries)
+        memory_str = f"{memory * scale:>10.0f}" if memory else f"{'n/a':>10}"
+        print(f"{name:<20} {size:>10.0f} {memory_str} {encode_rate:>12.0f} {decode_rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Local stand-in for the Groq (OpenAI-compatible) chat completions API, so /chat
+and the goal/reward generators can be load tested without spending quota.
+
+Responses are shaped after the prompt each groq_service function sends (intent
+classifier, chat JSON, subtasks, week outline, quiz, rewards, plain reminder).
+Latency per model is time-to-first-token (lognormal) plus completion tokens at
+a fixed token rate, and errors can be injected per model:
+
+    python bench/fake_groq.py [--port 8901] [--profile profile.json] [--speed 1.0]
+    GROQ_BASE_URL=http://127.0.0.1:8901 uvicorn main:app
+
+A profile file overrides DEFAULT_PROFILES per model name (or "*" for all):
+
+    {"openai/gpt-oss-120b": {"ttft_ms": 1500, "tokens_per_sec": 120, "error_rate": 0.05}}
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MODEL_CONFIG
+
+# Rough shape of the real models: small ones answer fast, the 120b is slow
+DEFAULT_PROFILES = {
+    MODEL_CONFIG["primary"]: {"ttft_ms": 150, "ttft_sigma": 0.4, "tokens_per_sec": 750, "error_rate": 0.0},
+    MODEL_CONFIG["academic"]: {"ttft_ms": 600, "ttft_sigma": 0.6, "tokens_per_sec": 250, "error_rate": 0.0},
+    MODEL_CONFIG["reasoning"]: {"ttft_ms": 300, "ttft_sigma": 0.5, "tokens_per_sec": 280, "error_rate": 0.0},
+    MODEL_CONFIG["teaching"]: {"ttft_ms": 250, "ttft_sigma": 0.5, "tokens_per_sec": 400, "error_rate": 0.0},
+}
+FALLBACK_PROFILE = {"ttft_ms": 200, "ttft_sigma": 0.5, "tokens_per_sec": 500, "error_rate": 0.0}
+# Injected failures: status, Groq-style error type
+ERRORS = [(503, "service_unavailable"), (500, "internal_server_error"), (429, "rate_limit_exceeded")]
+# Share of classifications per mode (the real router sends most traffic to primary)
+MODE_MIX = [("primary", 0.6), ("teaching", 0.15), ("reasoning", 0.15), ("academic", 0.1)]
+
+WORDS = (
+    "let's break this down step by step first review the core concept then practice with an example "
+    "remember to take short breaks you are making great progress keep going this builds on what you "
+    "learned before try to explain it in your own words"
+).split()
+
+
+def load_profiles(path=None):
+    profiles = {model: dict(p) for model, p in DEFAULT_PROFILES.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        for model, override in overrides.items():
+            targets = list(profiles) if model == "*" else [model]
+            for target in targets:
+                profiles[target] = {**profiles.get(target, FALLBACK_PROFILE), **override}
+    return profiles
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _count(pattern, text, default):
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+def fake_content(messages, json_mode, rng):
+    """Content that the calling groq_service function can parse."""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    prompt = messages[-1]["content"] if messages else ""
+
+    if "Intent Classifier" in system:
+        mode = rng.choices([m for m, _ in MODE_MIX], weights=[w for _, w in MODE_MIX])[0]
+        return json.dumps({"mode": mode})
+    if '"is_learning"' in prompt:
+        questions = [{
+            "question": _sentence(rng, 8) + "?",
+            "options": [_sentence(rng, 3) for _ in range(4)],
+        } for _ in range(5)]
+        for q in questions:
+            q["correct_answer"] = q["options"][0]
+        return json.dumps({"is_learning": True, "questions": questions})
+    if '"rewards"' in prompt:
+        tiers = [("Common", 30, "shopping"), ("Rare", 100, "gift"), ("Epic", 300, "star"), ("Legendary", 800, "trophy")]
+        rewards = []
+        for i in range(50):
+            tier, cost, icon = tiers[i % 4]
+            rewards.append({"name": f"{_sentence(rng, 2)[:-1]} #{i + 1}", "cost": cost, "icon": icon, "category": tier})
+        return json.dumps({"rewards": rewards})
+    if '"weeks"' in prompt:
+        weeks = _count(r"EXACTLY (\d+) weeks", prompt, 4)
+        return json.dumps({"weeks": [_sentence(rng, 6) for _ in range(weeks)]})
+    if '"subtasks"' in prompt:
+        start = _count(r"Day (\d+) to Day", prompt, 1)
+        count = _count(r"EXACTLY (\d+) tasks", prompt, 0) or _count(r"covers EXACTLY (\d+)", prompt, 5)
+        label = "Week" if "by week" in prompt else "Day"
+        return json.dumps({"subtasks": [
+            {"text": f"{label} {start + i}: {_sentence(rng, 7)}", "completed": False} for i in range(count)
+        ]})
+    if json_mode:
+        first = "first message" in prompt
+        return json.dumps({
+            "title": "Study Session" if first else None,
+            "response": " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 10))),
+            "new_user_facts": None,
+            "suggested_goal": None,
+        })
+    return _sentence(rng, 12) + " " + _sentence(rng, 10)
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)  # ~4 characters per token
+
+
+class FakeGroq:
+    """Completion generator with per-model latency and error injection (shared by the HTTP handler)."""
+
+    def __init__(self, profiles=None, speed=1.0, seed=None):
+        self.profiles = profiles or load_profiles()
+        self.speed = speed  # >1 replays faster than the profile, 0 disables sleeping
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def complete(self, body):
+        """Returns (status, payload, delay_seconds)."""
+        model = body.get("model", "")
+        profile = self.profiles.get(model, FALLBACK_PROFILE)
+        with self.lock:
+            self.calls += 1
+            rng = random.Random(self.rng.random())
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+
+        ttft = rng.lognormvariate(0, profile.get("ttft_sigma", 0.5)) * profile["ttft_ms"] / 1000
+        if rng.random() < profile.get("error_rate", 0):
+            status, kind = rng.choice(ERRORS)
+            payload = {"error": {"message": f"Injected {kind} for {model}", "type": kind}}
+            return status, payload, ttft * self._scale
+
+        content = fake_content(body.get("messages", []), json_mode, rng)
+        prompt_tokens = sum(_tokens(str(m.get("content", ""))) for m in body.get("messages", []))
+        completion_tokens = _tokens(content)
+        delay = ttft + completion_tokens / profile["tokens_per_sec"]
+        payload = {
+            "id": f"chatcmpl-fake-{rng.getrandbits(48):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return 200, payload, delay * self._scale
+
+    @property
+    def _scale(self):
+        return 1 / self.speed if self.speed else 0
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send(400, {"error": {"message": "Invalid JSON body"}})
+            status, payload, delay = fake.complete(body)
+            if delay:
+                time.sleep(delay)
+            self._send(status, payload)
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the load test output
+
+    return Handler
+
+
+def serve(port=8901, profiles=None, speed=1.0, seed=None, host="127.0.0.1"):
+    """Starts the server on a daemon thread; returns the ThreadingHTTPServer (call shutdown() to stop)."""
+    fake = FakeGroq(profiles, speed=speed, seed=seed)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Groq-compatible completions server")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--profile", help="JSON file with per-model latency/error overrides")
+    parser.add_argument("--speed", type=float, default=1.0, help="latency divisor (0 = respond immediately)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = serve(args.port, load_profiles(args.profile), speed=args.speed, seed=args.seed)
+    print(f"🤖 Fake Groq listening on http://127.0.0.1:{args.port} (set GROQ_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Reproducible benchmarks of the LLM-backed functions in groq_service
+(get_ai_response, decompose_goal, generate_goal_quiz) using recorded
+completions (see llm_cassette.py).
+
+Record once against Groq (or the local stand-in, GROQ_BASE_URL), then replay
+offline as often as needed, with the recorded or scaled upstream latency:
+
+    python bench/llm_replay.py record --cassette cassettes/bench.jsonl
+    python bench/llm_replay.py replay --cassette cassettes/bench.jsonl [--rounds 5]
+                                      [--latency-scale 1.0] [--match sequence]
+
+Use --match sequence to replay a cassette after changing prompts or routing
+(exact matching would miss every changed request). A replay that misses
+recordings says so and exits 1, since groq_service would otherwise silently
+fall back to its canned error responses.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GROQ_API_KEY", "replay")  # the client is never called when replaying
+os.environ.setdefault("SINGLE_FLIGHT_RESULT_TTL_SECONDS", "0")  # every round must reach the (replayed) LLM
+
+import groq_service
+import llm_cassette
+
+CHAT_PROMPTS = [
+    "Hi! I'm feeling a bit overwhelmed with exams coming up.",
+    "Can you explain what a derivative is?",
+    "Teach me Python step by step",
+    "Solve: a train leaves at 3pm going 60 km/h, another at 4pm going 90 km/h. When does the second catch up?",
+    "What were the main causes of the French Revolution? Please cite sources.",
+]
+CHAT_HISTORY = [
+    {"role": "user", "parts": ["I want to get better at calculus."]},
+    {"role": "model", "parts": ["Great goal! Let's start with limits and derivatives."]},
+]
+QUIZ_SUBTASKS = [{"text": f"Day {d}: {topic}", "completed": False} for d, topic in enumerate(
+    ["Variables and types", "Control flow", "Functions", "Lists and dicts", "Modules", "Files", "Mini project"], 1
+)]
+
+
+def scenarios():
+    """(name, callable) pairs with fixed inputs, so recordings match exactly on replay."""
+    out = []
+    for i, prompt in enumerate(CHAT_PROMPTS):
+        out.append((f"get_ai_response[{i}]", lambda p=prompt: groq_service.get_ai_response([], p, user_name="Sam")))
+    out.append(("get_ai_response[history]", lambda: groq_service.get_ai_response(
+        CHAT_HISTORY, "What should I practice next?", user_profile="Studies engineering", user_name="Sam"
+    )))
+    out.append(("decompose_goal[7 days]", lambda: groq_service.decompose_goal("Learn Python basics", 7, "days")))
+    out.append(("decompose_goal[30 days]", lambda: groq_service.decompose_goal("Prepare for the GRE", 30, "days")))
+    out.append(("decompose_goal[8 weeks]", lambda: groq_service.decompose_goal("Run a half marathon", 8, "weeks", "weekly")))
+    out.append(("generate_goal_quiz", lambda: groq_service.generate_goal_quiz("Learn Python basics", QUIZ_SUBTASKS)))
+    return out
+
+
+def percentile(sorted_values, pct):
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def record(args):
+    if os.path.exists(args.cassette) and not args.append:
+        os.remove(args.cassette)
+    with llm_cassette.use(args.cassette, llm_cassette.MODE_RECORD):
+        for name, run in scenarios():
+            start = time.perf_counter()
+            run()
+            print(f"📼 {name:<28} {1000 * (time.perf_counter() - start):>9.1f} ms")
+    print(f"\n✅ Recorded to {args.cassette}")
+
+
+def replay(args):
+    timings = {}
+    with llm_cassette.use(args.cassette, llm_cassette.MODE_REPLAY, args.latency_scale, args.match) as cassette:
+        for _ in range(args.rounds):
+            for name, run in scenarios():
+                start = time.perf_counter()
+                run()
+                timings.setdefault(name, []).append(1000 * (time.perf_counter() - start))
+
+    print(f"\n{'scenario':<28} {'runs':>5} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, values in timings.items():
+        values.sort()
+        mean = sum(values) / len(values)
+        print(f"{name:<28} {len(values):>5} {mean:>9.1f} {percentile(values, 50):>9.1f} {percentile(values, 95):>9.1f}")
+    if cassette.misses:
+        print(f"\n❌ {cassette.misses} requests had no recording (re-record, or replay with --match sequence)")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay benchmarks of the LLM-backed functions")
+    parser.add_argument("command", choices=["record", "replay"])
+    parser.add_argument("--cassette", default="cassettes/bench.jsonl")
+    parser.add_argument("--append", action="store_true", help="add to an existing cassette instead of replacing it")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="0 replays without upstream latency")
+    parser.add_argument("--match", choices=["exact", "sequence"], default="exact")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Load test: boots the API (and optionally a job worker) against the local Groq
+stand-in in bench/fake_groq.py, drives a mix of login, chat, goal and reward
+traffic from concurrent virtual users, and reports p50/p95/p99 latency,
+requests/sec and goodput (successful requests/sec) per endpoint.
+
+    python bench/load_test.py [--users 20] [--duration 60] [--api-workers 2] [--with-worker]
+                              [--database-url sqlite:///./bench_load.sqlite] [--profile profile.json]
+                              [--mix chat=4,history=2,...] [--output results.json]
+                              [--baseline baseline.json --max-regression 0.2]
+
+Redis must be running (REDIS_HOST/REDIS_PORT). DATABASE_URL defaults to a
+scratch SQLite file; point it at a throwaway Postgres database for numbers that
+match production. --base-url skips booting and targets an API that is already
+running (it must have GROQ_BASE_URL pointed at a fake or you will spend quota).
+
+With --baseline, exits 1 when an endpoint's p95/p99 grows or its throughput
+drops by more than --max-regression, or its error rate rises; --save-baseline
+writes the current run as the new baseline.
+
+Requests shed by admission control (429) are counted apart from errors, and the
+virtual user waits out their Retry-After like the frontend would. Under
+overload, goodput should stay flat while the shed count grows.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import fake_groq  # noqa: E402  (bench/ is on sys.path when run as a script)
+
+DEFAULT_MIX = {
+    "chat": 4, "history": 2, "chats": 2, "goals": 2, "goal_summary": 2, "subtask": 1, "rewards": 1, "login": 1,
+}
+GOAL_DAYS = 30
+MIN_REGRESSION_MS = 5  # ignore latency changes smaller than this (timer noise on fast endpoints)
+PROMPTS = [
+    "Can you explain how derivatives work?",
+    "I'm stressed about my exams next week",
+    "Teach me python step by step",
+    "Solve x^2 - 5x + 6 = 0",
+    "What were the main causes of World War I? Please cite sources.",
+    "How should I plan my study time this weekend?",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Client:
+    """Keep-alive HTTP/1.1 connection for one virtual user."""
+
+    def __init__(self, base_url, timeout=120):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+        self.token = None
+        self.etags = {}
+        self.retry_after = None  # of the last response
+
+    def request(self, method, path, body=None, form=None, poll=False):
+        """Returns (status, parsed body or None). poll=True revalidates with If-None-Match, like a browser."""
+        headers = {"Accept-Encoding": "gzip"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if form is not None:
+            data = urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        else:
+            data = None
+        if poll and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self.conn.request(method, path, body=data, headers=headers)
+                response = self.conn.getresponse()
+                raw = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn = None  # server closed the keep-alive connection; retry once on a new one
+                if attempt:
+                    raise
+
+        self.retry_after = response.getheader("Retry-After")
+        if poll and response.getheader("ETag"):
+            self.etags[path] = response.getheader("ETag")
+        if response.getheader("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        try:
+            return response.status, json.loads(raw) if raw else None
+        except ValueError:
+            return response.status, None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> [latency ms]
+        self.errors = {}
+        self.shed = {}  # 429s: load shed on purpose, not failures
+
+    def record(self, endpoint, ms, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(ms)
+            if status == 429:
+                self.shed[endpoint] = self.shed.get(endpoint, 0) + 1
+            elif not 0 < status < 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def timed(self, client, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            status, data = client.request(method, path, **kwargs)
+        except Exception:
+            status, data = 0, None
+        self.record(endpoint, (time.perf_counter() - start) * 1000, status)
+        return status, data
+
+    def report(self, elapsed):
+        results = {}
+        for endpoint, values in sorted(self.samples.items()):
+            values = sorted(values)
+            errors, shed = self.errors.get(endpoint, 0), self.shed.get(endpoint, 0)
+            results[endpoint] = {
+                "count": len(values),
+                "errors": errors,
+                "shed": shed,
+                "rps": round(len(values) / elapsed, 2),
+                "goodput": round((len(values) - errors - shed) / elapsed, 2),
+                "p50": round(percentile(values, 50), 1),
+                "p95": round(percentile(values, 95), 1),
+                "p99": round(percentile(values, 99), 1),
+            }
+        return results
+
+
+class VirtualUser:
+    def __init__(self, index, args, recorder, run_id):
+        self.email = f"bench-{run_id}-{index}@example.com"
+        self.password = "bench-password"
+        self.client = Client(args.base_url)
+        self.recorder = recorder
+        self.rng = random.Random(index)
+        self.chat_id = None
+        self.goal_id = None
+
+    def setup(self):
+        c = self.client
+        status, _ = c.request("POST", "/register", body={"email": self.email, "password": self.password, "full_name": "Bench User"})
+        if status >= 400:
+            raise RuntimeError(f"register failed for {self.email}: {status}")
+        self.login()
+        c.request("PUT", "/users/me/favorites", body={"favorites": self.rng.choice(["cricket", "coding", "music"])})
+        self.chat_id = c.request("POST", "/chats", body={"title": "Bench"})[1]["id"]
+        subtasks = [{"text": f"Day {d}: practice", "completed": False} for d in range(1, GOAL_DAYS + 1)]
+        status, goal = c.request("POST", "/goals", body={
+            "title": "Learn calculus", "duration": GOAL_DAYS, "duration_unit": "days",
+            "priority": "High", "subtasks": json.dumps(subtasks),
+        })
+        self.goal_id = goal["id"] if status < 400 else None
+
+    def login(self):
+        status, data = self.recorder.timed(
+            self.client, "POST /token", "POST", "/token", form={"username": self.email, "password": self.password}
+        )
+        if status == 200:
+            self.client.token = data["access_token"]
+
+    def run(self, scenario):
+        c, rec = self.client, self.recorder
+        if scenario == "login":
+            self.login()
+        elif scenario == "chat":
+            status, _ = rec.timed(c, "POST /chat", "POST", "/chat", body={"chat_id": self.chat_id, "message": self.rng.choice(PROMPTS)})
+            if status == 429:
+                time.sleep(float(c.retry_after or 1))
+        elif scenario == "history":
+            rec.timed(c, "GET /chats/{chat_id}/history", "GET", f"/chats/{self.chat_id}/history", poll=True)
+        elif scenario == "chats":
+            rec.timed(c, "GET /chats", "GET", "/chats", poll=True)
+        elif scenario == "goals":
+            rec.timed(c, "GET /goals", "GET", "/goals?fields=id,title,status,priority,subtask_count,completed_count", poll=True)
+        elif scenario == "goal_summary":
+            rec.timed(c, "GET /goals/summary", "GET", "/goals/summary", poll=True)
+        elif scenario == "subtask" and self.goal_id:
+            index = self.rng.randrange(GOAL_DAYS)
+            rec.timed(c, "PATCH /goals/{goal_id}/subtasks/{index}", "PATCH", f"/goals/{self.goal_id}/subtasks/{index}",
+                      body={"completed": self.rng.random() < 0.7})
+        elif scenario == "rewards":
+            rec.timed(c, "GET /users/me/rewards", "GET", "/users/me/rewards")
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def wait_until_up(base_url, timeout, process=None):
+    parts = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"API exited with code {process.returncode} during startup")
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"API at {base_url} did not come up within {timeout}s")
+
+
+def boot(args):
+    """Starts the fake Groq server, the API and optionally a worker. Returns the processes to stop."""
+    groq_port = free_port()
+    fake = fake_groq.serve(groq_port, fake_groq.load_profiles(args.profile), speed=args.speed, seed=args.seed)
+    env = dict(os.environ)
+    env.update({
+        "GROQ_BASE_URL": f"http://127.0.0.1:{groq_port}",
+        "GROQ_API_KEY": env.get("GROQ_API_KEY") or "bench",
+        "DATABASE_URL": args.database_url,
+    })
+    api_port = free_port()
+    args.base_url = f"http://127.0.0.1:{api_port}"
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+         "--workers", str(args.api_workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )]
+    print(f"🚀 Booting API on {args.base_url} (fake Groq on :{groq_port}, db {args.database_url})")
+    wait_until_up(args.base_url, args.startup_timeout, processes[0])
+    if args.with_worker:
+        processes.append(subprocess.Popen([sys.executable, "worker.py"], cwd=BACKEND_DIR, env=env))
+    return fake, processes
+
+
+def run_load(args, mix):
+    recorder = Recorder()
+    run_id = f"{int(time.time())}{random.randrange(1000)}"
+    users = [VirtualUser(i, args, recorder, run_id) for i in range(args.users)]
+    print(f"👥 Setting up {len(users)} users...")
+    for user in users:
+        user.setup()
+    recorder.samples.clear()  # setup logins are not part of the measurement
+    recorder.errors.clear()
+    recorder.shed.clear()
+
+    names, weights = list(mix), list(mix.values())
+    stop_at = time.time() + args.duration
+
+    def loop(user):
+        while time.time() < stop_at:
+            user.run(user.rng.choices(names, weights=weights)[0])
+            if args.think_ms:
+                time.sleep(user.rng.expovariate(1000 / args.think_ms))
+
+    print(f"🔥 Running {args.duration}s with mix {mix}")
+    start = time.time()
+    threads = [threading.Thread(target=loop, args=(u,), daemon=True) for u in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder.report(time.time() - start)
+
+
+def print_report(results):
+    print(f"\n{'endpoint':<42} {'count':>7} {'err':>5} {'shed':>5} {'rps':>8} {'goodput':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<42} {r['count']:>7} {r['errors']:>5} {r['shed']:>5} {r['rps']:>8.2f} "
+              f"{r['goodput']:>8.2f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f}")
+
+
+def compare(results, baseline, max_regression):
+    """Returns a list of human-readable regressions against the baseline run."""
+    problems = []
+    for endpoint, base in baseline.get("endpoints", {}).items():
+        current = results.get(endpoint)
+        if current is None:
+            problems.append(f"{endpoint}: no requests in this run")
+            continue
+        for key in ("p95", "p99"):
+            limit = base[key] * (1 + max_regression)
+            if current[key] > limit and current[key] - base[key] > MIN_REGRESSION_MS:
+                problems.append(f"{endpoint}: {key} {current[key]:.1f}ms > {base[key]:.1f}ms (+{max_regression:.0%} allowed)")
+        if current["rps"] < base["rps"] * (1 - max_regression):
+            problems.append(f"{endpoint}: throughput {current['rps']:.2f} rps < {base['rps']:.2f} rps")
+        base_rate = base["errors"] / max(1, base["count"])
+        rate = current["errors"] / max(1, current["count"])
+        if rate > base_rate + 0.01:
+            problems.append(f"{endpoint}: error rate {rate:.1%} > {base_rate:.1%}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lumina API load test against a local Groq stand-in")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--mix", help="scenario weights, e.g. chat=4,goals=2 (default: " + ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()) + ")")
+    parser.add_argument("--base-url", help="target a running API instead of booting one")
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--with-worker", action="store_true", help="also run worker.py (rewards, decomposition, quizzes)")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench_load.sqlite"))
+    parser.add_argument("--profile", help="fake Groq latency/error profile (see bench/fake_groq.py)")
+    parser.add_argument("--speed", type=float, default=1.0, help="divide fake Groq latencies by this")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=300, help="the emotion model loads at import")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline instead of comparing")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    fake, processes = (None, [])
+    if args.base_url:
+        wait_until_up(args.base_url, args.startup_timeout)
+    else:
+        fake, processes = boot(args)
+    try:
+        results = run_load(args, mix)
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait(timeout=30)
+        if fake:
+            fake.shutdown()
+
+    print_report(results)
+    run = {
+        "config": {"users": args.users, "duration": args.duration, "mix": mix, "database": args.database_url.split(":")[0]},
+        "endpoints": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\n💾 Saved baseline to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.max_regression)
+        if problems:
+            print("\n❌ Regressions against the baseline:")
+            for problem in problems:
+                print(f"   {problem}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
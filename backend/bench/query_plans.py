@@ -0,0 +1,163 @@
+"""
+Query-plan regression check for the hot per-user queries.
+
+Seeds a scratch Postgres schema with production-like volumes, runs
+EXPLAIN (ANALYZE) on each query exactly as the app builds it and fails when a
+query stops using its index or exceeds its latency budget:
+
+    python bench/query_plans.py [--database-url URL] [--users 2000] [--keep]
+
+Exits 1 on any regression so it can gate CI. Needs Postgres (the planner
+output is Postgres specific); the scratch schema is dropped afterwards unless
+--keep is given.
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, desc, text
+from sqlalchemy.orm import Session
+import models
+import migrations
+from config import DATABASE_URL
+
+SCHEMA = "plan_check"
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def hot_queries(db, user_id):
+    """(name, query, expected index, budget ms) - keep in sync with the app code."""
+    now = datetime.now(timezone.utc)
+    return [
+        (
+            "read_goals",
+            db.query(models.Goal).filter(models.Goal.user_id == user_id),
+            "ix_goals_user_id_status", 5.0,
+        ),
+        (
+            "get_goal_reminders",
+            db.query(models.Goal).filter(models.Goal.user_id == user_id, models.Goal.status != "completed"),
+            "ix_goals_user_id_status", 5.0,
+        ),
+        (
+            "get_recent_emotions_summary",
+            db.query(models.EmotionLog)
+            .filter(models.EmotionLog.user_id == user_id)
+            .filter(models.EmotionLog.timestamp >= now - timedelta(minutes=15))
+            .order_by(desc(models.EmotionLog.timestamp)),
+            "ix_emotion_logs_user_id_timestamp", 5.0,
+        ),
+        (
+            "load_user_facts",
+            db.query(models.UserFact).filter(models.UserFact.user_id == user_id).order_by(models.UserFact.id),
+            "ix_user_facts_user_id", 5.0,
+        ),
+    ]
+
+
+def seed(conn, users, goals_per_user, emotions_per_user, facts_per_user):
+    conn.execute(text(
+        "INSERT INTO users (id, email, full_name, hashed_password, is_active, coins) "
+        "SELECT u, 'user' || u || '@example.com', 'User ' || u, 'x', true, 0 FROM generate_series(1, :n) u"
+    ), {"n": users})
+    # Most goals of a long-time user are completed; reminders only read the rest
+    conn.execute(text(
+        "INSERT INTO goals (user_id, title, duration, duration_unit, priority, status, created_at) "
+        "SELECT u, 'Goal ' || g, 30, 'days', 'Medium', "
+        "CASE WHEN g % 5 = 0 THEN 'in_progress' ELSE 'completed' END, "
+        "now() - (g || ' days')::interval "
+        "FROM generate_series(1, :n) u, generate_series(1, :per) g"
+    ), {"n": users, "per": goals_per_user})
+    # One log per chat message, spread over the last 90 days
+    conn.execute(text(
+        "INSERT INTO emotion_logs (user_id, emotion, score, timestamp) "
+        "SELECT u, 'neutral', 0.9, now() - (e * 90 * 24 * 60 / :per || ' minutes')::interval "
+        "FROM generate_series(1, :n) u, generate_series(1, :per) e"
+    ), {"n": users, "per": emotions_per_user})
+    conn.execute(text(
+        "INSERT INTO user_facts (user_id, fact_text, created_at) "
+        "SELECT u, 'fact ' || f, now() FROM generate_series(1, :n) u, generate_series(1, :per) f"
+    ), {"n": users, "per": facts_per_user})
+    for table in ("users", "goals", "emotion_logs", "user_facts"):
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, query):
+    compiled = query.statement.compile(dialect=conn.dialect)
+    row = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    result = row if isinstance(row, list) else json.loads(row)
+    return result[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--goals", type=int, default=25)
+    parser.add_argument("--emotions", type=int, default=300)
+    parser.add_argument("--facts", type=int, default=40)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema for inspection")
+    args = parser.parse_args()
+
+    if not args.database_url.startswith("postgresql"):
+        sys.exit("❌ query plan checks need a Postgres DATABASE_URL")
+
+    admin = create_engine(args.database_url)
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    failures = []
+    try:
+        migrations.run_migrations(engine)
+        with engine.begin() as conn:
+            seed(conn, args.users, args.goals, args.emotions, args.facts)
+        print(f"Seeded {args.users} users ({args.goals} goals, {args.emotions} emotion logs, {args.facts} facts each)\n")
+        print(f"{'query':<30} {'index':<36} {'ms':>8} {'budget':>8}  status")
+
+        sample_user = args.users // 2
+        with engine.connect() as conn:
+            for name, query, index, budget_ms in hot_queries(Session(bind=engine), sample_user):
+                result = explain(conn, query)
+                nodes = list(plan_nodes(result["Plan"]))
+                used = {n.get("Index Name") for n in nodes if n["Node Type"] in INDEX_NODES}
+                seq_scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+                elapsed = result["Execution Time"]
+
+                problems = []
+                if index not in used:
+                    problems.append(f"expected {index}, used {sorted(filter(None, used)) or 'no index'}")
+                if seq_scans:
+                    problems.append(f"seq scan on {', '.join(seq_scans)}")
+                if elapsed > budget_ms:
+                    problems.append(f"{elapsed:.2f} ms over the {budget_ms} ms budget")
+
+                print(f"{name:<30} {index:<36} {elapsed:>8.2f} {budget_ms:>8.1f}  {'FAIL' if problems else 'ok'}")
+                if problems:
+                    failures.append((name, problems, result["Plan"]))
+    finally:
+        engine.dispose()
+        if not args.keep:
+            with admin.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin.dispose()
+
+    for name, problems, plan in failures:
+        print(f"\n❌ {name}: {'; '.join(problems)}")
+        print(json.dumps(plan, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
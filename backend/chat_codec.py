@@ -0,0 +1,108 @@
+import json
+import zlib
+from config import CHAT_CODEC, CHAT_COMPRESSION, CHAT_COMPRESS_MIN_BYTES
+
+# Optional accelerators
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Serialization of chat messages stored in chat:{chat_id}:messages.
+# Entries are either legacy JSON text ({"role", "parts"}) or a one byte header
+# followed by a payload:
+#   low 6 bits  = codec id      (1 = compact JSON, 2 = msgpack)
+#   high 2 bits = compression   (0x40 = zlib, 0x80 = zstd)
+# The compact payload is [role_code, *parts]. Legacy entries always start with "{",
+# which never collides with a header byte, so both formats coexist in one list.
+
+CODEC_JSON = 0x01
+CODEC_MSGPACK = 0x02
+COMPRESS_ZLIB = 0x40
+COMPRESS_ZSTD = 0x80
+
+ROLE_CODES = {"user": 0, "model": 1}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+if zstandard:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+def _dump_json(value) -> bytes:
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _load_json(data: bytes):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+CODECS = {
+    CODEC_JSON: (_dump_json, _load_json),
+}
+if msgpack:
+    CODECS[CODEC_MSGPACK] = (
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+    )
+
+def _writer_codec():
+    if CHAT_CODEC == "legacy":
+        return None
+    if CHAT_CODEC == "msgpack" and msgpack:
+        return CODEC_MSGPACK
+    return CODEC_JSON
+
+def _writer_compression():
+    if CHAT_COMPRESSION == "zstd":
+        return COMPRESS_ZSTD if zstandard else COMPRESS_ZLIB
+    if CHAT_COMPRESSION == "zlib":
+        return COMPRESS_ZLIB
+    return 0
+
+WRITE_CODEC = _writer_codec()
+WRITE_COMPRESSION = _writer_compression()
+
+def encode_message(role: str, parts) -> bytes:
+    """Serializes one chat message with the configured codec."""
+    return encode_message_with(role, parts, WRITE_CODEC, WRITE_COMPRESSION)
+
+def encode_message_with(role: str, parts, codec, compression=0, compress_min_bytes=CHAT_COMPRESS_MIN_BYTES) -> bytes:
+    """Serializes with an explicit codec id (None = legacy JSON) and compression flag."""
+    parts = parts if isinstance(parts, list) else [parts]
+    if codec is None:
+        return json.dumps({"role": role, "parts": parts}).encode("utf-8")
+
+    dump, _ = CODECS[codec]
+    payload = dump([ROLE_CODES.get(role, role), *parts])
+    header = codec
+    if compression and len(payload) >= compress_min_bytes:
+        if compression == COMPRESS_ZSTD:
+            payload = _zstd_compressor.compress(payload)
+        else:
+            payload = zlib.compress(payload)
+        header |= compression
+    return bytes([header]) + payload
+
+def decode_message(raw) -> dict:
+    """Inverse of encode_message; also accepts legacy JSON entries."""
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if raw[:1] == b"{":
+        return json.loads(raw)
+
+    header, payload = raw[0], raw[1:]
+    if header & COMPRESS_ZSTD:
+        payload = _zstd_decompressor.decompress(payload)
+    elif header & COMPRESS_ZLIB:
+        payload = zlib.decompress(payload)
+    _, load = CODECS[header & 0x3F]
+    role, *parts = load(payload)
+    return {"role": ROLE_NAMES.get(role, role), "parts": parts}
@@ -0,0 +1,186 @@
+"""
+Circuit breakers per LLM model, shared by every API and worker process through Redis.
+
+Each model keeps a rolling window (LLM_BREAKER_WINDOW_SECONDS, in buckets) of
+calls, errors, slow calls (slower than LLM_BREAKER_SLOW_FRACTION of the model's
+timeout) and latency. Once the window has LLM_BREAKER_MIN_CALLS calls and the
+error or slow-call rate reaches its threshold, the breaker opens and
+llm_providers skips the model, going straight to the next one of the fallback
+chain. After LLM_BREAKER_OPEN_SECONDS one caller is let through as a probe
+(half-open): success closes the breaker, failure opens it again.
+
+Without Redis every breaker stays closed. State: GET /admin/llm/breakers.
+"""
+import time
+import metrics
+from redis_client import get_redis_client
+from config import (
+    MODEL_CONFIG, MODEL_TIMEOUTS, LLM_DEFAULT_TIMEOUT_SECONDS, LLM_BREAKER_ENABLED, LLM_BREAKER_WINDOW_SECONDS,
+    LLM_BREAKER_BUCKET_SECONDS, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_SLOW_RATE,
+    LLM_BREAKER_SLOW_FRACTION, LLM_BREAKER_OPEN_SECONDS
+)
+
+REJECT, ALLOW, PROBE = 0, 1, 2
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# KEYS[1] = breaker:{model}         (hash: state, opened_at, trips)
+# KEYS[2] = breaker:{model}:probe   (held by the caller probing a half-open breaker)
+# ARGV    = now, open_seconds, probe_ttl
+# Returns REJECT / ALLOW / PROBE, and the state if this call changed it.
+ALLOW_LUA = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return {1, false}
+end
+local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+if state == 'open' and tonumber(ARGV[1]) < opened_at + tonumber(ARGV[2]) then
+    return {0, false}
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[3]) then
+    if state ~= 'half_open' then
+        redis.call('HSET', KEYS[1], 'state', 'half_open')
+        return {2, 'half_open'}
+    end
+    return {2, false}
+end
+return {0, false}
+"""
+
+# KEYS[1] = breaker:{model}   KEYS[2] = breaker:{model}:probe   KEYS[3] = breaker:{model}:window
+# ARGV    = now, ok, slow, latency_ms, probe, bucket_seconds, window_buckets,
+#           min_calls, error_rate, slow_rate
+# The window hash holds '<bucket>:<counter>' fields; older buckets are pruned here.
+# Returns the new state if this call changed it.
+RECORD_LUA = """
+local now = tonumber(ARGV[1])
+local ok, slow, probe = ARGV[2] == '1', ARGV[3] == '1', ARGV[5] == '1'
+local bucket = math.floor(now / tonumber(ARGV[6]))
+local oldest = bucket - tonumber(ARGV[7]) + 1
+
+if probe then
+    redis.call('DEL', KEYS[2])
+    if ok and not slow then
+        redis.call('HSET', KEYS[1], 'state', 'closed')
+        redis.call('DEL', KEYS[3])
+        return 'closed'
+    end
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    return 'open'
+end
+
+redis.call('HINCRBY', KEYS[3], bucket .. ':calls', 1)
+if not ok then redis.call('HINCRBY', KEYS[3], bucket .. ':errors', 1) end
+if slow then redis.call('HINCRBY', KEYS[3], bucket .. ':slow', 1) end
+redis.call('HINCRBY', KEYS[3], bucket .. ':latency_ms', ARGV[4])
+redis.call('EXPIRE', KEYS[3], tonumber(ARGV[6]) * tonumber(ARGV[7]) * 2)
+
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state ~= 'closed' then
+    return false
+end
+
+local calls, errors, slows = 0, 0, 0
+local fields = redis.call('HGETALL', KEYS[3])
+for i = 1, #fields, 2 do
+    local b, counter = string.match(fields[i], '^(%-?%d+):(%a+)')
+    if tonumber(b) < oldest then
+        redis.call('HDEL', KEYS[3], fields[i])
+    elseif counter == 'calls' then calls = calls + tonumber(fields[i + 1])
+    elseif counter == 'errors' then errors = errors + tonumber(fields[i + 1])
+    elseif counter == 'slow' then slows = slows + tonumber(fields[i + 1])
+    end
+end
+if calls >= tonumber(ARGV[8]) and (errors / calls >= tonumber(ARGV[9]) or slows / calls >= tonumber(ARGV[10])) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    redis.call('HINCRBY', KEYS[1], 'trips', 1)
+    return 'open'
+end
+return false
+"""
+
+_redis = get_redis_client()
+allow_script = _redis.register_script(ALLOW_LUA) if _redis else None
+record_script = _redis.register_script(RECORD_LUA) if _redis else None
+
+
+def _keys(model):
+    return f"breaker:{model}", f"breaker:{model}:probe", f"breaker:{model}:window"
+
+
+def _timeout(model):
+    return MODEL_TIMEOUTS.get(model, LLM_DEFAULT_TIMEOUT_SECONDS)
+
+
+def _transition(model, state):
+    metrics.LLM_BREAKER_TRANSITIONS.labels(model=model, state=state).inc()
+    print(f"⚡ Circuit for {model} is now {state}")
+
+
+def allow(model):
+    """REJECT while the model's breaker is open, PROBE for the one caller testing recovery, else ALLOW."""
+    if not LLM_BREAKER_ENABLED or not allow_script:
+        return ALLOW
+    state_key, probe_key, _ = _keys(model)
+    try:
+        decision, changed = allow_script(
+            keys=[state_key, probe_key], args=[time.time(), LLM_BREAKER_OPEN_SECONDS, int(_timeout(model)) + 5]
+        )
+    except Exception as e:
+        print(f"⚠️ Circuit breaker check failed for {model}: {e}")
+        return ALLOW
+    if changed:
+        _transition(model, changed)
+    return int(decision)
+
+
+def record(model, ok, seconds, probe=False):
+    """Adds one finished attempt to the model's window (and settles a probe)."""
+    if not LLM_BREAKER_ENABLED or not record_script:
+        return
+    slow = seconds > _timeout(model) * LLM_BREAKER_SLOW_FRACTION
+    try:
+        changed = record_script(keys=list(_keys(model)), args=[
+            time.time(), int(ok), int(slow), int(seconds * 1000), int(probe),
+            LLM_BREAKER_BUCKET_SECONDS, max(1, LLM_BREAKER_WINDOW_SECONDS // LLM_BREAKER_BUCKET_SECONDS),
+            LLM_BREAKER_MIN_CALLS, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_SLOW_RATE,
+        ])
+    except Exception as e:
+        print(f"⚠️ Circuit breaker update failed for {model}: {e}")
+        return
+    if changed:
+        _transition(model, changed)
+
+
+def get_breaker_stats():
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    now = time.time()
+    oldest = int(now // LLM_BREAKER_BUCKET_SECONDS) - max(1, LLM_BREAKER_WINDOW_SECONDS // LLM_BREAKER_BUCKET_SECONDS) + 1
+    stats = {}
+    for mode, model in MODEL_CONFIG.items():
+        state_key, _, window_key = _keys(model)
+        state = redis_client.hgetall(state_key)
+        totals = {"calls": 0, "errors": 0, "slow": 0, "latency_ms": 0}
+        for field, value in redis_client.hgetall(window_key).items():
+            bucket, _, counter = field.partition(":")
+            if int(bucket) >= oldest and counter in totals:
+                totals[counter] += int(value)
+        calls = totals["calls"]
+        current = state.get("state", CLOSED)
+        opened_at = float(state.get("opened_at", 0) or 0)
+        stats[model] = {
+            "mode": mode,
+            "state": current,
+            "opened_at": opened_at or None,
+            "probe_in": round(max(0.0, opened_at + LLM_BREAKER_OPEN_SECONDS - now), 1) if current == OPEN else None,
+            "trips": int(state.get("trips", 0)),
+            "window_seconds": LLM_BREAKER_WINDOW_SECONDS,
+            "calls": calls,
+            "error_rate": round(totals["errors"] / calls, 4) if calls else None,
+            "slow_rate": round(totals["slow"] / calls, 4) if calls else None,
+            "avg_latency_ms": round(totals["latency_ms"] / calls, 1) if calls else None,
+        }
+    return stats
@@ -1,10 +1,13 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Point the Groq client elsewhere, e.g. the local stand-in used by bench/load_test.py
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
 
 # Model Configuration
 MODEL_CONFIG = {
@@ -14,19 +17,172 @@ MODEL_CONFIG = {
     "teaching": "meta-llama/llama-4-maverick-17b-128e-instruct"
 }
 
+# LLM provider: "groq", or "local" for any OpenAI-compatible server (Ollama, vLLM, llama.cpp, bench/fake_groq.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:11434/v1")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "")  # serve every mode with this model; empty keeps the MODEL_CONFIG names
+
+# LLM call policy (see llm_providers.py): per-attempt timeout per model, retries with jittered
+# exponential backoff on timeouts / 429 / 5xx, and a wall-clock budget for the whole call
+MODEL_TIMEOUTS = {
+    MODEL_CONFIG["primary"]: 10,
+    MODEL_CONFIG["academic"]: 40,
+    MODEL_CONFIG["reasoning"]: 30,
+    MODEL_CONFIG["teaching"]: 30,
+    **json.loads(os.getenv("LLM_MODEL_TIMEOUTS", "{}")),
+}
+LLM_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("LLM_DEFAULT_TIMEOUT_SECONDS", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 0.5))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 8))
+LLM_CALL_BUDGET_SECONDS = float(os.getenv("LLM_CALL_BUDGET_SECONDS", 120))
+LLM_CHAT_BUDGET_SECONDS = float(os.getenv("LLM_CHAT_BUDGET_SECONDS", 60))  # interactive /chat replies
+LLM_ROUTER_BUDGET_SECONDS = float(os.getenv("LLM_ROUTER_BUDGET_SECONDS", 8))  # mode classification (falls back to primary)
+# Modes whose models are tried, in order, once a mode's own model has failed
+LLM_FALLBACK_CHAINS = {
+    "primary": ["reasoning"],
+    "academic": ["reasoning", "primary"],
+    "reasoning": ["primary"],
+    "teaching": ["reasoning", "primary"],
+    **json.loads(os.getenv("LLM_FALLBACK_CHAINS", "{}")),
+}
+
+# Hedged requests: in these modes, once the chosen model is slower than its recent LLM_HEDGE_PERCENTILE
+# latency, the same request also goes to the first fallback model and the first answer wins
+LLM_HEDGE_MODES = {m.strip() for m in os.getenv("LLM_HEDGE_MODES", "").split(",") if m.strip()}
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 50))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", 4))  # until there are enough samples
+LLM_HEDGE_MAX_CONCURRENT = int(os.getenv("LLM_HEDGE_MAX_CONCURRENT", 16))  # hedge-eligible calls per process
+
+# Circuit breakers per model (see circuit_breaker.py): open when, over the rolling window, at least
+# LLM_BREAKER_ERROR_RATE of the calls failed or LLM_BREAKER_SLOW_RATE took longer than
+# LLM_BREAKER_SLOW_FRACTION of the model's timeout; probe again after LLM_BREAKER_OPEN_SECONDS
+LLM_BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+LLM_BREAKER_WINDOW_SECONDS = int(os.getenv("LLM_BREAKER_WINDOW_SECONDS", 60))
+LLM_BREAKER_BUCKET_SECONDS = int(os.getenv("LLM_BREAKER_BUCKET_SECONDS", 10))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 20))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", 0.5))
+LLM_BREAKER_SLOW_RATE = float(os.getenv("LLM_BREAKER_SLOW_RATE", 0.8))
+LLM_BREAKER_SLOW_FRACTION = float(os.getenv("LLM_BREAKER_SLOW_FRACTION", 0.5))
+LLM_BREAKER_OPEN_SECONDS = int(os.getenv("LLM_BREAKER_OPEN_SECONDS", 30))
+
+# Admission control (see llm_admission.py): a token bucket per user for /chat, and at most
+# LLM_MODEL_CONCURRENCY upstream calls in flight per model across all processes. Background work
+# (jobs) may only take LLM_BACKGROUND_SLOT_SHARE of a model's slots and yields to waiting /chat calls.
+# Callers queue for a slot up to their wait limit; a full queue or a timed-out wait is shed (429).
+LLM_ADMISSION_ENABLED = os.getenv("LLM_ADMISSION_ENABLED", "true").lower() == "true"
+LLM_USER_CHATS_PER_MINUTE = float(os.getenv("LLM_USER_CHATS_PER_MINUTE", 20))
+LLM_USER_CHAT_BURST = int(os.getenv("LLM_USER_CHAT_BURST", 10))
+LLM_MODEL_CONCURRENCY = {
+    MODEL_CONFIG["primary"]: 48,
+    MODEL_CONFIG["academic"]: 16,
+    MODEL_CONFIG["reasoning"]: 24,
+    MODEL_CONFIG["teaching"]: 16,
+    **json.loads(os.getenv("LLM_MODEL_CONCURRENCY", "{}")),
+}
+LLM_DEFAULT_MODEL_CONCURRENCY = int(os.getenv("LLM_DEFAULT_MODEL_CONCURRENCY", 16))
+LLM_BACKGROUND_SLOT_SHARE = float(os.getenv("LLM_BACKGROUND_SLOT_SHARE", 0.5))
+LLM_QUEUE_MAX_WAITING = int(os.getenv("LLM_QUEUE_MAX_WAITING", 64))  # per model and priority
+LLM_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_QUEUE_WAIT_SECONDS", 5))  # interactive callers
+LLM_BACKGROUND_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_BACKGROUND_QUEUE_WAIT_SECONDS", 30))
+LLM_SHED_RETRY_AFTER_SECONDS = int(os.getenv("LLM_SHED_RETRY_AFTER_SECONDS", 2))
+
+# Token usage and cost accounting (see llm_usage.py). Prices are USD per million [input, output] tokens
+# (Groq list prices; override with LLM_MODEL_PRICES when they change). Users past their daily token
+# budget are served by the primary model only; 0 disables the budget.
+LLM_MODEL_PRICES = {
+    MODEL_CONFIG["primary"]: [0.05, 0.08],
+    MODEL_CONFIG["academic"]: [0.15, 0.75],
+    MODEL_CONFIG["reasoning"]: [0.59, 0.79],
+    MODEL_CONFIG["teaching"]: [0.20, 0.60],
+    **json.loads(os.getenv("LLM_MODEL_PRICES", "{}")),
+}
+LLM_USER_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_USER_DAILY_TOKEN_BUDGET", 250000))
+LLM_USAGE_HOURLY_RETENTION_HOURS = int(os.getenv("LLM_USAGE_HOURLY_RETENTION_HOURS", 72))
+LLM_USAGE_DAILY_RETENTION_DAYS = int(os.getenv("LLM_USAGE_DAILY_RETENTION_DAYS", 35))
+
+# Single-flight (see single_flight.py): identical decompose/quiz/reward generations in flight at the
+# same time share one upstream call. The result stays around briefly for followers and quick retries.
+SINGLE_FLIGHT_LOCK_SECONDS = int(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", 300))
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL_SECONDS", 15))
+
+# Response cache (see response_cache.py), opt-in: first-turn, non-personal questions routed to
+# RESPONSE_CACHE_MODES get a generic (profile-free) answer that is reused for rephrasings of them
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MODES = [m.strip() for m in os.getenv("RESPONSE_CACHE_MODES", "teaching,academic").split(",") if m.strip()]
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))  # per mode, least recently used go first
+
+# LLM record/replay for reproducible benchmarks (see llm_cassette.py): "", "record" or "replay"
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl")
+LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", 1.0))  # 0 replays instantly
+LLM_CASSETTE_MATCH = os.getenv("LLM_CASSETTE_MATCH", "exact")  # "exact" request or "sequence" per function/model
+
+# Goal decomposition: daily plans at least this long are generated week by week in parallel
+DECOMPOSE_CHUNK_MIN_DAYS = int(os.getenv("DECOMPOSE_CHUNK_MIN_DAYS", 15))
+DECOMPOSE_MAX_PARALLEL_CHUNKS = int(os.getenv("DECOMPOSE_MAX_PARALLEL_CHUNKS", 6))
+
 # Redis
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
+# Chat message storage: "json" (compact, orjson when installed), "msgpack" or "legacy" (verbose JSON)
+CHAT_CODEC = os.getenv("CHAT_CODEC", "json")
+# Compression for large messages: "zstd", "zlib" or "none"
+CHAT_COMPRESSION = os.getenv("CHAT_COMPRESSION", "zstd")
+CHAT_COMPRESS_MIN_BYTES = int(os.getenv("CHAT_COMPRESS_MIN_BYTES", 1024))
+
+# Chat archiving: idle chats move from Redis to Postgres, rehydrated copies expire
+CHAT_ARCHIVE_IDLE_SECONDS = int(os.getenv("CHAT_ARCHIVE_IDLE_SECONDS", 30 * 24 * 3600))
+CHAT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("CHAT_ARCHIVE_INTERVAL_SECONDS", 3600))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", 200))
+CHAT_HOT_TTL_SECONDS = int(os.getenv("CHAT_HOT_TTL_SECONDS", 3 * 24 * 3600))
+
+# Chat search index (see search_index.py): only a user's most recently active chats are indexed,
+# and the index of a user idle for SEARCH_INDEX_IDLE_DAYS is dropped and rebuilt on their next search
+SEARCH_INDEX_MAX_CHATS = int(os.getenv("SEARCH_INDEX_MAX_CHATS", 300))
+SEARCH_INDEX_IDLE_DAYS = int(os.getenv("SEARCH_INDEX_IDLE_DAYS", 60))
+SEARCH_INDEX_JANITOR_INTERVAL_SECONDS = int(os.getenv("SEARCH_INDEX_JANITOR_INTERVAL_SECONDS", 3600))
+
+# Durable user facts: write-behind flush from Redis to Postgres
+FACTS_FLUSH_INTERVAL_SECONDS = int(os.getenv("FACTS_FLUSH_INTERVAL_SECONDS", 5))
+FACTS_RECONCILE_INTERVAL_SECONDS = int(os.getenv("FACTS_RECONCILE_INTERVAL_SECONDS", 24 * 3600))
+
 # Postgres
 POSTGRES_USER = os.getenv("POSTGRES_USER", "denistanb05")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "Denis%40123")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "digcom")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
-DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
 # Auth
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+# Admin (comma separated list of emails allowed to hit /admin/* routes)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Reward Catalog Cache (shared across users with the same favorites)
+REWARD_CATALOG_TTL_SECONDS = int(os.getenv("REWARD_CATALOG_TTL_SECONDS", 7 * 24 * 3600))
+REWARD_CATALOG_EMPTY_TTL_SECONDS = int(os.getenv("REWARD_CATALOG_EMPTY_TTL_SECONDS", 60))
+REWARD_CATALOG_LOCK_SECONDS = int(os.getenv("REWARD_CATALOG_LOCK_SECONDS", 300))
+
+# Tracing (see tracing.py): share of requests traced, and always keep traces slower than TRACE_SLOW_MS (0 = off)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", 0))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")  # "file" (OTLP/JSON lines) or "otlp" (HTTP collector)
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "lumina-backend")
+
+# Background Jobs
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 2))
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", 300))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 24 * 3600))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
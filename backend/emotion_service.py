@@ -2,6 +2,7 @@ from transformers import pipeline
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 import models
+import metrics
 from datetime import datetime, timedelta
 
 try:
@@ -23,7 +24,8 @@ def analyze_emotion(text: str):
         return None, 0.0
     
     try:
-        results = classifier(text)
+        with metrics.timed(metrics.EMOTION_SECONDS):
+            results = classifier(text)
         scores = results[0]
         top_emotion = max(scores, key=lambda x: x["score"])
         print(top_emotion)
@@ -47,9 +49,10 @@ def log_emotion(db: Session, user_id: int, emotion: str, score: float):
     db.add(new_log)
     db.commit()
 
-def get_recent_emotions_summary(db: Session, user_id: int, minutes: int = 15) -> str:
+def get_recent_emotions_summary(db: Session, user_id: int, minutes: int = 15, current=None) -> str:
     """
     Retrieves emotions from the last N minutes and returns a summary string.
+    current: (emotion, score) of the message being answered, not logged yet.
     """
     time_threshold = datetime.now() - timedelta(minutes=minutes)
     
@@ -58,6 +61,8 @@ def get_recent_emotions_summary(db: Session, user_id: int, minutes: int = 15) ->
         .filter(models.EmotionLog.timestamp >= time_threshold)\
         .order_by(desc(models.EmotionLog.timestamp))\
         .all()
+    if current and current[0]:
+        logs.insert(0, models.EmotionLog(user_id=user_id, emotion=current[0], score=current[1]))
         
     if not logs:
         return ""
@@ -0,0 +1,51 @@
+"""
+Conditional GET for polled endpoints.
+
+The ETag is derived from the Redis version counters of the resources a
+response depends on (see redis_client.get_versions) and their scope names,
+which carry the user or chat id, plus the request path and query string, so
+checking it costs one MGET and no database work. Two users with equal
+counters therefore never share an ETag, and responses vary on Authorization:
+
+    not_modified = etags.conditional(request, response, [goals_scope(user_id)])
+    if not_modified:
+        return not_modified
+"""
+import hashlib
+from fastapi import Request, Response
+from redis_client import get_versions
+
+CACHE_CONTROL = "private, no-cache"  # browsers keep the body but revalidate every time
+VARY = "Authorization"  # one browser, several accounts: never reuse another user's cached body
+
+
+def compute_etag(request: Request, scopes, versions, extra: str = ""):
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    state = "|".join(f"{scope}={version}" for scope, version in zip(scopes, versions))
+    digest = hashlib.sha1(f"{request.url.path}?{query}|{state}|{extra}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _matches(header: str, etag: str):
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def conditional(request: Request, response: Response, scopes, extra: str = ""):
+    """
+    Sets ETag/Cache-Control on `response` and returns a 304 Response when the
+    client already has this version (None otherwise). Without Redis there is
+    no version to compare, so every request gets a full response.
+    """
+    versions = get_versions(*scopes)
+    if versions is None:
+        return None
+
+    etag = compute_etag(request, scopes, versions, extra)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": VARY}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,147 @@
+"""
+Durable copy of the personalization memory in the `user_facts` table.
+
+Redis stays the hot copy (all request-path reads hit Redis only). Writes mark the
+user dirty; the worker flushes dirty users here (write-behind), Redis is rebuilt
+from this table when a user's keys are missing, and reconcile_all_facts repairs
+drift in bulk.
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+import models
+from database import SessionLocal
+from redis_client import get_redis_client, set_user_facts_structured, DIRTY_FACTS_KEY
+from single_flight import release_script
+
+FLUSH_BATCH_SIZE = 100
+RECONCILE_LOCK_KEY = "facts:reconcile:lock"
+RECONCILE_LOCK_SECONDS = 6 * 3600
+
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc) if ts else None
+
+
+def _to_timestamp(dt):
+    if not dt:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def save_user_facts(db, user_id: int, facts: list):
+    """Replaces the stored facts of one user with the given structured list."""
+    db.query(models.UserFact).filter(models.UserFact.user_id == user_id).delete()
+    db.add_all([
+        models.UserFact(
+            user_id=user_id,
+            fact_text=f["text"],
+            created_at=_to_datetime(f.get("created_at")) or datetime.now(timezone.utc),
+            expires_at=_to_datetime(f.get("expiry")),
+        )
+        for f in facts
+    ])
+
+
+def load_user_facts(db, user_id: int):
+    """Reads the non-expired facts of a user in the Redis structured format."""
+    now = datetime.now(timezone.utc)
+    rows = db.query(models.UserFact)\
+        .filter(models.UserFact.user_id == user_id)\
+        .order_by(models.UserFact.id)\
+        .all()
+    return [
+        {"text": r.fact_text, "created_at": _to_timestamp(r.created_at), "expiry": _to_timestamp(r.expires_at)}
+        for r in rows
+        if not (r.expires_at and _to_timestamp(r.expires_at) < now.timestamp())
+    ]
+
+
+def load_user_facts_into_redis(user_id: str):
+    """Rebuilds a user's Redis profile from Postgres (also caches an empty profile)."""
+    db = SessionLocal()
+    try:
+        facts = load_user_facts(db, int(user_id))
+    except Exception as e:
+        print(f"⚠️ Could not load facts for user {user_id} from Postgres: {e}")
+        return []
+    finally:
+        db.close()
+
+    set_user_facts_structured(user_id, facts, mark_dirty=False)
+    if facts:
+        print(f"♻️ Restored {len(facts)} memories for user {user_id} from Postgres")
+    return facts
+
+
+def flush_dirty_facts():
+    """Writes every user marked dirty since the last run to Postgres."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    flushed = 0
+    db = SessionLocal()
+    try:
+        while True:
+            user_ids = redis_client.spop(DIRTY_FACTS_KEY, FLUSH_BATCH_SIZE)
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                raw = redis_client.get(f"user:{user_id}:profile_structured")
+                if raw is None:
+                    continue
+                try:
+                    save_user_facts(db, int(user_id), json.loads(raw))
+                    db.commit()
+                    flushed += 1
+                except Exception as e:
+                    db.rollback()
+                    redis_client.sadd(DIRTY_FACTS_KEY, user_id)  # retry next round
+                    print(f"⚠️ Failed to persist facts for user {user_id}: {e}")
+            if len(user_ids) < FLUSH_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+    return flushed
+
+
+def reconcile_all_facts():
+    """
+    Bulk repair: users present in Redis overwrite Postgres, users missing from
+    Redis are restored from Postgres.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {"persisted": 0, "restored": 0}
+
+    # Only one reconciliation at a time across all workers
+    token = uuid.uuid4().hex
+    if not redis_client.set(RECONCILE_LOCK_KEY, token, nx=True, ex=RECONCILE_LOCK_SECONDS):
+        print("🔁 Fact reconciliation already running elsewhere, skipping")
+        return {"persisted": 0, "restored": 0, "skipped": True}
+
+    started = time.time()
+    persisted = restored = 0
+    db = SessionLocal()
+    try:
+        for (user_id,) in db.query(models.User.id).yield_per(500):
+            raw = redis_client.get(f"user:{user_id}:profile_structured")
+            if raw is not None:
+                save_user_facts(db, user_id, json.loads(raw))
+                db.commit()
+                persisted += 1
+            elif redis_client.get(f"user:{user_id}:profile") is None:
+                facts = load_user_facts(db, user_id)
+                if facts:
+                    set_user_facts_structured(str(user_id), facts, mark_dirty=False)
+                    restored += 1
+    finally:
+        db.close()
+        release_script(keys=[RECONCILE_LOCK_KEY], args=[token])
+
+    print(f"🔁 Reconciled facts in {time.time() - started:.1f}s: {persisted} persisted, {restored} restored")
+    return {"persisted": persisted, "restored": restored}
@@ -0,0 +1,87 @@
+"""
+Per-goal progress for the dashboard (GET /goals/summary).
+
+Counts come from the maintained goals.subtask_count / completed_count columns;
+overdue counts and streaks are aggregated in SQL over goal_subtasks, so no
+subtask text is loaded.
+"""
+import math
+from datetime import datetime, timezone
+from sqlalchemy import and_, case, func
+import models
+
+DAYS_PER_UNIT = {"week": 7, "month": 30}
+
+
+def total_days(goal):
+    unit = (goal.duration_unit or "days").lower()
+    per_unit = next((days for name, days in DAYS_PER_UNIT.items() if name in unit), 1)
+    return max(1, (goal.duration or 1) * per_unit)
+
+
+def current_day(goal, now=None):
+    """1-based day of the goal today, capped to its length."""
+    if not goal.created_at:
+        return 1
+    created_at = goal.created_at if goal.created_at.tzinfo else goal.created_at.replace(tzinfo=timezone.utc)
+    elapsed = ((now or datetime.now(timezone.utc)) - created_at).days + 1
+    return min(max(elapsed, 1), total_days(goal))
+
+
+def due_subtasks(goal, day):
+    """How many subtasks should be done by `day` (subtasks spread evenly over the goal)."""
+    count = goal.subtask_count or 0
+    return min(count, math.ceil(count * day / total_days(goal)))
+
+
+def goal_progress(db, user_id: int):
+    goals = db.query(
+        models.Goal.id, models.Goal.title, models.Goal.status, models.Goal.priority,
+        models.Goal.duration, models.Goal.duration_unit, models.Goal.created_at,
+        models.Goal.subtask_count, models.Goal.completed_count
+    ).filter(models.Goal.user_id == user_id).all()
+    if not goals:
+        return []
+
+    now = datetime.now(timezone.utc)
+    days = {g.id: current_day(g, now) for g in goals}
+    due = {g.id: due_subtasks(g, days[g.id]) for g in goals}
+
+    # Everything before today's subtask is "past": unfinished past subtasks are
+    # overdue and the streak runs from the last unfinished one. Today's subtask
+    # only extends the streak once it is done.
+    subtask = models.GoalSubtask
+    today_position = case(due, value=subtask.goal_id, else_=0) - 1
+    missed = and_(subtask.position < today_position, subtask.completed.is_not(True))
+    rows = db.query(
+        subtask.goal_id,
+        func.sum(case((missed, 1), else_=0)).label("overdue"),
+        func.max(case((missed, subtask.position), else_=None)).label("last_missed"),
+        func.max(case((and_(subtask.position == today_position, subtask.completed.is_(True)), 1), else_=0)).label("today_done"),
+    ).filter(subtask.goal_id.in_(list(due))).group_by(subtask.goal_id).all()
+    aggregates = {r.goal_id: r for r in rows}
+
+    progress = []
+    for g in goals:
+        count = g.subtask_count or 0
+        completed = g.completed_count or 0
+        agg = aggregates.get(g.id)
+        overdue = streak = 0
+        if agg and g.status != "completed":
+            overdue = int(agg.overdue or 0)
+            last_missed = agg.last_missed if agg.last_missed is not None else -1
+            streak = max(0, due[g.id] - 2 - last_missed) + int(agg.today_done or 0)
+        progress.append({
+            "goal_id": g.id,
+            "title": g.title,
+            "status": g.status,
+            "priority": g.priority,
+            "subtask_count": count,
+            "completed_count": completed,
+            "completion_pct": round(100 * completed / count, 1) if count else (100.0 if g.status == "completed" else 0.0),
+            "current_day": days[g.id],
+            "total_days": total_days(g),
+            "overdue_count": overdue,
+            "streak": streak,
+        })
+    return progress
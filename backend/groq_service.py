@@ -1,11 +1,42 @@
 import os
 import json
 import re
-from groq import Groq
-from config import GROQ_API_KEY, MODEL_CONFIG
-
-# Initialize Groq Client
-client = Groq(api_key=GROQ_API_KEY)
+import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    MODEL_CONFIG, DECOMPOSE_CHUNK_MIN_DAYS, DECOMPOSE_MAX_PARALLEL_CHUNKS,
+    LLM_FALLBACK_CHAINS, LLM_CHAT_BUDGET_SECONDS, LLM_ROUTER_BUDGET_SECONDS, RESPONSE_CACHE_MODES
+)
+import tracing
+import metrics
+import llm_providers
+import llm_admission
+import single_flight
+import response_cache
+import llm_usage
+
+MODE_BY_MODEL = {model: mode for mode, model in MODEL_CONFIG.items()}
+
+def _create_completion(function, mode=None, fallback=True, budget=None, **kwargs):
+    """
+    Chat completion through llm_providers.complete (timeouts, retries, metrics, tracing):
+    kwargs["model"] first, then, with fallback, the models of its mode's LLM_FALLBACK_CHAINS.
+    Callers re-raise llm_admission.Overloaded rather than degrade, so shed load reaches
+    the client as a 429 (or the job worker as a retry). Users over their daily token
+    budget only get the primary model.
+    """
+    models = [kwargs.pop("model")]
+    if models[0] != MODEL_CONFIG["primary"] and llm_usage.over_daily_budget():
+        metrics.LLM_BUDGET_DOWNGRADES.labels(function=function).inc()
+        print(f"💸 {function}: user is over the daily token budget, using {MODEL_CONFIG['primary']}")
+        models, fallback = [MODEL_CONFIG["primary"]], False
+    if fallback:
+        for fallback_mode in LLM_FALLBACK_CHAINS.get(mode or MODE_BY_MODEL.get(models[0], "primary"), []):
+            model = MODEL_CONFIG.get(fallback_mode)
+            if model and model not in models:
+                models.append(model)
+    return llm_providers.complete(function, models, mode=mode, budget=budget, **kwargs)
 
 # System Instruction for the AI behavior
 PRIMARY_INSTRUCTION = """
@@ -266,6 +297,13 @@ SYSTEM_INSTRUCTIONS = {
     "teaching": TEACHING_INSTRUCTION
 }
 
+def response_cache_versions():
+    """Cached answers are only reused with the model and system prompt that produced them."""
+    return {
+        mode: hashlib.sha256(f"{MODEL_CONFIG.get(mode)}|{SYSTEM_INSTRUCTIONS.get(mode, PRIMARY_INSTRUCTION)}".encode()).hexdigest()[:12]
+        for mode in RESPONSE_CACHE_MODES
+    }
+
 def classify_request(user_message):
     """
     Uses the primary model to classify the user's intent into one of the 4 modes.
@@ -292,7 +330,7 @@ def classify_request(user_message):
             }
         ]
 
-        completion = client.chat.completions.create(
+        completion = _create_completion("classify_request", fallback=False, budget=LLM_ROUTER_BUDGET_SECONDS,
             model=MODEL_CONFIG["primary"], # Use lightweight model for routing
             messages=messages,
             temperature=0.3,
@@ -303,6 +341,8 @@ def classify_request(user_message):
         data = json.loads(result_text)
         return data.get("mode", "primary")
 
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"⚠️ Classification failed: {e}")
         return "primary"
@@ -311,6 +351,13 @@ def classify_request(user_message):
 
 def get_ai_response(history, user_message, user_profile="", user_name=None):
     try:
+        # Introductory first-turn questions may already have a generic answer (see response_cache.py)
+        cacheable = response_cache.eligible(history, user_message)
+        if cacheable:
+            cached = response_cache.lookup(user_message, response_cache_versions())
+            if cached:
+                return cached["response"], cached.get("title"), None, cached["mode"], cached.get("suggested_goal")
+
         # Dynamic Mode Selection (Router)
         # Enforce backend routing.
         
@@ -322,6 +369,12 @@ def get_ai_response(history, user_message, user_profile="", user_name=None):
         if detected_mode not in MODEL_CONFIG:
             detected_mode = "primary"
 
+        # Answers that will be cached must not depend on who asked, and users over their
+        # token budget are downgraded to the primary model, whose answer must not be cached
+        cacheable = cacheable and detected_mode in RESPONSE_CACHE_MODES and not llm_usage.over_daily_budget()
+        if cacheable:
+            user_profile, user_name = "", None
+
         # Determine Model
         model_name = MODEL_CONFIG.get(detected_mode, MODEL_CONFIG["primary"])
         
@@ -361,33 +414,16 @@ def get_ai_response(history, user_message, user_profile="", user_name=None):
 
         messages.append({"role": "user", "content": effective_message})
 
-        # Call Groq API
+        # Call Groq API (falls back along LLM_FALLBACK_CHAINS if this model fails)
         print(f"🤖 Calling Groq with model: {model_name} (Mode: {detected_mode})")
-        try:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.7,
-                stream=False,
-                response_format={"type": "json_object"}
-            )
-            text = completion.choices[0].message.content.strip()
-            
-        except Exception as e:
-            print(f"⚠️ Error with model {model_name}: {e}")
-            if model_name != MODEL_CONFIG["reasoning"]:
-                 fallback_model = MODEL_CONFIG["reasoning"] if detected_mode != "reasoning" else MODEL_CONFIG["primary"]
-                 print(f"🔄 Retrying with fallback: {fallback_model}")
-                 completion = client.chat.completions.create(
-                    model=fallback_model,
-                    messages=messages,
-                    temperature=0.7,
-                    stream=False,
-                    response_format={"type": "json_object"}
-                 )
-                 text = completion.choices[0].message.content.strip()
-            else:
-                 raise e
+        completion = _create_completion("get_ai_response", mode=detected_mode, budget=LLM_CHAT_BUDGET_SECONDS,
+            model=model_name,
+            messages=messages,
+            temperature=0.7,
+            stream=False,
+            response_format={"type": "json_object"}
+        )
+        text = completion.choices[0].message.content.strip()
 
         final_response = "I had trouble processing that. Please try again."
         extracted_title = None
@@ -411,9 +447,18 @@ def get_ai_response(history, user_message, user_profile="", user_name=None):
             print("JSON Parse Failed in get_ai_response. Raw text:", text[:100])
             final_response = text
             suggested_goal = None
+            cacheable = False
+
+        # Only the mode's own model may answer for everyone (not a fallback or a budget downgrade)
+        if cacheable and llm_providers.answered_by() == model_name:
+            response_cache.store(user_message, detected_mode, response_cache_versions()[detected_mode], {
+                "response": final_response, "title": extracted_title, "suggested_goal": suggested_goal
+            })
 
         return final_response, extracted_title, new_facts, detected_mode, suggested_goal
 
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"Error calling Groq: {e}")
         return "I'm having trouble connecting to my brain right now.", None, None, "primary", None
@@ -421,28 +466,42 @@ def get_ai_response(history, user_message, user_profile="", user_name=None):
 def generate_chat_title(user_message):
     return user_message[:30] + "..." if len(user_message) > 30 else user_message
 
-def decompose_goal(title, duration, duration_unit, breakdown_type="daily"):
+def _normalize_duration(duration, duration_unit, granularity):
+    """Converts the goal duration into a number of days or weeks."""
+    normalized_duration = duration
+    if granularity == "day":
+        if "week" in duration_unit.lower():
+            normalized_duration = duration * 7
+        elif "month" in duration_unit.lower():
+            normalized_duration = duration * 30
+    elif granularity == "week":
+         if "month" in duration_unit.lower():
+            normalized_duration = duration * 4
+         # If unit is days but we want weeks, usually uncommon for long goals, but handle simple case
+         elif "day" in duration_unit.lower():
+              normalized_duration = max(1, duration // 7)
+    return normalized_duration
+
+def _decompose_key(title, duration, duration_unit, breakdown_type="daily", on_progress=None):
+    granularity = "day" if breakdown_type == "daily" else "week"
+    return [single_flight.normalize_text(title), granularity, _normalize_duration(duration, duration_unit, granularity)]
+
+@single_flight.coalesce("decompose_goal", _decompose_key)
+def decompose_goal(title, duration, duration_unit, breakdown_type="daily", on_progress=None):
     """
     Decomposes a goal into subtasks based on duration and preferred breakdown.
     breakdown_type: 'daily' or 'weekly'
+
+    Long daily plans are generated week by week in parallel (see decompose_goal_chunked);
+    on_progress(subtasks) then receives the in-order prefix generated so far.
     """
     try:
         # Determine the granularity instruction
         granularity = "day" if breakdown_type == "daily" else "week"
+        normalized_duration = _normalize_duration(duration, duration_unit, granularity)
 
-        # Normalize duration to match granularity
-        normalized_duration = duration
-        if granularity == "day":
-            if "week" in duration_unit.lower():
-                normalized_duration = duration * 7
-            elif "month" in duration_unit.lower():
-                normalized_duration = duration * 30
-        elif granularity == "week":
-             if "month" in duration_unit.lower():
-                normalized_duration = duration * 4
-             # If unit is days but we want weeks, usually uncommon for long goals, but handle simple case
-             elif "day" in duration_unit.lower():
-                  normalized_duration = max(1, duration // 7)
+        if granularity == "day" and normalized_duration >= DECOMPOSE_CHUNK_MIN_DAYS:
+            return decompose_goal_chunked(title, normalized_duration, on_progress=on_progress)
 
         if normalized_duration == 1 and granularity == "day":
              # Special handling for single day goals -> Hourly/Session breakdown
@@ -483,7 +542,7 @@ def decompose_goal(title, duration, duration_unit, breakdown_type="daily"):
              Example: {{ "subtasks": [ {{ "text": "Day 1: Setup env", "completed": false }}, {{ "text": "Day 2: ...", "completed": false }} ] }}
              """
         
-        completion = client.chat.completions.create(
+        completion = _create_completion("decompose_goal",
             model=MODEL_CONFIG["reasoning"],
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
@@ -494,10 +553,116 @@ def decompose_goal(title, duration, duration_unit, breakdown_type="daily"):
         data = json.loads(text)
         return data.get("subtasks", [])
         
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"⚠️ Goal decomposition failed: {e}")
         return [{"text": "Could not decompose goal automatically.", "completed": False}]
 
+def outline_goal_weeks(title, total_days):
+    """
+    First pass of chunked decomposition: one short completion that assigns a focus
+    to every week so the per-week generations stay coherent.
+    """
+    num_weeks = math.ceil(total_days / 7)
+    fallback = [f"Continue working on: {title}" for _ in range(num_weeks)]
+    try:
+        prompt = f"""
+        You are an expert planner. The user has a goal: "{title}" to be completed in {total_days} days ({num_weeks} weeks).
+        Create a high-level outline with EXACTLY {num_weeks} weeks, building from fundamentals to mastery.
+
+        Return strictly a JSON object with a key "weeks" containing a list of {num_weeks} strings,
+        each a one-sentence focus for that week.
+
+        Example: {{ "weeks": [ "Setup and fundamentals", "Core concepts and practice" ] }}
+        """
+
+        completion = _create_completion("outline_goal_weeks",
+            model=MODEL_CONFIG["reasoning"],
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.5,
+            response_format={"type": "json_object"}
+        )
+
+        weeks = json.loads(completion.choices[0].message.content.strip()).get("weeks", [])
+        weeks = [w.get("focus", str(w)) if isinstance(w, dict) else str(w) for w in weeks]
+        # Pad / trim so every week has exactly one focus
+        return (weeks + fallback[len(weeks):])[:num_weeks]
+
+    except llm_admission.Overloaded:
+        raise
+    except Exception as e:
+        print(f"⚠️ Goal outline failed: {e}")
+        return fallback
+
+def _decompose_week(title, total_days, week_index, focus):
+    """Generates the daily tasks for one week of the outline."""
+    start_day = week_index * 7 + 1
+    end_day = min(total_days, start_day + 6)
+    days = end_day - start_day + 1
+    try:
+        prompt = f"""
+        You are an expert planner. The user has a goal: "{title}" to be completed in {total_days} days.
+        This is week {week_index + 1}, covering Day {start_day} to Day {end_day}. Focus of this week: "{focus}".
+
+        Rules:
+        1. Generate EXACTLY {days} tasks, one for every day from Day {start_day} to Day {end_day}.
+        2. Label tasks clearly as "Day {start_day}:", "Day {start_day + 1}:", etc.
+
+        Return strictly a JSON object with a key "subtasks" containing a list of objects.
+        Each object must have:
+        - "text": The task description (e.g. "Day {start_day}: ...")
+        - "completed": false
+
+        Example: {{ "subtasks": [ {{ "text": "Day {start_day}: ...", "completed": false }} ] }}
+        """
+
+        completion = _create_completion("decompose_week",
+            model=MODEL_CONFIG["reasoning"],
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+
+        subtasks = json.loads(completion.choices[0].message.content.strip()).get("subtasks", [])
+        if subtasks:
+            return subtasks[:days]
+
+    except llm_admission.Overloaded:
+        raise
+    except Exception as e:
+        print(f"⚠️ Week {week_index + 1} decomposition failed: {e}")
+
+    return [{"text": f"Day {day}: {focus}", "completed": False} for day in range(start_day, end_day + 1)]
+
+def decompose_goal_chunked(title, total_days, on_progress=None):
+    """
+    Builds a week-level outline, then generates every week's daily tasks concurrently
+    and stitches them back in order. Wall-clock time is bounded by the slowest week
+    instead of growing with the number of days.
+    """
+    outline = outline_goal_weeks(title, total_days)
+    chunks = [None] * len(outline)
+    published = 0
+
+    with ThreadPoolExecutor(max_workers=min(len(outline), DECOMPOSE_MAX_PARALLEL_CHUNKS)) as pool:
+        futures = {
+            pool.submit(tracing.propagate(_decompose_week), title, total_days, idx, focus): idx
+            for idx, focus in enumerate(outline)
+        }
+        for future in as_completed(futures):
+            chunks[futures[future]] = future.result()
+
+            # Only publish the contiguous prefix so task indices never shift under the user
+            ready = published
+            while ready < len(chunks) and chunks[ready] is not None:
+                ready += 1
+            if on_progress and ready > published and ready < len(chunks):
+                on_progress([task for chunk in chunks[:ready] for task in chunk])
+            published = ready
+
+    return [task for chunk in chunks for task in chunk]
+
 def generate_goal_reminder(goal_title, subtasks, days_elapsed, duration):
     """
     Generates a context-aware reminder for the user based on their goal progress.
@@ -537,7 +702,7 @@ def generate_goal_reminder(goal_title, subtasks, days_elapsed, duration):
         Return ONLY the raw string message. No JSON.
         """
         
-        completion = client.chat.completions.create(
+        completion = _create_completion("generate_goal_reminder",
             model=MODEL_CONFIG["primary"],
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7
@@ -545,10 +710,17 @@ def generate_goal_reminder(goal_title, subtasks, days_elapsed, duration):
         
         return completion.choices[0].message.content.strip()
 
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"⚠️ Reminder generation failed: {e}")
         return f"Don't forget to work on your goal: {goal_title}!"
 
+def _quiz_key(goal_title, subtasks):
+    texts = [t.get("text", "") if isinstance(t, dict) else t for t in subtasks or []]
+    return [single_flight.normalize_text(goal_title), [single_flight.normalize_text(t) for t in texts]]
+
+@single_flight.coalesce("generate_goal_quiz", _quiz_key)
 def generate_goal_quiz(goal_title, subtasks):
     """
     Generates a 5-question MCQ quiz if the goal is learning-related.
@@ -579,7 +751,7 @@ def generate_goal_quiz(goal_title, subtasks):
         }}
         """
         
-        completion = client.chat.completions.create(
+        completion = _create_completion("generate_goal_quiz",
             model=MODEL_CONFIG["academic"], # Use academic model for better quality questions
             messages=[{"role": "user", "content": prompt}],
             temperature=0.5,
@@ -594,10 +766,13 @@ def generate_goal_quiz(goal_title, subtasks):
             
         return data
 
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"⚠️ Quiz generation failed: {e}")
         return None
 
+@single_flight.coalesce("generate_personalized_rewards", lambda interests_text: [single_flight.normalize_text(interests_text)])
 def generate_personalized_rewards(interests_text):
     """
     Generates 50-75 unique reward items based on user interests using AI.
@@ -632,7 +807,7 @@ def generate_personalized_rewards(interests_text):
         }}
         """
         
-        completion = client.chat.completions.create(
+        completion = _create_completion("generate_personalized_rewards",
             model=MODEL_CONFIG["reasoning"],
             messages=[{"role": "user", "content": prompt}],
             temperature=0.8,
@@ -643,6 +818,8 @@ def generate_personalized_rewards(interests_text):
         data = json.loads(text)
         return data.get("rewards", [])
 
+    except llm_admission.Overloaded:
+        raise
     except Exception as e:
         print(f"⚠️ Reward generation failed: {e}")
         return []
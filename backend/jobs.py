@@ -0,0 +1,315 @@
+import json
+import uuid
+import time
+import random
+import threading
+import traceback
+import contextvars
+import tracing
+import llm_admission
+import llm_usage
+from redis_client import get_redis_client
+from config import (
+    JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS, JOB_VISIBILITY_TIMEOUT_SECONDS, JOB_RESULT_TTL_SECONDS
+)
+
+# Redis layout
+# job:{id}                      Hash with status, payload, result, attempts..., and step:{name}
+#                               fields for the steps an earlier attempt completed (mark_step)
+# jobs:queue                    List of ready job ids (LPUSH / BRPOPLPUSH)
+# jobs:processing               List of job ids currently claimed by a worker
+# jobs:delayed                  Sorted set of job ids waiting for a retry (score = run_at)
+# job:dedupe:{user}:{goal}:{kind}   Id of the live job for that (user, goal or dedupe_id, kind)
+#
+# Jobs created with claim() skip jobs:queue: the API process that created them
+# runs them, and only their retries go through the queue.
+
+QUEUE_KEY = "jobs:queue"
+PROCESSING_KEY = "jobs:processing"
+DELAYED_KEY = "jobs:delayed"
+
+HANDLERS = {}
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+def job_handler(kind: str):
+    """Registers a function as the handler for a job kind: fn(payload) -> result."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _dedupe_key(kind, user_id, goal_id):
+    return f"job:dedupe:{user_id}:{goal_id}:{kind}"
+
+
+def _public(job: dict):
+    if not job:
+        return None
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": int(job.get("attempts", 0)),
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error") or None,
+        "created_at": float(job["created_at"]),
+        "updated_at": float(job["updated_at"]),
+    }
+
+
+def enqueue(kind: str, payload: dict, user_id=None, goal_id=None, dedupe_id=None):
+    """
+    Queues a job and returns its public status dict immediately.
+    If a job for the same (user, dedupe_id or goal, kind) is still queued or running,
+    that job is returned instead of creating a duplicate. Returns None if Redis is unavailable.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return None
+
+    job_id = str(uuid.uuid4())
+    dedupe_key = _dedupe_key(kind, user_id, goal_id if dedupe_id is None else dedupe_id)
+    if not redis_client.set(dedupe_key, job_id, nx=True, ex=JOB_RESULT_TTL_SECONDS):
+        existing = redis_client.hgetall(f"job:{redis_client.get(dedupe_key)}")
+        if existing and existing["status"] in ("queued", "running", "retrying"):
+            return _public(existing)
+        # Stale pointer (job finished or expired): take it over
+        redis_client.set(dedupe_key, job_id, ex=JOB_RESULT_TTL_SECONDS)
+
+    job = _new_job(job_id, kind, payload, user_id, goal_id, dedupe_key)
+    pipe = redis_client.pipeline()
+    pipe.hset(f"job:{job_id}", mapping=job)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return _public(job)
+
+
+def claim(kind: str, payload: dict, user_id=None):
+    """
+    Creates a job that the calling process runs itself with process_job(), e.g. from a
+    FastAPI background task right after the response is sent, so it does not wait behind
+    the queue. It is listed as claimed: if the process dies before finishing it, a worker
+    re-queues it after the visibility timeout, and failed attempts are retried by the
+    workers as usual. Not deduplicated. Returns None if Redis is unavailable.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return None
+
+    job_id = str(uuid.uuid4())
+    job = _new_job(job_id, kind, payload, user_id, None, "")
+    job["status"] = "running"
+    pipe = redis_client.pipeline()
+    pipe.hset(f"job:{job_id}", mapping=job)
+    pipe.lpush(PROCESSING_KEY, job_id)
+    pipe.execute()
+    return _public(job)
+
+
+def _new_job(job_id, kind, payload, user_id, goal_id, dedupe_key):
+    now = time.time()
+    return {
+        "id": job_id,
+        "kind": kind,
+        "user_id": "" if user_id is None else str(user_id),
+        "goal_id": "" if goal_id is None else str(goal_id),
+        "payload": json.dumps(payload),
+        "status": "queued",
+        "attempts": 0,
+        "dedupe_key": dedupe_key,
+        "created_at": now,
+        "updated_at": now,
+        # Lets the worker continue the enqueuing request's trace
+        "traceparent": tracing.traceparent_header() or "",
+    }
+
+
+def get_job(job_id: str, user_id=None):
+    """Returns the public status of a job, or None if missing / owned by someone else."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return None
+
+    job = redis_client.hgetall(f"job:{job_id}")
+    if not job:
+        return None
+    if user_id is not None and job.get("user_id") != str(user_id):
+        return None
+    return _public(job)
+
+
+def completed_steps():
+    """Steps the running job recorded with mark_step() in earlier attempts: {name: value}."""
+    job_id = _current_job.get()
+    redis_client = get_redis_client()
+    if not job_id or not redis_client:
+        return {}
+    job = redis_client.hgetall(f"job:{job_id}")
+    return {k[len("step:"):]: json.loads(v) for k, v in job.items() if k.startswith("step:")}
+
+
+def mark_step(name: str, value=True):
+    """
+    Records that the running job finished a step with a non-idempotent write, so a
+    retry of the job can skip it (see completed_steps). No-op outside process_job().
+    """
+    job_id = _current_job.get()
+    redis_client = get_redis_client()
+    if not job_id or not redis_client:
+        return
+    redis_client.hset(f"job:{job_id}", f"step:{name}", json.dumps(value))
+
+
+def run_inline(kind: str, payload: dict):
+    """Runs a handler synchronously (used when Redis is unavailable)."""
+    return HANDLERS[kind](payload)
+
+
+def _finish(redis_client, job_id, job, **fields):
+    fields["updated_at"] = time.time()
+    pipe = redis_client.pipeline()
+    pipe.hset(f"job:{job_id}", mapping=fields)
+    pipe.expire(f"job:{job_id}", JOB_RESULT_TTL_SECONDS)
+    pipe.lrem(PROCESSING_KEY, 1, job_id)
+    if fields["status"] in ("succeeded", "failed") and job.get("dedupe_key"):
+        pipe.delete(job["dedupe_key"])
+    pipe.execute()
+
+
+def process_job(job_id: str):
+    redis_client = get_redis_client()
+    job = redis_client.hgetall(f"job:{job_id}")
+    if not job:
+        redis_client.lrem(PROCESSING_KEY, 1, job_id)
+        return
+
+    attempts = int(job.get("attempts", 0)) + 1
+    redis_client.hset(f"job:{job_id}", mapping={
+        "status": "running", "attempts": attempts, "started_at": time.time(), "updated_at": time.time()
+    })
+
+    handler = HANDLERS.get(job["kind"])
+    stop_heartbeat = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop_heartbeat), daemon=True).start()
+    try:
+        if not handler:
+            raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+        token = _current_job.set(job_id)
+        try:
+            with tracing.start_trace(f"job {job['kind']}", traceparent=job.get("traceparent"), job_id=job_id, attempt=attempts), \
+                    llm_admission.background(), llm_usage.for_user(job.get("user_id")):
+                result = handler(json.loads(job["payload"]))
+        finally:
+            _current_job.reset(token)
+        _finish(redis_client, job_id, job, status="succeeded", result=json.dumps(result), error="")
+        print(f"✅ Job {job['kind']} {job_id[:8]} succeeded (attempt {attempts})")
+    except llm_admission.Overloaded as e:
+        # Shed to make room for interactive traffic: try again later without using up an attempt
+        delay = e.retry_after * random.uniform(1, 2)
+        _finish(redis_client, job_id, job, status="retrying", attempts=attempts - 1, error=f"Overloaded: {e}")
+        redis_client.zadd(DELAYED_KEY, {job_id: time.time() + delay})
+        print(f"🚦 Job {job['kind']} {job_id[:8]} shed ({e}), retrying in {delay:.1f}s")
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if attempts < JOB_MAX_ATTEMPTS:
+            # Jittered exponential backoff
+            delay = JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            _finish(redis_client, job_id, job, status="retrying", error=error)
+            redis_client.zadd(DELAYED_KEY, {job_id: time.time() + delay})
+            print(f"🔁 Job {job['kind']} {job_id[:8]} failed ({error}), retrying in {delay:.1f}s")
+        else:
+            _finish(redis_client, job_id, job, status="failed", error=error)
+            print(f"❌ Job {job['kind']} {job_id[:8]} failed permanently: {error}")
+            traceback.print_exc()
+    finally:
+        stop_heartbeat.set()
+
+
+def _heartbeat(job_id, stop_event):
+    """Keeps updated_at fresh while a job runs, so slow jobs are not taken for stalled ones."""
+    redis_client = get_redis_client()
+    while not stop_event.wait(JOB_VISIBILITY_TIMEOUT_SECONDS / 3):
+        try:
+            redis_client.hset(f"job:{job_id}", "updated_at", time.time())
+        except Exception as e:
+            print(f"⚠️ Job {job_id[:8]} heartbeat failed: {e}")
+
+
+def promote_delayed_jobs():
+    """Moves retries whose backoff has elapsed back onto the ready queue."""
+    redis_client = get_redis_client()
+    for job_id in redis_client.zrangebyscore(DELAYED_KEY, 0, time.time(), start=0, num=100):
+        # ZREM succeeds for exactly one worker, so each job is re-queued once
+        if redis_client.zrem(DELAYED_KEY, job_id):
+            redis_client.hset(f"job:{job_id}", "status", "queued")
+            redis_client.lpush(QUEUE_KEY, job_id)
+
+
+def requeue_stalled_jobs():
+    """Re-queues jobs whose worker died mid-run (no heartbeat within the visibility timeout)."""
+    redis_client = get_redis_client()
+    cutoff = time.time() - JOB_VISIBILITY_TIMEOUT_SECONDS
+    for job_id in redis_client.lrange(PROCESSING_KEY, 0, -1):
+        updated_at = redis_client.hget(f"job:{job_id}", "updated_at")
+        if updated_at and float(updated_at) < cutoff:
+            if redis_client.lrem(PROCESSING_KEY, 1, job_id):
+                print(f"⏰ Job {job_id[:8]} stalled, re-queueing")
+                redis_client.hset(f"job:{job_id}", "status", "queued")
+                redis_client.lpush(QUEUE_KEY, job_id)
+
+
+def _consume(stop_event: threading.Event):
+    redis_client = get_redis_client()
+    while not stop_event.is_set():
+        job_id = redis_client.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=1)
+        if job_id:
+            process_job(job_id)
+
+
+def _run_periodic(fn):
+    try:
+        fn()
+    except Exception as e:
+        print(f"⚠️ Periodic task {fn.__name__} failed: {e}")
+
+
+def run_worker(concurrency: int = 4, maintenance_interval: float = 1.0, periodic_tasks=None):
+    """
+    Runs `concurrency` consumer threads until interrupted. Start as many worker
+    processes as needed; they all share the same Redis queue.
+
+    periodic_tasks: optional list of (interval_seconds, fn), each started from the maintenance
+    loop on its own thread every interval_seconds (never two runs of the same fn at once).
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        raise RuntimeError("Job worker requires Redis")
+
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=_consume, args=(stop_event,), daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    print(f"👷 Job worker started with {concurrency} threads")
+
+    # First runs are one interval after startup, so restarts do not trigger every task at once
+    started = time.time()
+    last_run = {fn: started for _, fn in periodic_tasks or []}
+    running = {}
+    try:
+        while True:
+            promote_delayed_jobs()
+            requeue_stalled_jobs()
+            for interval, fn in periodic_tasks or []:
+                # Periodic tasks run on their own thread so a long one never stalls retries and re-queues
+                if time.time() - last_run[fn] >= interval and not (fn in running and running[fn].is_alive()):
+                    last_run[fn] = time.time()
+                    running[fn] = threading.Thread(target=_run_periodic, args=(fn,), name=fn.__name__, daemon=True)
+                    running[fn].start()
+            time.sleep(maintenance_interval)
+    except KeyboardInterrupt:
+        print("🛑 Stopping job worker...")
+        stop_event.set()
+        for t in threads:
+            t.join(timeout=5)
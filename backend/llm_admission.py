@@ -0,0 +1,218 @@
+"""
+Admission control in front of the upstream LLM, shared by every API and worker
+process through Redis, so a traffic spike is shed here instead of turning into
+upstream 429s for everyone.
+
+- A token bucket per user (LLM_USER_CHATS_PER_MINUTE, LLM_USER_CHAT_BURST) is
+  checked once per /chat message by admit_user().
+- Each model has LLM_MODEL_CONCURRENCY slots; llm_providers holds one per
+  upstream attempt (slot()). Slots are leased, so a crashed process frees its
+  slots once the model's timeout has passed.
+- Interactive callers (the default: request handlers) may use every slot.
+  Background callers (jobs, see background()) may only use
+  LLM_BACKGROUND_SLOT_SHARE of them, and never take a slot while an
+  interactive caller is waiting for that model.
+- Callers wait for a slot in a queue bounded to LLM_QUEUE_MAX_WAITING per
+  model and priority, for at most their wait limit. A full queue or a timed-out
+  wait raises Overloaded, which the API answers with 429 + Retry-After and the
+  job worker retries later.
+
+Without Redis (or with LLM_ADMISSION_ENABLED=false) everything is admitted.
+State: GET /admin/llm/admission.
+"""
+import math
+import time
+import uuid
+import random
+import contextvars
+from contextlib import contextmanager
+import metrics
+from redis_client import get_redis_client
+from config import (
+    MODEL_CONFIG, MODEL_TIMEOUTS, LLM_DEFAULT_TIMEOUT_SECONDS, LLM_ADMISSION_ENABLED, LLM_USER_CHATS_PER_MINUTE,
+    LLM_USER_CHAT_BURST, LLM_MODEL_CONCURRENCY, LLM_DEFAULT_MODEL_CONCURRENCY, LLM_BACKGROUND_SLOT_SHARE,
+    LLM_QUEUE_MAX_WAITING, LLM_QUEUE_WAIT_SECONDS, LLM_BACKGROUND_QUEUE_WAIT_SECONDS, LLM_SHED_RETRY_AFTER_SECONDS
+)
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+
+# How often a queued caller retries for a slot, and how long its queue entry lives between retries
+POLL_SECONDS = 0.05
+WAITER_TTL_SECONDS = 2
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class Overloaded(Exception):
+    """LLM work shed by admission control; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+# KEYS[1] = ratelimit:chat:{user_id}   (hash: tokens, ts)
+# ARGV    = now, tokens per second, burst
+# Returns {1, 0} when a token was taken, else {0, seconds until one is available}.
+TOKEN_BUCKET_LUA = """
+local now, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = tokens >= 1
+if allowed then tokens = tokens - 1 end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+if allowed then return {1, '0'} end
+return {0, tostring((1 - tokens) / rate)}
+"""
+
+# KEYS[1] = llm:slots:{model}                    (zset: holder token -> lease expiry)
+# KEYS[2] = llm:waiting:{model}:interactive      (zset: waiter token -> entry expiry)
+# KEYS[3] = llm:waiting:{model}:background
+# ARGV    = now, token, lease seconds, slot limit, interactive, max waiting, waiter ttl
+# Returns 1 (slot taken), 0 (queued, poll again) or -1 (queue full).
+ACQUIRE_LUA = """
+local now = tonumber(ARGV[1])
+for i = 1, 3 do redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now) end
+local interactive = ARGV[5] == '1'
+local queue = interactive and KEYS[2] or KEYS[3]
+local yielding = not interactive and redis.call('ZCARD', KEYS[2]) > 0
+if not yielding and redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])) + 1)
+    redis.call('ZREM', queue, ARGV[2])
+    return 1
+end
+if not redis.call('ZSCORE', queue, ARGV[2]) and redis.call('ZCARD', queue) >= tonumber(ARGV[6]) then
+    return -1
+end
+redis.call('ZADD', queue, now + tonumber(ARGV[7]), ARGV[2])
+redis.call('EXPIRE', queue, tonumber(ARGV[7]) + 1)
+return 0
+"""
+
+_redis = get_redis_client()
+token_bucket_script = _redis.register_script(TOKEN_BUCKET_LUA) if _redis else None
+acquire_script = _redis.register_script(ACQUIRE_LUA) if _redis else None
+
+
+def _keys(model):
+    return f"llm:slots:{model}", f"llm:waiting:{model}:{INTERACTIVE}", f"llm:waiting:{model}:{BACKGROUND}"
+
+
+def _limit(model, priority):
+    limit = LLM_MODEL_CONCURRENCY.get(model, LLM_DEFAULT_MODEL_CONCURRENCY)
+    if priority == BACKGROUND:
+        return max(1, int(limit * LLM_BACKGROUND_SLOT_SHARE))
+    return limit
+
+
+def _shed(message, retry_after, reason, priority):
+    metrics.LLM_SHED.labels(reason=reason, priority=priority).inc()
+    print(f"🚦 Shedding LLM work ({reason}, {priority}): {message}")
+    raise Overloaded(message, retry_after, reason)
+
+
+@contextmanager
+def background():
+    """Marks the LLM calls made inside the block as background work."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def admit_user(user_id):
+    """Takes one token from the user's chat bucket; raises Overloaded when it is empty."""
+    if not LLM_ADMISSION_ENABLED or not token_bucket_script:
+        return
+    try:
+        allowed, wait = token_bucket_script(
+            keys=[f"ratelimit:chat:{user_id}"],
+            args=[time.time(), LLM_USER_CHATS_PER_MINUTE / 60, LLM_USER_CHAT_BURST],
+        )
+    except Exception as e:
+        print(f"⚠️ Rate limit check failed for user {user_id}: {e}")
+        return
+    if not int(allowed):
+        _shed(f"user {user_id} is over {LLM_USER_CHATS_PER_MINUTE:g} chats/min", float(wait), "user_rate", _priority.get())
+
+
+def _acquire(model, keys, holder, priority, deadline):
+    """Queues for one of the model's slots; returns once it is held, or raises Overloaded."""
+    lease = MODEL_TIMEOUTS.get(model, LLM_DEFAULT_TIMEOUT_SECONDS) + 5
+    max_wait = LLM_QUEUE_WAIT_SECONDS if priority == INTERACTIVE else LLM_BACKGROUND_QUEUE_WAIT_SECONDS
+    give_up = min(deadline, time.monotonic() + max_wait)
+    args = [holder, lease, _limit(model, priority), int(priority == INTERACTIVE), LLM_QUEUE_MAX_WAITING, WAITER_TTL_SECONDS]
+
+    started = time.perf_counter()
+    while True:
+        acquired = int(acquire_script(keys=keys, args=[time.time(), *args]))
+        if acquired == 1:
+            break
+        if acquired == -1:
+            _shed(f"{model} queue is full", LLM_SHED_RETRY_AFTER_SECONDS, "queue_full", priority)
+        if time.monotonic() + POLL_SECONDS >= give_up:
+            get_redis_client().zrem(keys[1] if priority == INTERACTIVE else keys[2], holder)
+            _shed(f"no {model} slot within {time.perf_counter() - started:.1f}s",
+                  LLM_SHED_RETRY_AFTER_SECONDS, "queue_timeout", priority)
+        time.sleep(POLL_SECONDS * random.uniform(0.5, 1.5))
+    metrics.LLM_ADMISSION_WAIT_SECONDS.labels(model=model, priority=priority).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def slot(model, deadline):
+    """
+    Holds one of the model's upstream slots for the block, queueing until one is
+    free, `deadline` (time.monotonic()) or the caller's wait limit, whichever is first.
+    """
+    if not LLM_ADMISSION_ENABLED or not acquire_script:
+        yield
+        return
+
+    keys = list(_keys(model))
+    holder = uuid.uuid4().hex
+    try:
+        _acquire(model, keys, holder, _priority.get(), deadline)
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"⚠️ Admission check failed for {model}: {e}")
+        holder = None
+
+    try:
+        yield
+    finally:
+        if holder:
+            try:
+                get_redis_client().zrem(keys[0], holder)
+            except Exception as e:
+                print(f"⚠️ Could not release {model} slot: {e}")
+
+
+def get_admission_stats():
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    now = time.time()
+    stats = {
+        "user_chats_per_minute": LLM_USER_CHATS_PER_MINUTE,
+        "user_chat_burst": LLM_USER_CHAT_BURST,
+        "models": {},
+    }
+    for mode, model in MODEL_CONFIG.items():
+        slots, interactive, background = _keys(model)
+        stats["models"][model] = {
+            "mode": mode,
+            "in_flight": redis_client.zcount(slots, now, "+inf"),
+            "limit": _limit(model, INTERACTIVE),
+            "background_limit": _limit(model, BACKGROUND),
+            "waiting_interactive": redis_client.zcount(interactive, now, "+inf"),
+            "waiting_background": redis_client.zcount(background, now, "+inf"),
+        }
+    return stats
@@ -0,0 +1,162 @@
+"""
+Record and replay of LLM completions, for reproducible benchmarks of the
+groq_service functions without calling (or waiting on) the upstream API.
+
+    LLM_CASSETTE_MODE=record  every completion request/response (or error) and
+                              its latency is appended to LLM_CASSETTE_PATH
+    LLM_CASSETTE_MODE=replay  completions are served from the cassette, after
+                              sleeping the recorded latency * LLM_CASSETTE_LATENCY_SCALE
+
+Replayed requests are matched on the full request (model, messages and
+parameters) by default. With LLM_CASSETTE_MATCH=sequence they are matched on
+calling function and model only, in recorded order, so a cassette recorded
+before a prompt or routing change can still drive the new code. When a
+request has been replayed as often as it was recorded, its recordings repeat
+from the start.
+
+bench/llm_replay.py uses this through use(); the API and worker pick up the
+environment variables.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from config import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_LATENCY_SCALE, LLM_CASSETTE_MATCH
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    """A replayed request has no recording."""
+
+
+class ReplayedError(Exception):
+    """Stands in for an upstream error that was recorded."""
+
+
+def request_key(kwargs):
+    canonical = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _to_dict(completion):
+    if hasattr(completion, "to_dict"):
+        return completion.to_dict()
+    return completion.model_dump()
+
+
+def _from_dict(data):
+    from groq.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+class Cassette:
+    def __init__(self, path, mode, latency_scale=1.0, match="exact"):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.match = match
+        self.lock = threading.Lock()
+        self.entries = {}  # match key -> [recorded entries]
+        self.cursors = {}
+        self.misses = 0  # groq_service swallows most errors, so benchmarks check this instead
+        if mode == MODE_REPLAY:
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == MODE_REPLAY
+
+    def _match_key(self, function, kwargs):
+        if self.match == "sequence":
+            return f"{function}|{kwargs.get('model')}"
+        return request_key(kwargs)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No cassette at {self.path}; record one with LLM_CASSETTE_MODE=record")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = f"{entry['function']}|{entry['model']}" if self.match == "sequence" else entry["key"]
+                self.entries.setdefault(key, []).append(entry)
+        print(f"📼 Loaded {sum(len(e) for e in self.entries.values())} recorded completions from {self.path}")
+
+    def record(self, function, kwargs, seconds, completion=None, error=None):
+        entry = {
+            "key": request_key(kwargs),
+            "function": function,
+            "model": kwargs.get("model"),
+            "request": kwargs,
+            "seconds": round(seconds, 4),
+            "recorded_at": time.time(),
+        }
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        else:
+            entry["response"] = _to_dict(completion)
+        line = json.dumps(entry, default=str)
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def play(self, function, kwargs):
+        """Returns the recorded completion (or raises the recorded error) after the scaled latency."""
+        key = self._match_key(function, kwargs)
+        with self.lock:
+            recordings = self.entries.get(key)
+            if not recordings:
+                self.misses += 1
+                raise CassetteMiss(f"No recording for {function} on {kwargs.get('model')} (key {key})")
+            cursor = self.cursors.get(key, 0)
+            self.cursors[key] = cursor + 1
+            entry = recordings[cursor % len(recordings)]
+
+        delay = entry["seconds"] * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        return _from_dict(entry["response"])
+
+    def call(self, function, create, kwargs):
+        """create(**kwargs), recorded or replayed according to the mode."""
+        if self.replaying:
+            return self.play(function, kwargs)
+        start = time.perf_counter()
+        try:
+            completion = create(**kwargs)
+        except Exception as e:
+            self.record(function, kwargs, time.perf_counter() - start, error=e)
+            raise
+        self.record(function, kwargs, time.perf_counter() - start, completion=completion)
+        return completion
+
+
+_active = Cassette(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY_SCALE, LLM_CASSETTE_MATCH) if LLM_CASSETTE_MODE else None
+
+
+def active():
+    return _active
+
+
+@contextmanager
+def use(path, mode, latency_scale=1.0, match="exact"):
+    """Records or replays every completion made inside the block (process-wide)."""
+    global _active
+    previous = _active
+    _active = Cassette(path, mode, latency_scale, match)
+    try:
+        yield _active
+    finally:
+        _active = previous
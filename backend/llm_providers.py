@@ -0,0 +1,380 @@
+"""
+LLM providers and the call policy every groq_service completion goes through.
+
+complete() tries a chain of models: the requested one, then the fallbacks of
+its mode (LLM_FALLBACK_CHAINS). Each attempt gets the model's timeout
+(MODEL_TIMEOUTS), capped by what is left of the call's budget:
+
+- timeouts, connection errors, 429 and 5xx are retried on the same model with
+  jittered exponential backoff (at least the upstream Retry-After);
+- other errors (bad request, invalid JSON output, ...) move on to the next model;
+- authentication errors fail immediately, since every model shares the key.
+
+No call outlives its budget, so a hung upstream cannot hold a request or job
+worker indefinitely. Every attempt first takes one of the model's upstream slots
+(llm_admission.slot), which raises llm_admission.Overloaded when shedding load. In LLM_HEDGE_MODES, a model that is slower than its recent
+LLM_HEDGE_PERCENTILE latency is raced against the first fallback (see _hedged).
+
+Providers are interchangeable (LLM_PROVIDER): Groq, or a local OpenAI-compatible
+server such as Ollama, vLLM or bench/fake_groq.py.
+"""
+import json
+import time
+import random
+import threading
+import contextvars
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed, wait
+import groq
+from groq import Groq
+from groq.types.chat import ChatCompletion
+import metrics
+import tracing
+import llm_cassette
+import circuit_breaker
+import llm_admission
+import llm_usage
+from config import (
+    GROQ_API_KEY, GROQ_BASE_URL, LLM_PROVIDER, LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY, LOCAL_LLM_MODEL,
+    MODEL_TIMEOUTS, LLM_DEFAULT_TIMEOUT_SECONDS, LLM_MAX_RETRIES, LLM_RETRY_BASE_SECONDS,
+    LLM_RETRY_MAX_SECONDS, LLM_CALL_BUDGET_SECONDS, LLM_HEDGE_MODES, LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_DEFAULT_DELAY_SECONDS, LLM_HEDGE_MAX_CONCURRENT
+)
+
+
+class ProviderError(Exception):
+    """An upstream failure, classified so complete() knows whether to retry, fall back or give up."""
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None, fatal=False, reason="error"):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.fatal = fatal
+        self.reason = reason
+
+
+class LLMUnavailable(Exception):
+    """Every model in the chain failed, or the call ran out of budget."""
+
+
+def _parse_retry_after(value):
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None  # HTTP-date form; treat as unknown
+
+
+def _status_error(status, message, retry_after=None):
+    return ProviderError(
+        f"HTTP {status}: {message}",
+        status=status,
+        retryable=status in (408, 409, 429) or status >= 500,
+        retry_after=_parse_retry_after(retry_after),
+        fatal=status in (401, 403),
+        reason="rate_limited" if status == 429 else f"http_{status}",
+    )
+
+
+class GroqProvider:
+    name = "groq"
+
+    def __init__(self, api_key, base_url=None):
+        # Retries are handled by complete(), so the SDK must not add its own
+        self.client = Groq(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def create(self, timeout, **kwargs):
+        try:
+            return self.client.chat.completions.create(timeout=timeout, **kwargs)
+        except groq.APITimeoutError as e:
+            raise ProviderError(f"timed out after {timeout:.1f}s", retryable=True, reason="timeout") from e
+        except groq.APIConnectionError as e:
+            raise ProviderError(f"connection failed: {e}", retryable=True, reason="connection") from e
+        except groq.APIStatusError as e:
+            raise _status_error(e.status_code, e.message, e.response.headers.get("retry-after")) from e
+
+
+class OpenAICompatibleProvider:
+    """Any server exposing POST {base_url}/chat/completions in the OpenAI format."""
+    name = "local"
+
+    def __init__(self, base_url, api_key="", model=""):
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+
+    def create(self, timeout, **kwargs):
+        if self.model:
+            kwargs = {**kwargs, "model": self.model}
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(kwargs).encode(), headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise _status_error(e.code, e.read()[:300].decode(errors="replace"), e.headers.get("Retry-After")) from e
+        except TimeoutError as e:
+            raise ProviderError(f"timed out after {timeout:.1f}s", retryable=True, reason="timeout") from e
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, TimeoutError):
+                raise ProviderError(f"timed out after {timeout:.1f}s", retryable=True, reason="timeout") from e
+            raise ProviderError(f"connection failed: {e.reason}", retryable=True, reason="connection") from e
+        return ChatCompletion.model_validate(data)
+
+
+PROVIDERS = {
+    "groq": lambda: GroqProvider(GROQ_API_KEY, GROQ_BASE_URL),
+    "local": lambda: OpenAICompatibleProvider(LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY, LOCAL_LLM_MODEL),
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+_answered_by = contextvars.ContextVar("llm_answered_by", default=None)
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if LLM_PROVIDER not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}' (choose from {', '.join(PROVIDERS)})")
+                _provider = PROVIDERS[LLM_PROVIDER]()
+    return _provider
+
+
+def set_provider(provider):
+    """Swaps the provider process-wide (benchmarks, local experiments)."""
+    global _provider
+    _provider = provider
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the upstream's Retry-After."""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def _attempt(function, model, mode, fallback_from, attempt, timeout, kwargs, probe=False):
+    provider = get_provider()
+    request = {**kwargs, "model": model}
+    cassette = llm_cassette.active()
+
+    def create(**kw):
+        return provider.create(timeout=timeout, **kw)
+
+    with tracing.span(
+        f"llm {function}", llm_model=model, llm_mode=mode, llm_provider=provider.name,
+        fallback_from=fallback_from, attempt=attempt, timeout_s=round(timeout, 1)
+    ) as span:
+        start = time.perf_counter()
+        with metrics.llm_call(function, model, mode):
+            try:
+                completion = cassette.call(function, create, request) if cassette else create(**request)
+            except Exception as e:
+                if not isinstance(e, ProviderError):
+                    # Replayed errors, cassette misses, malformed responses: treat like a failed model
+                    e = ProviderError(f"{type(e).__name__}: {e}")
+                if not e.fatal:
+                    circuit_breaker.record(model, False, time.perf_counter() - start, probe=probe)
+                raise e
+        seconds = time.perf_counter() - start
+        LATENCIES.add((mode, model), seconds)
+        circuit_breaker.record(model, True, seconds, probe=probe)
+        usage = getattr(completion, "usage", None)
+        llm_usage.record(function, model, mode, seconds, usage)
+        if usage is not None:
+            span.set(
+                llm_prompt_tokens=getattr(usage, "prompt_tokens", None),
+                llm_completion_tokens=getattr(usage, "completion_tokens", None),
+            )
+        return completion
+
+
+def _call_model(function, model, mode, fallback_from, deadline, kwargs, errors, probe=False):
+    """
+    Attempts (and retries) one model. Returns the completion, or None once the model is given up on.
+    A circuit breaker probe gets a single attempt, whose outcome settles the breaker.
+    """
+    attempt = 0
+    while True:
+        try:
+            # Raises llm_admission.Overloaded when no upstream slot frees up in time
+            with llm_admission.slot(model, deadline):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                timeout = min(MODEL_TIMEOUTS.get(model, LLM_DEFAULT_TIMEOUT_SECONDS), remaining)
+                return _attempt(function, model, mode, fallback_from, attempt, timeout, kwargs, probe=probe)
+        except ProviderError as e:
+            errors.append(f"{model}: {e}")
+            if e.fatal:
+                raise LLMUnavailable(f"{function}: {e}") from e
+            if probe or not e.retryable or attempt >= LLM_MAX_RETRIES:
+                return None
+            delay = backoff_delay(attempt, e.retry_after)
+            if time.monotonic() + delay >= deadline:
+                return None
+            metrics.LLM_RETRIES.labels(model=model, reason=e.reason).inc()
+            print(f"🔁 {function} on {model} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _falling_back(function, from_model, to_model):
+    metrics.LLM_FALLBACKS.labels(function=function, from_model=from_model, to_model=to_model).inc()
+    print(f"🔄 {function}: falling back from {from_model} to {to_model}")
+
+
+# --- Hedging ---
+
+class LatencyWindow:
+    """Recent successful attempt latencies per (mode, model) in this process; sets the hedge delay."""
+
+    def __init__(self, size=500):
+        self.size = size
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, key, seconds):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, key, pct, min_samples=1):
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        if len(values) < max(1, min_samples):
+            return None
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+LATENCIES = LatencyWindow()
+_hedge_slots = threading.BoundedSemaphore(LLM_HEDGE_MAX_CONCURRENT)
+# Abandoned attempts keep their thread until they return (bounded by their timeout), hence the headroom
+_hedge_pool = ThreadPoolExecutor(max_workers=4 * LLM_HEDGE_MAX_CONCURRENT, thread_name_prefix="llm-hedge")
+
+
+def hedge_delay(mode, model):
+    threshold = LATENCIES.percentile((mode, model), LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES)
+    return threshold if threshold is not None else LLM_HEDGE_DEFAULT_DELAY_SECONDS
+
+
+def _hedged(function, primary, backup, mode, deadline, kwargs, errors):
+    """
+    Runs `primary`, and races `backup` against it if it is still running after the
+    hedge delay. Returns (first completion, its model), or (None, None) once both models failed.
+
+    The sync SDK cannot interrupt a request in flight, so the losing attempt is
+    abandoned rather than cancelled: its result is discarded when it returns.
+    """
+    started = time.perf_counter()
+    hedged_seconds = metrics.LLM_HEDGE_CALL_SECONDS.labels(mode=mode, path="hedged")
+    primary_seconds = metrics.LLM_HEDGE_CALL_SECONDS.labels(mode=mode, path="primary_only")
+
+    def run(model, fallback_from):
+        try:
+            return _call_model(function, model, mode, fallback_from, deadline, kwargs, errors)
+        except (LLMUnavailable, llm_admission.Overloaded):
+            return None
+
+    def primary_done(future):
+        # What the caller would have waited without hedging (the p99 to compare against)
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            primary_seconds.observe(time.perf_counter() - started)
+
+    delay = hedge_delay(mode, primary)
+    first = _hedge_pool.submit(tracing.propagate(run), primary, None)
+    first.add_done_callback(primary_done)
+    done, _ = wait([first], timeout=max(0.0, min(delay, deadline - time.monotonic())))
+    if done:
+        completion, model = first.result(), primary
+        if completion is None:
+            _falling_back(function, primary, backup)
+            completion, model = run(backup, primary), backup
+        if completion is None:
+            return None, None
+        hedged_seconds.observe(time.perf_counter() - started)
+        return completion, model
+
+    metrics.LLM_HEDGES.labels(mode=mode, model=primary).inc()
+    print(f"🏁 {function}: {primary} is slower than {delay:.1f}s, hedging with {backup}")
+    second = _hedge_pool.submit(tracing.propagate(run), backup, primary)
+    contenders = {first: ("primary", primary), second: ("hedge", backup)}
+    try:
+        for future in as_completed(contenders, timeout=max(0.0, deadline - time.monotonic()) + 1):
+            completion = future.result()
+            if completion is not None:
+                hedged_seconds.observe(time.perf_counter() - started)
+                winner, model = contenders[future]
+                metrics.LLM_HEDGE_WINS.labels(mode=mode, winner=winner).inc()
+                for loser in contenders:
+                    loser.cancel()
+                return completion, model
+    except FuturesTimeout:
+        pass
+    return None, None
+
+
+def answered_by():
+    """The model that produced the last completion complete() returned in this context."""
+    return _answered_by.get()
+
+
+def complete(function, models, mode=None, budget=None, **kwargs):
+    """
+    Chat completion for groq_service's `function`, trying `models` in order, skipping
+    those whose circuit breaker is open (and hedging the first two in LLM_HEDGE_MODES).
+    Raises LLMUnavailable when none succeeds within the budget (seconds). The model
+    that answered is available afterwards from answered_by().
+    """
+    _answered_by.set(None)
+    deadline = time.monotonic() + (budget or LLM_CALL_BUDGET_SECONDS)
+    errors = []
+    permits = {}
+
+    def permit(model):
+        if model not in permits:
+            permits[model] = circuit_breaker.allow(model)
+            if permits[model] == circuit_breaker.REJECT:
+                metrics.LLM_BREAKER_REJECTIONS.labels(model=model).inc()
+                errors.append(f"{model}: circuit open")
+        return permits[model]
+
+    first_sequential = 0
+    if (mode in LLM_HEDGE_MODES and len(models) > 1
+            and permit(models[0]) == permit(models[1]) == circuit_breaker.ALLOW
+            and _hedge_slots.acquire(blocking=False)):
+        try:
+            completion, model = _hedged(function, models[0], models[1], mode, deadline, kwargs, errors)
+        finally:
+            _hedge_slots.release()
+        if completion is not None:
+            _answered_by.set(model)
+            return completion
+        first_sequential = 2
+
+    tried = models[first_sequential - 1] if first_sequential else None
+    for model in models[first_sequential:]:
+        if permit(model) == circuit_breaker.REJECT:
+            print(f"⚡ {function}: circuit for {model} is open, skipping it")
+            tried = tried or model
+            continue
+        if tried:
+            _falling_back(function, tried, model)
+        completion = _call_model(
+            function, model, mode, tried, deadline, kwargs, errors, probe=permit(model) == circuit_breaker.PROBE
+        )
+        if completion is not None:
+            _answered_by.set(model)
+            return completion
+        if time.monotonic() >= deadline:
+            raise LLMUnavailable(f"{function}: out of budget ({'; '.join(errors) or 'no attempt finished'})")
+        tried = model
+
+    if all(permits.get(model) == circuit_breaker.REJECT for model in models):
+        raise LLMUnavailable(f"{function}: circuits open for {', '.join(models)}")
+    raise LLMUnavailable(f"{function}: all models failed ({'; '.join(errors)})")
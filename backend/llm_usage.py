@@ -0,0 +1,151 @@
+"""
+Token usage and cost of every LLM completion, rolled up in Redis per user,
+mode, function and model, by UTC hour and day.
+
+usage:h:{YYYYMMDDHH}   Hash  "{dimension}:{value}:{metric}" counters for that hour
+usage:d:{YYYYMMDD}     Hash  the same, for that day
+
+dimensions: user, mode, function, model (plus "all:all" for totals)
+metrics:    calls, prompt_tokens, completion_tokens, tokens, latency_ms, cost_micro_usd
+
+llm_providers records every completion that came back, including the losing
+attempt of a hedged pair, since those are billed too. The user is the one set with
+for_user() by the request or job that made the call. Users past
+LLM_USER_DAILY_TOKEN_BUDGET are downgraded to the primary model by
+groq_service. Report: GET /admin/usage.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+import metrics
+from redis_client import get_redis_client
+from config import (
+    LLM_MODEL_PRICES, LLM_USER_DAILY_TOKEN_BUDGET, LLM_USAGE_HOURLY_RETENTION_HOURS, LLM_USAGE_DAILY_RETENTION_DAYS
+)
+
+_user = contextvars.ContextVar("llm_usage_user", default=None)
+
+
+@contextmanager
+def for_user(user_id):
+    """Attributes the LLM calls made inside the block to user_id."""
+    token = _user.set(str(user_id) if user_id not in (None, "") else None)
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+def _buckets(now=None):
+    now = time.gmtime(now or time.time())
+    return time.strftime("%Y%m%d%H", now), time.strftime("%Y%m%d", now)
+
+
+def cost_micro_usd(model, prompt_tokens, completion_tokens):
+    # USD per million tokens * tokens = micro-USD
+    price_in, price_out = LLM_MODEL_PRICES.get(model, (0, 0))
+    return round(prompt_tokens * price_in + completion_tokens * price_out)
+
+
+def record(function, model, mode, seconds, usage):
+    """Adds one finished completion (usage may be None) to the hourly and daily rollups."""
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or 0
+    metrics.LLM_TOKENS.labels(function=function, model=model, kind="prompt").inc(prompt)
+    metrics.LLM_TOKENS.labels(function=function, model=model, kind="completion").inc(completion)
+
+    redis_client = get_redis_client()
+    if not redis_client:
+        return
+
+    values = {
+        "calls": 1,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "tokens": prompt + completion,
+        "latency_ms": round(seconds * 1000),
+        "cost_micro_usd": cost_micro_usd(model, prompt, completion),
+    }
+    keys = [("all", "all"), ("mode", mode or "none"), ("function", function), ("model", model)]
+    user_id = _user.get()
+    if user_id:
+        keys.append(("user", user_id))
+
+    hour, day = _buckets()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for bucket_key, ttl in ((f"usage:h:{hour}", LLM_USAGE_HOURLY_RETENTION_HOURS * 3600),
+                                (f"usage:d:{day}", LLM_USAGE_DAILY_RETENTION_DAYS * 86400)):
+            for dimension, value in keys:
+                for metric, amount in values.items():
+                    if amount:
+                        pipe.hincrby(bucket_key, f"{dimension}:{value}:{metric}", amount)
+            pipe.expire(bucket_key, ttl)
+        pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Could not record LLM usage: {e}")
+
+
+def over_daily_budget():
+    """True when the current user has used up LLM_USER_DAILY_TOKEN_BUDGET today (UTC)."""
+    user_id = _user.get()
+    redis_client = get_redis_client()
+    if not LLM_USER_DAILY_TOKEN_BUDGET or not user_id or not redis_client:
+        return False
+    try:
+        used = redis_client.hget(f"usage:d:{_buckets()[1]}", f"user:{user_id}:tokens")
+    except Exception as e:
+        print(f"⚠️ Could not check token budget for user {user_id}: {e}")
+        return False
+    return int(used or 0) >= LLM_USER_DAILY_TOKEN_BUDGET
+
+
+def _summarize(counters):
+    calls = counters.get("calls", 0)
+    return {
+        "calls": calls,
+        "prompt_tokens": counters.get("prompt_tokens", 0),
+        "completion_tokens": counters.get("completion_tokens", 0),
+        "tokens": counters.get("tokens", 0),
+        "avg_prompt_tokens": round(counters.get("prompt_tokens", 0) / calls, 1) if calls else None,
+        "avg_latency_ms": round(counters.get("latency_ms", 0) / calls, 1) if calls else None,
+        "cost_usd": round(counters.get("cost_micro_usd", 0) / 1e6, 6),
+    }
+
+
+def get_usage(period="day", bucket=None, top_users=20):
+    """
+    Usage for one UTC day (bucket YYYYMMDD) or hour (YYYYMMDDHH), the current one by default:
+    totals, per mode / function / model, and the heaviest users by tokens.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    hour, day = _buckets()
+    bucket = bucket or (hour if period == "hour" else day)
+    raw = redis_client.hgetall(f"usage:{'h' if period == 'hour' else 'd'}:{bucket}")
+
+    grouped = {}
+    for field, value in raw.items():
+        dimension, _, rest = field.partition(":")
+        name, _, metric = rest.rpartition(":")
+        grouped.setdefault(dimension, {}).setdefault(name, {})[metric] = int(value)
+
+    def by(dimension):
+        rows = {name: _summarize(counters) for name, counters in grouped.get(dimension, {}).items()}
+        return dict(sorted(rows.items(), key=lambda item: -item[1]["tokens"]))
+
+    users = by("user")
+    return {
+        "period": period,
+        "bucket": bucket,
+        "totals": _summarize(grouped.get("all", {}).get("all", {})),
+        "by_mode": by("mode"),
+        "by_function": by("function"),
+        "by_model": by("model"),
+        "top_users": [{"user_id": user_id, **row} for user_id, row in list(users.items())[:top_users]],
+        "users_over_budget": sum(1 for row in users.values() if LLM_USER_DAILY_TOKEN_BUDGET
+                                 and row["tokens"] >= LLM_USER_DAILY_TOKEN_BUDGET) if period == "day" else None,
+        "user_daily_token_budget": LLM_USER_DAILY_TOKEN_BUDGET or None,
+    }
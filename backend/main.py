@@ -1,19 +1,40 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Body, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, status, Body, BackgroundTasks, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, noload, load_only
 import uvicorn
 import models, schemas, auth
 from database import engine, get_db
 from redis_client import (
-    get_chat_history, add_message, get_redis_client,
-    create_chat, get_user_chats, delete_chat_session, update_chat_title,
-    get_user_profile, update_user_profile
+    get_chat_history, commit_chat_turn, get_redis_client,
+    create_chat, get_user_chats_page, delete_chat_session,
+    get_user_profile, update_user_profile, get_reward_catalog_stats,
+    bump_versions, chats_scope, history_scope, goals_scope
 )
-from groq_service import get_ai_response, generate_chat_title, decompose_goal, generate_goal_reminder, generate_goal_quiz, generate_personalized_rewards
+from groq_service import get_ai_response, generate_chat_title, generate_goal_reminder, response_cache_versions
 from datetime import datetime, timezone
+from typing import Optional
 import json
+import time
 import emotion_service
+import reward_service
+import archiver
+import search_index
+import jobs
+import migrations
+import goal_stats
+import etags
+import metrics
+import tracing
+import circuit_breaker
+import llm_admission
+import single_flight
+import response_cache
+import llm_usage
+import tasks  # noqa: F401  (registers job handlers for inline fallback)
 
 
 
@@ -34,7 +55,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+# Chat histories and goal lists compress well; small responses are not worth it
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+metrics.instrument_engine(engine)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    with tracing.start_trace(
+        f"{request.method} {request.url.path}", traceparent=request.headers.get("traceparent"),
+        http_method=request.method, http_target=request.url.path
+    ) as span:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            traceparent = tracing.traceparent_header()
+            if traceparent:
+                response.headers["traceparent"] = traceparent
+            return response
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            # Label by route template (/goals/{goal_id}) to keep the series count bounded
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            span.set(http_route=route, http_status_code=status_code)
+            metrics.HTTP_SECONDS.labels(
+                method=request.method, route=route, status=str(status_code)
+            ).observe(time.perf_counter() - start)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+@app.exception_handler(llm_admission.Overloaded)
+async def llm_overloaded_handler(request: Request, exc: llm_admission.Overloaded):
+    """LLM work shed by admission control: 429, and when to try again."""
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": "You're sending messages too quickly, please slow down." if exc.reason == "user_rate"
+            else "Lumina is busy right now, please try again shortly.",
+            "reason": exc.reason,
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 # ----------------------------
@@ -46,7 +115,7 @@ def on_startup():
     try:
         print("🔄 Initializing database...")
         try:
-            models.Base.metadata.create_all(bind=engine)
+            migrations.run_migrations(engine)
             print("✅ Database tables created successfully")
         except Exception as e:
             print(f"❌ Error creating database tables: {e}")
@@ -202,10 +271,30 @@ def create_new_chat(
          raise HTTPException(status_code=503, detail="Chat service unavailable")
     return chat_meta
 
-@app.get("/chats", response_model=list[schemas.ChatMetadata])
-def list_user_chats(current_user: models.User = Depends(auth.get_current_user)):
+@app.get("/chats", response_model=schemas.ChatPage)
+def list_user_chats(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Chats ordered by last activity, one page at a time."""
     user_id = str(current_user.id)
-    return get_user_chats(user_id)
+    not_modified = etags.conditional(request, response, [chats_scope(user_id)])
+    if not_modified:
+        return not_modified
+    chats, next_cursor = get_user_chats_page(user_id, cursor, limit)
+    return {"chats": chats, "next_cursor": next_cursor}
+
+@app.get("/chats/search", response_model=list[schemas.ChatSearchResult])
+def search_user_chats(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Full-text search over the user's chats, best match first."""
+    return search_index.search_chats(str(current_user.id), q, limit)
 
 # ----------------------------
 # Goal Management Routes
@@ -220,14 +309,61 @@ def create_goal(goal: schemas.GoalCreate, current_user: models.User = Depends(au
     db.add(db_goal)
     db.commit()
     db.refresh(db_goal)
+    bump_versions(goals_scope(current_user.id))
     return db_goal
 
-@app.get("/goals", response_model=list[schemas.Goal])
-def read_goals(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    goals = db.query(models.Goal).filter(models.Goal.user_id == current_user.id).all()
-    return goals
+GOAL_FIELDS = set(schemas.GoalProjection.model_fields)
+
+@app.get("/goals", response_model=list[schemas.GoalProjection], response_model_exclude_unset=True)
+def read_goals(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma separated subset of goal fields, e.g. id,title,status,completed_count"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    not_modified = etags.conditional(request, response, [goals_scope(current_user.id)])
+    if not_modified:
+        return not_modified
+
+    if not fields:
+        goals = db.query(models.Goal).filter(models.Goal.user_id == current_user.id).all()
+        return [schemas.Goal.model_validate(g).model_dump() for g in goals]
+
+    requested = {f.strip() for f in fields.split(",") if f.strip()} | {"id"}
+    unknown = requested - GOAL_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown goal fields: {', '.join(sorted(unknown))}")
+
+    # Only select the requested columns; subtask rows are loaded only when asked for
+    columns = [getattr(models.Goal, f) for f in requested if f != "subtasks"]
+    query = db.query(models.Goal).options(load_only(*columns))
+    if "subtasks" not in requested:
+        query = query.options(noload(models.Goal.subtask_rows))
+    goals = query.filter(models.Goal.user_id == current_user.id).all()
+    return [{f: getattr(g, f) for f in requested} for g in goals]
+
+@app.get("/goals/summary", response_model=list[schemas.GoalProgress])
+def read_goal_summary(request: Request, response: Response, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """Completion, current day, overdue subtasks and streak per goal, without any subtask text."""
+    # Current day and streaks move at midnight even without writes
+    today = datetime.now(timezone.utc).date().isoformat()
+    not_modified = etags.conditional(request, response, [goals_scope(current_user.id)], extra=today)
+    if not_modified:
+        return not_modified
+    return goal_stats.goal_progress(db, current_user.id)
+
+@app.get("/goals/{goal_id}/subtasks", response_model=list[schemas.Subtask])
+def read_goal_subtasks(goal_id: int, request: Request, response: Response, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    not_modified = etags.conditional(request, response, [goals_scope(current_user.id)])
+    if not_modified:
+        return not_modified
+    db_goal = db.query(models.Goal).filter(models.Goal.id == goal_id, models.Goal.user_id == current_user.id).first()
+    if not db_goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    return db_goal.subtask_list()
 
-@app.put("/goals/{goal_id}", response_model=schemas.Goal)
+@app.put("/goals/{goal_id}", response_model=schemas.GoalWithJob)
 def update_goal(goal_id: int, goal: schemas.GoalUpdate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
     db_goal = db.query(models.Goal).filter(models.Goal.id == goal_id, models.Goal.user_id == current_user.id).first()
     if not db_goal:
@@ -239,31 +375,98 @@ def update_goal(goal_id: int, goal: schemas.GoalUpdate, current_user: models.Use
     
     db.commit()
     db.refresh(db_goal)
+    bump_versions(goals_scope(current_user.id))
 
     # Reward for Completion (Strict Check)
-    if update_data.get('status') == 'completed' and not db_goal.rewarded:
-        current_user.coins += 50 # Updated: 50 points for goal completion
-        log_coin_transaction(current_user, f"Task '{db_goal.title}' Completed", 50)
-        db_goal.rewarded = True 
-        db.commit()
-        print(f"💰 User rewarded 50 coins for completing goal {goal_id}")
+    if update_data.get('status') == 'completed':
+        reward_goal_completion(db, current_user, db_goal)
+
+    # Check for breakdown completion and queue quiz generation if needed
+    job_id = schedule_goal_quiz(db, current_user, db_goal)
+
+    response = schemas.GoalWithJob.model_validate(db_goal)
+    response.job_id = job_id
+    return response
+
+def reward_goal_completion(db: Session, user: models.User, db_goal: models.Goal):
+    if db_goal.rewarded:
+        return
+    user.coins += 50 # Updated: 50 points for goal completion
+    log_coin_transaction(user, f"Task '{db_goal.title}' Completed", 50)
+    db_goal.rewarded = True
+    db.commit()
+    print(f"💰 User rewarded 50 coins for completing goal {db_goal.id}")
 
-    # Check for breakdown completion and generate quiz if needed
-    if db_goal.subtasks and not db_goal.quiz_content:
-        try:
-             subtasks = json.loads(db_goal.subtasks)
-             if subtasks and all(t.get("completed") for t in subtasks):
-                 # Double check if we should generate quiz
-                 print(f"🎉 Goal {goal_id} completed! Generating quiz...")
-                 quiz_data = generate_goal_quiz(db_goal.title, subtasks)
-                 if quiz_data:
-                     db_goal.quiz_content = json.dumps(quiz_data)
-                     db.commit()
-                     db.refresh(db_goal)
-        except Exception as e:
-            print(f"Error checking goal completion for quiz: {e}")
+def schedule_goal_quiz(db: Session, user: models.User, db_goal: models.Goal):
+    """Queues quiz generation once every subtask is done; returns the job id (None if not queued)."""
+    if db_goal.quiz_content or not db_goal.all_subtasks_completed:
+        return None
+    try:
+        payload = {"user_id": user.id, "goal_id": db_goal.id}
+        job = jobs.enqueue("goal_quiz", payload, user_id=user.id, goal_id=db_goal.id)
+        if job:
+            return job["job_id"]
+        jobs.run_inline("goal_quiz", payload)
+        db.refresh(db_goal)
+    except Exception as e:
+        print(f"Error checking goal completion for quiz: {e}")
+    return None
 
-    return db_goal
+@app.patch("/goals/{goal_id}/subtasks/{index}", response_model=schemas.SubtaskProgress)
+def update_subtask(goal_id: int, index: int, update: schemas.SubtaskUpdate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """
+    Updates a single subtask. Only that row and the goal's counters are written,
+    so a toggle costs the same for a 7 day goal as for a 365 day one.
+    """
+    db_goal = db.query(models.Goal).options(noload(models.Goal.subtask_rows)).filter(
+        models.Goal.id == goal_id, models.Goal.user_id == current_user.id
+    ).first()
+    if not db_goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+
+    subtask = db.query(models.GoalSubtask).filter(
+        models.GoalSubtask.goal_id == goal_id, models.GoalSubtask.position == index
+    ).first()
+    if not subtask:
+        raise HTTPException(status_code=404, detail="Subtask not found")
+
+    if update.text is not None:
+        subtask.text = update.text
+    if update.completed is not None:
+        # Conditional write: of concurrent identical toggles (double-click, retry) only one
+        # changes the row, and only that one moves the goal's counter
+        changed = db.query(models.GoalSubtask).filter(
+            models.GoalSubtask.id == subtask.id,
+            func.coalesce(models.GoalSubtask.completed, False) != update.completed
+        ).update({models.GoalSubtask.completed: update.completed}, synchronize_session=False)
+        if changed == 1:
+            db.query(models.Goal).filter(models.Goal.id == goal_id).update(
+                {models.Goal.completed_count: models.Goal.completed_count + (1 if update.completed else -1)},
+                synchronize_session=False
+            )
+    db.commit()
+    db.refresh(subtask, ["text", "completed"])
+    db.refresh(db_goal, ["status", "subtask_count", "completed_count", "quiz_content", "rewarded"])
+
+    if db_goal.all_subtasks_completed and db_goal.status != "completed":
+        db_goal.status = "completed"
+        db.commit()
+        reward_goal_completion(db, current_user, db_goal)
+    elif not db_goal.all_subtasks_completed and db_goal.status == "completed":
+        db_goal.status = "in_progress"
+        db.commit()
+    bump_versions(goals_scope(current_user.id))
+
+    return schemas.SubtaskProgress(
+        goal_id=goal_id,
+        index=index,
+        text=subtask.text or "",
+        completed=bool(subtask.completed),
+        completed_count=db_goal.completed_count,
+        subtask_count=db_goal.subtask_count,
+        status=db_goal.status,
+        job_id=schedule_goal_quiz(db, current_user, db_goal),
+    )
 
 @app.get("/goals/reminders")
 def get_goal_reminders(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
@@ -293,10 +496,11 @@ def get_goal_reminders(current_user: models.User = Depends(auth.get_current_user
         if days_elapsed <= 0: days_elapsed = 1
         
         # Only meaningful to send reminder if we have a breakdown or at least active
-        subtasks = json.loads(goal.subtasks) if goal.subtasks else []
+        subtasks = goal.subtask_list()
         
         # Generate Reminder
-        message = generate_goal_reminder(goal.title, subtasks, days_elapsed, goal.duration)
+        with llm_usage.for_user(current_user.id):
+            message = generate_goal_reminder(goal.title, subtasks, days_elapsed, goal.duration)
         
         reminders.append({
             "goal_id": goal.id,
@@ -326,39 +530,48 @@ def delete_goal(goal_id: int, current_user: models.User = Depends(auth.get_curre
     
     db.delete(db_goal)
     db.commit()
+    bump_versions(goals_scope(current_user.id))
     return {"status": "deleted"}
 
-@app.post("/goals/{goal_id}/decompose", response_model=schemas.Goal)
+@app.post("/goals/{goal_id}/decompose", response_model=schemas.JobStatus, status_code=202)
 def decompose_goal_endpoint(
     goal_id: int, 
     breakdown_type: str = "daily", 
     current_user: models.User = Depends(auth.get_current_user), 
     db: Session = Depends(get_db)
 ):
+    """Queues the AI breakdown; poll GET /jobs/{job_id} and reload the goal once it succeeds."""
     db_goal = db.query(models.Goal).filter(models.Goal.id == goal_id, models.Goal.user_id == current_user.id).first()
     if not db_goal:
         raise HTTPException(status_code=404, detail="Goal not found")
     
-    # Call AI
-    subtasks_list = decompose_goal(db_goal.title, db_goal.duration, db_goal.duration_unit, breakdown_type)
-    
-    # Update DB
-    db_goal.subtasks = json.dumps(subtasks_list)
-    db_goal.status = "in_progress" # Reset status if it was completed
-    db_goal.quiz_content = None   # Reset quiz since tasks changed
-    # We do NOT reset 'rewarded' status typically to prevent farming, or reset it if meaningful change? 
-    # For now, let's keep rewarded=True if they already got it once for this goal ID.
-    db.commit()
-    db.refresh(db_goal)
-    return db_goal
+    payload = {"user_id": current_user.id, "goal_id": goal_id, "breakdown_type": breakdown_type}
+    job = jobs.enqueue("goal_decompose", payload, user_id=current_user.id, goal_id=goal_id)
+    if job:
+        return job
+
+    # No queue available: run it inline like before
+    result = jobs.run_inline("goal_decompose", payload)
+    return {"job_id": None, "kind": "goal_decompose", "status": "succeeded", "result": result}
+
+# --- Jobs ---
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobStatus)
+def get_job_status(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    job = jobs.get_job(job_id, user_id=current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # --- Rewards ---
 
 @app.get("/users/me/rewards")
 def get_user_rewards(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
     """
-    Generates a large list of 50+ reward items.
-    Uses AI to generate based on favorites if available and not cached.
+    Returns the user's 50+ item reward store.
+    Catalogs are shared between users with the same favorites and generated in the
+    background; while that runs the response has status "generating" and no items,
+    and after a failed build it has status "failed" until the retry.
     """
     
     if current_user.rewards_cache:
@@ -368,34 +581,23 @@ def get_user_rewards(current_user: models.User = Depends(auth.get_current_user),
                   return {
                       "coins": current_user.coins, 
                       "items": cached_items,
-                      "history": json.loads(current_user.coin_history) if current_user.coin_history else []
+                      "history": json.loads(current_user.coin_history) if current_user.coin_history else [],
+                      "status": "ready"
                   }
         except:
              pass 
 
     favs = current_user.favorites
     items = []
-    
-    def get_id(idx): return f"rew_{idx}"
-    idx_counter = 0
+    catalog_status = "ready"
 
     if favs and len(favs.strip()) > 0:
-        print(f"Generating personalized rewards for: {favs}")
-        ai_rewards = generate_personalized_rewards(favs)
-        
-        if ai_rewards:
-            for r in ai_rewards:
-                items.append({
-                    "id": get_id(idx_counter),
-                    "name": r.get("name", "Reward"),
-                    "cost": r.get("cost", 50),
-                    "icon": r.get("icon", "gift"), 
-                    "category": r.get("category", "General")
-                })
-                idx_counter += 1
-    
-    current_user.rewards_cache = json.dumps(items)
-    db.commit()
+        items, catalog_status = reward_service.get_or_schedule_catalog(favs)
+
+    if items:
+        # Keep a per-user copy so later visits skip the shared cache entirely
+        current_user.rewards_cache = json.dumps(items)
+        db.commit()
             
     current_history = json.loads(current_user.coin_history) if current_user.coin_history else []
     
@@ -432,7 +634,12 @@ def get_user_rewards(current_user: models.User = Depends(auth.get_current_user),
         db.commit()
         current_history = backfilled_txns
 
-    return {"coins": current_user.coins, "items": items, "history": current_history}
+    return {"coins": current_user.coins, "items": items, "history": current_history, "status": catalog_status}
+
+@app.get("/admin/rewards/cache")
+def reward_cache_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Hit ratio and generation latency of the shared reward catalog cache."""
+    return get_reward_catalog_stats()
 
 @app.post("/users/me/redeem")
 def redeem_reward(
@@ -451,13 +658,58 @@ def redeem_reward(
 @app.delete("/chats/{chat_id}")
 def delete_chat_endpoint(
     chat_id: str,
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
 ):
     user_id = str(current_user.id)
     # Check ownership ideally, but for now assuming if user has ID they can delete from their list
     delete_chat_session(user_id, chat_id)
+    db.query(models.ChatArchive).filter(
+        models.ChatArchive.chat_id == chat_id, models.ChatArchive.user_id == current_user.id
+    ).delete()
+    db.commit()
     return {"status": "deleted"}
 
+@app.get("/admin/chats/archive")
+def chat_archive_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Redis memory reclaimed by the chat archiver and rehydration latency."""
+    return archiver.get_archive_stats()
+
+@app.get("/admin/llm/breakers")
+def llm_breaker_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Circuit breaker state and rolling error/slow-call rates per LLM model."""
+    return circuit_breaker.get_breaker_stats()
+
+@app.get("/admin/llm/admission")
+def llm_admission_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Upstream slots in use and queued callers per LLM model."""
+    return llm_admission.get_admission_stats()
+
+@app.get("/admin/llm/single-flight")
+def llm_single_flight_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Duplicate generations coalesced onto one in-flight call: upstream calls saved per function."""
+    return single_flight.get_single_flight_stats()
+
+@app.get("/admin/llm/response-cache")
+def llm_response_cache_stats(admin: models.User = Depends(auth.get_current_admin)):
+    """Hit rate of the semantic response cache and the age of the answers it served."""
+    return response_cache.get_response_cache_stats(response_cache_versions())
+
+@app.get("/admin/usage")
+def llm_usage_report(
+    period: str = Query("day", pattern="^(day|hour)$"),
+    bucket: Optional[str] = Query(None, description="UTC YYYYMMDD (day) or YYYYMMDDHH (hour); the current one by default"),
+    top: int = Query(20, ge=1, le=200),
+    admin: models.User = Depends(auth.get_current_admin)
+):
+    """LLM tokens, latency and cost per mode, function, model and user."""
+    return llm_usage.get_usage(period, bucket, top)
+
+@app.delete("/admin/llm/response-cache")
+def clear_llm_response_cache(admin: models.User = Depends(auth.get_current_admin)):
+    """Drops every cached answer, e.g. after fixing a bad one."""
+    return {"status": "cleared", "keys_deleted": response_cache.clear()}
+
 @app.get("/users/me/profile")
 def get_user_profile_endpoint(current_user: models.User = Depends(auth.get_current_user)):
     user_id = str(current_user.id)
@@ -480,31 +732,56 @@ def update_user_profile_endpoint(
 # Chat Interaction Routes
 # ----------------------------
 
+def schedule_chat_side_effects(background_tasks: BackgroundTasks, user_id: int, payload: dict):
+    """
+    Runs the chat_side_effects job once the response has been sent and returns its
+    pending status; clients poll GET /jobs/{job_id} to learn when it landed.
+    """
+    try:
+        job = jobs.claim("chat_side_effects", payload, user_id=user_id)
+    except Exception as e:
+        print(f"⚠️ Could not record chat side-effects job: {e}")
+        job = None
+    if job:
+        background_tasks.add_task(jobs.process_job, job["job_id"])
+        return job
+    # No Redis to track it: still write after replying, without a status to poll
+    background_tasks.add_task(jobs.run_inline, "chat_side_effects", payload)
+    return {"job_id": None, "kind": "chat_side_effects", "status": "queued"}
+
 @app.post("/chat", response_model=schemas.ChatResponse)
+@metrics.CHAT_IN_FLIGHT.track_inprogress()
 def chat_endpoint(
     request: schemas.ChatRequest,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     user_id = str(current_user.id)
     chat_id = request.chat_id
     user_message = request.message
+    timer = metrics.StageTimer()
+
+    # 429 once the user is over their chat rate, before doing any work
+    llm_admission.admit_user(user_id)
     
     # Clean expired memories on every interaction (or could be moved to specific login hooks)
     from redis_client import clean_expired_facts
-    clean_expired_facts(user_id)
+    with timer.stage("clean_facts"):
+        clean_expired_facts(user_id)
     
     # --- Emotion Tracking ---
     # Analyze and Log current emotion
-    emotion, score = emotion_service.analyze_emotion(user_message)
-    if emotion:
-        emotion_service.log_emotion(db, current_user.id, emotion, score)
+    with timer.stage("emotion_inference"):
+        emotion, score = emotion_service.analyze_emotion(user_message)
     
-    # Get Recent Emotion Context
-    emotion_summary = emotion_service.get_recent_emotions_summary(db, current_user.id)
+    # Get Recent Emotion Context (the current emotion is logged after the reply)
+    with timer.stage("emotion_summary"):
+        emotion_summary = emotion_service.get_recent_emotions_summary(db, current_user.id, current=(emotion, score))
     
     # Get User Profile Context
-    user_profile = get_user_profile(user_id)
+    with timer.stage("profile"):
+        user_profile = get_user_profile(user_id)
     
     # Combine Profile + Emotion for context
     combined_context = user_profile
@@ -512,92 +789,18 @@ def chat_endpoint(
         combined_context = (combined_context or "") + "\n\n" + emotion_summary
 
     # Get History (for specific chat)
-    history = get_chat_history(chat_id)
+    with timer.stage("history"):
+        history = get_chat_history(chat_id)
     
-    # Get AI Response (with combined context)
-    ai_text, title_from_ai, new_facts, mode, suggested_goal = get_ai_response(
-        history, 
-        user_message, 
-        combined_context,
-        user_name=current_user.full_name
-    )
-    
-    # Save Context
-    add_message(chat_id, "user", user_message)
-    add_message(chat_id, "model", ai_text)
+    # Get AI Response (with combined context); includes the classify_request call
+    with timer.stage("llm"), llm_usage.for_user(user_id):
+        ai_text, title_from_ai, new_facts, mode, suggested_goal = get_ai_response(
+            history, 
+            user_message, 
+            combined_context,
+            user_name=current_user.full_name
+        )
     
-    # Update Profile (Directly from response)
-    memory_updated = False
-    if new_facts:
-        # Ensure new_facts is a string
-        if isinstance(new_facts, dict):
-            new_facts_str = "\n".join([f"{k}: {v}" for k, v in new_facts.items()])
-        elif isinstance(new_facts, list):
-             new_facts_str = "\n".join([str(f) for f in new_facts])
-        else:
-            new_facts_str = str(new_facts)
-
-        # Append new facts to existing profile
-        if not user_profile or new_facts_str not in user_profile:
-             updated_profile = user_profile + "\n" + new_facts_str if user_profile else new_facts_str
-             update_user_profile(user_id, updated_profile)
-             memory_updated = True
-
-    # Auto-Create Goal
-    created_goal_title = None
-    if suggested_goal:
-        print(f"🎯 Auto-creating goal input: {suggested_goal}")
-        try:
-            # Handle case where AI returns just a string instead of dict
-            if isinstance(suggested_goal, str):
-                import re
-                # Try to extract duration from the string itself as a fallback
-                title_text = suggested_goal
-                duration = 7
-                unit = "days"
-                
-                # Regex for "1 week", "2 days", etc.
-                match = re.search(r'(\d+)\s*(day|week|month)s?', title_text, re.IGNORECASE)
-                if match:
-                    try:
-                        duration = int(match.group(1))
-                        unit_str = match.group(2).lower()
-                        if "day" in unit_str: unit = "days"
-                        elif "week" in unit_str: unit = "weeks"
-                        elif "month" in unit_str: unit = "months"
-                        
-                        # Convert weeks/months to days for consistency if preferred, 
-                        # but our model supports units, so keep them.
-                    except:
-                        pass
-
-                goal_data = {
-                    "title": title_text,
-                    "duration": duration,
-                    "duration_unit": unit,
-                    "priority": "Medium"
-                }
-            elif isinstance(suggested_goal, dict):
-                 goal_data = suggested_goal
-            else:
-                 raise ValueError("Invalid format for suggested_goal")
-
-            created_goal_title = goal_data.get("title", "New Goal")
-            new_goal = models.Goal(
-                user_id=current_user.id,
-                title=created_goal_title,
-                duration=goal_data.get("duration", 7),
-                duration_unit=goal_data.get("duration_unit", "days"),
-                priority=goal_data.get("priority", "Medium"),
-                description="Auto-generated from chat conversation",
-                subtasks=json.dumps([])
-            )
-            db.add(new_goal)
-            db.commit()
-        except Exception as e:
-            print(f"❌ Failed to auto-create goal: {e}")
-            created_goal_title = None
-
     # Generate Title (if it's the first message)
     new_title = None
     if len(history) == 0:
@@ -606,21 +809,42 @@ def chat_endpoint(
         else:
              # Fallback to local fast generation if AI didn't provide one
              new_title = generate_chat_title(user_message)
-        
-        update_chat_title(user_id, chat_id, new_title)
 
+    # Save Context: both messages + title in one atomic Redis round-trip
+    with timer.stage("commit_turn"):
+        commit_chat_turn(user_id, chat_id, user_message, ai_text, new_title)
+    
+    # Emotion log, profile facts and auto goal are written after the reply is sent
+    side_effects = None
+    if emotion or new_facts or suggested_goal:
+        with timer.stage("schedule_side_effects"):
+            side_effects = schedule_chat_side_effects(background_tasks, current_user.id, {
+                "user_id": current_user.id,
+                "emotion": emotion,
+                "score": score,
+                "new_facts": new_facts,
+                "suggested_goal": suggested_goal,
+            })
+
+    timer.finish(mode)
+    tracing.current_span().set(chat_mode=mode, chat_id=chat_id, user_id=current_user.id)
     return schemas.ChatResponse(
         response=ai_text, 
         chat_id=chat_id, 
         title=new_title, 
         mode=mode,
-        memory_updated=memory_updated,
-        goal_created=created_goal_title
+        side_effects=side_effects
     )
 
 @app.get("/chats/{chat_id}/history")
 def get_chat_history_endpoint(
     chat_id: str,
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0, description="Only return messages from this index on"),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    return get_chat_history(chat_id)
+    not_modified = etags.conditional(request, response, [history_scope(chat_id)])
+    if not_modified:
+        return not_modified
+    return get_chat_history(chat_id, since)
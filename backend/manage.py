@@ -0,0 +1,81 @@
+"""
+Maintenance commands.
+
+    python manage.py migrate
+    python manage.py migrate-chat-index
+    python manage.py reencode-chats
+    python manage.py archive-chats [--idle-days N]
+    python manage.py reindex-search
+    python manage.py reconcile-facts
+"""
+import argparse
+import redis_client
+import archiver
+import search_index
+import fact_store
+import migrations
+from database import engine
+from config import CHAT_CODEC
+
+
+def migrate(args):
+    applied = migrations.run_migrations(engine)
+    print(f"✅ Applied {len(applied)} migrations" if applied else "✅ Database schema is up to date")
+
+
+def migrate_chat_index(args):
+    migrated = redis_client.migrate_all_chat_indexes()
+    print(f"✅ Indexed {migrated} chats into the recency sorted sets")
+
+
+def reencode_chats(args):
+    reencoded = redis_client.reencode_all_chats()
+    print(f"✅ Re-encoded {reencoded} messages with the '{CHAT_CODEC}' codec")
+
+
+def archive_chats(args):
+    idle_seconds = int(args.idle_days * 24 * 3600) if args.idle_days is not None else archiver.CHAT_ARCHIVE_IDLE_SECONDS
+    total = {"archived": 0, "bytes_reclaimed": 0}
+    while True:
+        result = archiver.archive_idle_chats(idle_seconds=idle_seconds)
+        if not result["archived"]:
+            break
+        total["archived"] += result["archived"]
+        total["bytes_reclaimed"] += result["bytes_reclaimed"]
+    print(f"✅ Archived {total['archived']} chats, reclaimed {total['bytes_reclaimed'] / 1024:.1f} KiB")
+
+
+def reindex_search(args):
+    indexed = search_index.reindex_all()
+    print(f"✅ Indexed {indexed} messages for chat search")
+
+
+def reconcile_facts(args):
+    fact_store.flush_dirty_facts()
+    result = fact_store.reconcile_all_facts()
+    if result.get("skipped"):
+        print("⚠️ A worker is reconciling facts right now; try again later")
+        return
+    print(f"✅ {result['persisted']} users persisted to Postgres, {result['restored']} restored into Redis")
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "migrate-chat-index": migrate_chat_index,
+    "reencode-chats": reencode_chats,
+    "archive-chats": archive_chats,
+    "reindex-search": reindex_search,
+    "reconcile-facts": reconcile_facts,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lumina maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--idle-days", type=float, default=None)
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
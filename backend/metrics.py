@@ -0,0 +1,199 @@
+"""
+Prometheus metrics (served at GET /metrics).
+
+    lumina_http_requests_in_flight            gauge
+    lumina_http_request_duration_seconds      histogram  method, route, status
+    lumina_chat_stage_duration_seconds        histogram  stage, mode
+    lumina_chat_in_flight                     gauge
+    lumina_llm_call_duration_seconds          histogram  function, model, mode, outcome
+    lumina_llm_calls_in_flight                gauge      model
+    lumina_llm_retries_total                  counter    model, reason
+    lumina_llm_fallbacks_total                counter    function, from_model, to_model
+    lumina_llm_breaker_rejections_total       counter    model
+    lumina_llm_breaker_transitions_total      counter    model, state
+    lumina_llm_admission_wait_seconds         histogram  model, priority (interactive|background)
+    lumina_llm_shed_total                     counter    reason, priority
+    lumina_llm_single_flight_total            counter    function, role (leader|coalesced)
+    lumina_llm_tokens_total                   counter    function, model, kind (prompt|completion)
+    lumina_llm_budget_downgrades_total        counter    function
+    lumina_llm_hedges_total                   counter    mode, model
+    lumina_llm_hedge_wins_total               counter    mode, winner (primary|hedge)
+    lumina_llm_hedge_call_seconds             histogram  mode, path (hedged|primary_only)
+    lumina_emotion_inference_seconds          histogram
+    lumina_redis_command_duration_seconds     histogram  command
+    lumina_sql_query_duration_seconds         histogram  operation
+
+Histograms expose `_count`, so they double as call counters. Hedge rate is
+hedges_total / hedge_call_seconds_count{path="hedged"}; comparing the p99 of the
+two hedge_call_seconds paths gives the tail latency hedging saves. When several
+uvicorn workers run, set PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them.
+"""
+import os
+import time
+from contextlib import contextmanager
+import redis
+import tracing
+from redis.client import Pipeline
+from sqlalchemy import event
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+
+# Redis and SQL calls are sub-millisecond to a few ms; LLM calls take seconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+HTTP_IN_FLIGHT = Gauge("lumina_http_requests_in_flight", "HTTP requests being served", multiprocess_mode="livesum")
+HTTP_SECONDS = Histogram(
+    "lumina_http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], buckets=SLOW_BUCKETS
+)
+CHAT_IN_FLIGHT = Gauge("lumina_chat_in_flight", "/chat requests being served", multiprocess_mode="livesum")
+CHAT_STAGE_SECONDS = Histogram(
+    "lumina_chat_stage_duration_seconds", "Time spent in each stage of /chat", ["stage", "mode"], buckets=SLOW_BUCKETS
+)
+LLM_IN_FLIGHT = Gauge("lumina_llm_calls_in_flight", "LLM calls waiting for a response", ["model"], multiprocess_mode="livesum")
+LLM_SECONDS = Histogram(
+    "lumina_llm_call_duration_seconds", "LLM completion latency",
+    ["function", "model", "mode", "outcome"], buckets=SLOW_BUCKETS
+)
+LLM_RETRIES = Counter("lumina_llm_retries_total", "LLM attempts retried on the same model", ["model", "reason"])
+LLM_FALLBACKS = Counter(
+    "lumina_llm_fallbacks_total", "LLM calls moved to the next model of the fallback chain", ["function", "from_model", "to_model"]
+)
+LLM_BREAKER_REJECTIONS = Counter("lumina_llm_breaker_rejections_total", "LLM calls that skipped a model with an open circuit", ["model"])
+LLM_BREAKER_TRANSITIONS = Counter("lumina_llm_breaker_transitions_total", "Circuit breaker state changes seen by this process", ["model", "state"])
+LLM_ADMISSION_WAIT_SECONDS = Histogram(
+    "lumina_llm_admission_wait_seconds", "Time spent queued for an upstream slot", ["model", "priority"], buckets=SLOW_BUCKETS
+)
+LLM_SHED = Counter("lumina_llm_shed_total", "LLM work rejected by admission control", ["reason", "priority"])
+LLM_SINGLE_FLIGHT = Counter(
+    "lumina_llm_single_flight_total", "Coalescable generations: leaders called upstream, the rest reused a result",
+    ["function", "role"]
+)
+LLM_TOKENS = Counter("lumina_llm_tokens_total", "Tokens billed by the LLM provider", ["function", "model", "kind"])
+LLM_BUDGET_DOWNGRADES = Counter(
+    "lumina_llm_budget_downgrades_total", "Calls served by the primary model because the user is over budget", ["function"]
+)
+LLM_HEDGES = Counter("lumina_llm_hedges_total", "Hedge requests fired at the fallback model", ["mode", "model"])
+LLM_HEDGE_WINS = Counter("lumina_llm_hedge_wins_total", "Which request of a hedged pair answered first", ["mode", "winner"])
+# "hedged" is what callers waited; "primary_only" is when the chosen model answered (what they would have waited)
+LLM_HEDGE_CALL_SECONDS = Histogram(
+    "lumina_llm_hedge_call_seconds", "Latency of hedge-eligible LLM calls", ["mode", "path"], buckets=SLOW_BUCKETS
+)
+EMOTION_SECONDS = Histogram("lumina_emotion_inference_seconds", "Emotion model inference time", buckets=SLOW_BUCKETS)
+REDIS_SECONDS = Histogram(
+    "lumina_redis_command_duration_seconds", "Redis command (or pipeline) latency", ["command"], buckets=FAST_BUCKETS
+)
+SQL_SECONDS = Histogram(
+    "lumina_sql_query_duration_seconds", "SQL statement latency", ["operation"], buckets=FAST_BUCKETS
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+
+class StageTimer:
+    """
+    Times the stages of one /chat request (and traces each as a span). The mode
+    is only known after the LLM call, so durations are collected first and
+    observed by finish(mode).
+    """
+
+    def __init__(self):
+        self.durations = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"chat.{name}"):
+                yield
+        finally:
+            self.durations.append((name, time.perf_counter() - start))
+
+    def finish(self, mode):
+        for name, seconds in self.durations:
+            CHAT_STAGE_SECONDS.labels(stage=name, mode=mode or "unknown").observe(seconds)
+
+
+@contextmanager
+def llm_call(function, model, mode=None):
+    """Wraps one completion request; outcome is 'error' if it raised."""
+    gauge = LLM_IN_FLIGHT.labels(model=model)
+    gauge.inc()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        gauge.dec()
+        LLM_SECONDS.labels(function=function, model=model, mode=mode or "", outcome=outcome).observe(
+            time.perf_counter() - start
+        )
+
+
+# --- Redis ---
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        command = "MULTI" if self.transaction else "PIPELINE"
+        with tracing.span(f"redis {command}", db_system="redis", commands=len(self.command_stack)):
+            with timed(REDIS_SECONDS, command=command):
+                return super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that records the latency (and a trace span) of every command it sends."""
+
+    def execute_command(self, *args, **options):
+        command = str(args[0]).split(" ")[0].upper()
+        with tracing.span(f"redis {command}", db_system="redis", db_key=str(args[1]) if len(args) > 1 else None):
+            with timed(REDIS_SECONDS, command=command):
+                return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# --- SQLAlchemy ---
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(" ", 1)[0].upper() or "OTHER"
+        span = tracing.start_span(f"sql {operation}", db_system=engine.dialect.name, db_statement=statement[:1000])
+        conn.info.setdefault("query_start", []).append((time.perf_counter(), operation, span))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        start, operation, span = conn.info["query_start"].pop()
+        SQL_SECONDS.labels(operation=operation).observe(time.perf_counter() - start)
+        tracing.end_span(span)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute does not fire for failed statements
+        if context.connection is not None and context.connection.info.get("query_start"):
+            _, _, span = context.connection.info["query_start"].pop()
+            tracing.end_span(span, error=str(context.original_exception))
+
+
+# --- Exposition ---
+
+def render_latest():
+    """Returns (body, content_type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
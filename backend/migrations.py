@@ -0,0 +1,101 @@
+"""
+Versioned schema migrations.
+
+create_all only creates missing tables, so anything added to an existing table
+(columns, indexes) goes here as a numbered migration. Applied versions are
+recorded in `schema_migrations`; run_migrations applies the pending ones in
+order and is safe to call on every startup (see main.on_startup and
+`python manage.py migrate`).
+"""
+import json
+from sqlalchemy import inspect, text
+import models
+
+MIGRATION_LOCK_ID = 72_114_035  # pg_advisory_lock key shared by all API/worker processes
+
+
+def _has_column(conn, table, column):
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def add_user_facts_expires_at(conn):
+    if not _has_column(conn, "user_facts", "expires_at"):
+        conn.execute(text("ALTER TABLE user_facts ADD COLUMN expires_at TIMESTAMP WITH TIME ZONE"))
+
+
+def add_hot_query_indexes(conn):
+    # Same names as the Index() declarations in models.py, so fresh databases
+    # created by create_all already have them and IF NOT EXISTS skips them.
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_goals_user_id_status ON goals (user_id, status)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_emotion_logs_user_id_timestamp ON emotion_logs (user_id, timestamp)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_facts_user_id ON user_facts (user_id)"))
+
+
+def normalize_goal_subtasks(conn, batch_size=500):
+    """Moves the goals.subtasks JSON blobs into goal_subtasks rows plus counters."""
+    for column in ("subtask_count", "completed_count"):
+        if not _has_column(conn, "goals", column):
+            conn.execute(text(f"ALTER TABLE goals ADD COLUMN {column} INTEGER DEFAULT 0"))
+    conn.execute(text("UPDATE goals SET subtask_count = 0, completed_count = 0 WHERE subtask_count IS NULL"))
+
+    moved = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, subtasks FROM goals WHERE subtasks IS NOT NULL ORDER BY id LIMIT :n"),
+            {"n": batch_size}
+        ).fetchall()
+        if not rows:
+            break
+        for goal_id, blob in rows:
+            try:
+                items = json.loads(blob) if blob else []
+            except ValueError:
+                items = []
+            subtasks = [models.GoalSubtask.from_item(i, item) for i, item in enumerate(items)]
+            if subtasks:
+                conn.execute(
+                    text("INSERT INTO goal_subtasks (goal_id, position, text, completed) VALUES (:g, :p, :t, :c)"),
+                    [{"g": goal_id, "p": s.position, "t": s.text, "c": s.completed} for s in subtasks]
+                )
+            conn.execute(
+                text("UPDATE goals SET subtasks = NULL, subtask_count = :n, completed_count = :c WHERE id = :g"),
+                {"n": len(subtasks), "c": sum(1 for s in subtasks if s.completed), "g": goal_id}
+            )
+        moved += len(rows)
+    if moved:
+        print(f"🛠️ Moved the subtasks of {moved} goals into goal_subtasks")
+
+
+MIGRATIONS = [
+    ("0001_user_facts_expires_at", add_user_facts_expires_at),
+    ("0002_hot_query_indexes", add_hot_query_indexes),
+    ("0003_goal_subtasks", normalize_goal_subtasks),
+]
+
+
+def applied_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(64) PRIMARY KEY, "
+        "applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """Creates missing tables, then applies pending migrations. Returns the versions applied."""
+    applied = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Several uvicorn workers start at once; only one may migrate
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        models.Base.metadata.create_all(bind=conn)
+        done = applied_versions(conn)
+        for version, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:v)"), {"v": version})
+            applied.append(version)
+            print(f"🛠️ Applied migration {version}")
+    return applied
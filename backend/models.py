@@ -1,4 +1,6 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Text
+import json
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Text, LargeBinary, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 
@@ -25,6 +27,11 @@ class EmotionLog(Base):
     score = Column(Float)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # get_recent_emotions_summary: user_id = ? AND timestamp >= ? ORDER BY timestamp DESC
+        Index("ix_emotion_logs_user_id_timestamp", "user_id", "timestamp"),
+    )
+
 class Goal(Base):
     __tablename__ = "goals"
 
@@ -37,10 +44,62 @@ class Goal(Base):
     priority = Column(String)  # 'High', 'Medium', 'Low'
     status = Column(String, default="not_started")  # 'not_started', 'in_progress', 'completed'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    subtasks = Column(Text, nullable=True)  # JSON string of subtasks
+    legacy_subtasks = Column("subtasks", Text, nullable=True)  # Pre-0003 JSON blob, moved to goal_subtasks by migrations
+    subtask_count = Column(Integer, default=0)
+    completed_count = Column(Integer, default=0)
     quiz_content = Column(Text, nullable=True) # JSON string of generated quiz
     rewarded = Column(Boolean, default=False)
 
+    subtask_rows = relationship(
+        "GoalSubtask", order_by="GoalSubtask.position", cascade="all, delete-orphan", lazy="selectin"
+    )
+
+    @property
+    def subtasks(self):
+        """JSON string of subtasks, the shape the API has always exposed."""
+        return json.dumps([{"text": s.text, "completed": bool(s.completed)} for s in self.subtask_rows])
+
+    @subtasks.setter
+    def subtasks(self, value):
+        # Replaces the whole breakdown (decomposition, edits); single toggles go
+        # through PATCH /goals/{id}/subtasks/{index} instead
+        items = json.loads(value) if isinstance(value, str) else (value or [])
+        self.subtask_rows = [GoalSubtask.from_item(i, item) for i, item in enumerate(items)]
+        self.subtask_count = len(self.subtask_rows)
+        self.completed_count = sum(1 for s in self.subtask_rows if s.completed)
+
+    def subtask_list(self):
+        return json.loads(self.subtasks)
+
+    @property
+    def all_subtasks_completed(self):
+        return bool(self.subtask_count) and self.completed_count >= self.subtask_count
+
+    __table_args__ = (
+        # read_goals (user_id = ?) and get_goal_reminders (user_id = ? AND status != ?)
+        Index("ix_goals_user_id_status", "user_id", "status"),
+    )
+
+class GoalSubtask(Base):
+    __tablename__ = "goal_subtasks"
+
+    id = Column(Integer, primary_key=True)
+    goal_id = Column(Integer, ForeignKey("goals.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    text = Column(Text)
+    completed = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_goal_subtasks_goal_id_position", "goal_id", "position"),
+    )
+
+    @classmethod
+    def from_item(cls, position, item):
+        # Older breakdowns sometimes stored bare strings instead of objects
+        if isinstance(item, dict):
+            return cls(position=position, text=str(item.get("text", "")), completed=bool(item.get("completed")))
+        return cls(position=position, text=str(item), completed=False)
+
 class UserFact(Base):
     __tablename__ = "user_facts"
 
@@ -48,3 +107,18 @@ class UserFact(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     fact_text = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_user_facts_user_id", "user_id"),
+    )
+
+class ChatArchive(Base):
+    __tablename__ = "chat_archives"
+
+    chat_id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    message_count = Column(Integer, default=0)
+    data = Column(LargeBinary)  # zlib compressed JSON list of {"role", "parts"} messages
+    last_active = Column(Float)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -2,21 +2,68 @@ import redis
 import json
 import uuid
 import time
-from config import REDIS_HOST, REDIS_PORT
+import hashlib
+from config import (
+    REDIS_HOST, REDIS_PORT,
+    REWARD_CATALOG_TTL_SECONDS, REWARD_CATALOG_EMPTY_TTL_SECONDS, REWARD_CATALOG_LOCK_SECONDS
+)
+from chat_codec import encode_message, decode_message
+from metrics import InstrumentedRedis
 
 try:
-    redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    redis_client = InstrumentedRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
     redis_client.ping()
+    # Chat message lists hold binary codec payloads, so they use a non-decoding client
+    redis_bin = InstrumentedRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=False)
     print("Connected to Redis")
 except redis.ConnectionError:
     print("Could not connect to Redis. Make sure it is running.")
     redis_client = None
+    redis_bin = None
 
 def get_redis_client():
     return redis_client
 
+def get_redis_binary_client():
+    return redis_bin
+
+# --- Resource Versions ---
+# Counters bumped on every write to a resource; GET endpoints derive their ETag
+# from them so unchanged polls can be answered with 304 (see etags.py).
+
+def version_key(scope: str):
+    return f"version:{scope}"
+
+def chats_scope(user_id):
+    return f"user:{user_id}:chats"
+
+def history_scope(chat_id):
+    return f"chat:{chat_id}:messages"
+
+def goals_scope(user_id):
+    return f"user:{user_id}:goals"
+
+def get_versions(*scopes):
+    """Current version of each scope, or None when Redis is unavailable."""
+    if not redis_client:
+        return None
+    return [int(v or 0) for v in redis_client.mget([version_key(s) for s in scopes])]
+
+def bump_versions(*scopes):
+    if not redis_client:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for scope in scopes:
+        pipe.incr(version_key(scope))
+    pipe.execute()
+
 # --- Chat Management ---
 
+# Global recency index used by the archiver. Member: "{user_id}:{chat_id}"  Score: last activity
+CHAT_ACTIVITY_KEY = "chats:activity"
+# Chats whose history lives in Postgres (chat_archives); Redis may hold a TTL'd copy
+ARCHIVED_CHATS_KEY = "chats:archived"
+
 def create_chat(user_id: str, title: str = "New Chat"):
     if not redis_client:
         return None
@@ -28,37 +75,126 @@ def create_chat(user_id: str, title: str = "New Chat"):
     metadata = {
         "id": chat_id,
         "title": title,
-        "created_at": timestamp
+        "created_at": timestamp,
+        "last_active": timestamp
     }
     
     # Add to user's list of chats (using a Hash for O(1) access/update)
     # Key: user:{user_id}:chats  Field: chat_id  Value: JSON(metadata)
-    redis_client.hset(f"user:{user_id}:chats", chat_id, json.dumps(metadata))
+    # plus the recency index used for paginated listing
+    # Key: user:{user_id}:chats:recent  Member: chat_id  Score: last activity
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(f"user:{user_id}:chats", chat_id, json.dumps(metadata))
+    pipe.zadd(f"user:{user_id}:chats:recent", {chat_id: timestamp})
+    pipe.zadd(CHAT_ACTIVITY_KEY, {f"{user_id}:{chat_id}": timestamp})
+    pipe.incr(version_key(chats_scope(user_id)))
+    pipe.execute()
     
     return metadata
 
-def get_user_chats(user_id: str):
+def migrate_chat_index(user_id: str):
+    """
+    Builds the recency sorted set from the metadata hash for chats created before
+    the index existed. Cheap no-op (ZCARD + HLEN) once the user is migrated.
+    """
     if not redis_client:
-        return []
-    
-    # Get all fields from the hash
+        return 0
+
+    pipe = redis_client.pipeline()
+    pipe.zcard(f"user:{user_id}:chats:recent")
+    pipe.hlen(f"user:{user_id}:chats")
+    indexed, total = pipe.execute()
+    if indexed >= total:
+        return 0
+
     chats_raw = redis_client.hgetall(f"user:{user_id}:chats")
-    
-    # Convert to list and sort by created_at (descending)
-    chats = [json.loads(data) for data in chats_raw.values()]
-    chats.sort(key=lambda x: x['created_at'], reverse=True)
-    
+    scores = {}
+    for chat_id, data in chats_raw.items():
+        meta = json.loads(data)
+        scores[chat_id] = meta.get("last_active", meta["created_at"])
+    # NX keeps the scores of chats already indexed by newer writes
+    redis_client.zadd(f"user:{user_id}:chats:recent", scores, nx=True)
+    redis_client.zadd(CHAT_ACTIVITY_KEY, {f"{user_id}:{c}": score for c, score in scores.items()}, nx=True)
+    return total - indexed
+
+def migrate_all_chat_indexes():
+    """One-off backfill of the recency index for every user (see manage.py)."""
+    if not redis_client:
+        return 0
+
+    migrated = 0
+    for key in redis_client.scan_iter(match="user:*:chats", count=500):
+        migrated += migrate_chat_index(key.split(":")[1])
+    return migrated
+
+def get_user_chats(user_id: str):
+    """All chats of a user, most recently active first."""
+    chats, _ = get_user_chats_page(user_id, limit=-1)
     return chats
 
+def get_user_chats_page(user_id: str, cursor: str = None, limit: int = 50):
+    """
+    One page of a user's chats ordered by last activity (newest first).
+    cursor is the `next_cursor` returned by the previous page ("{score}:{chat_id}" of
+    its last chat, so chats sharing that score are not skipped). Cost is proportional
+    to the page size, not to the number of chats.
+    Returns (chats, next_cursor).
+    """
+    if not redis_client:
+        return [], None
+
+    migrate_chat_index(user_id)
+    key = f"user:{user_id}:chats:recent"
+
+    max_score, skip = "+inf", 0
+    if cursor:
+        score, _, last_chat_id = str(cursor).partition(":")
+        max_score = score
+        if last_chat_id:
+            # Equal scores come in descending member order: skip the ties up to and including the cursor's chat
+            skip = sum(1 for member in redis_client.zrangebyscore(key, score, score) if member >= last_chat_id)
+        else:
+            max_score = f"({score}"  # bare score from an older client
+
+    if limit > 0:
+        entries = redis_client.zrevrangebyscore(key, max_score, "-inf", start=skip, num=limit + 1, withscores=True)
+    else:
+        entries = redis_client.zrevrangebyscore(key, max_score, "-inf", withscores=True)[skip:]
+
+    has_more = limit > 0 and len(entries) > limit
+    entries = entries[:limit] if has_more else entries
+    if not entries:
+        return [], None
+
+    metas = redis_client.hmget(f"user:{user_id}:chats", [chat_id for chat_id, _ in entries])
+    chats = []
+    for (chat_id, score), raw in zip(entries, metas):
+        if raw is None:
+            continue
+        meta = json.loads(raw)
+        meta["last_active"] = score
+        chats.append(meta)
+
+    next_cursor = f"{entries[-1][1]!r}:{entries[-1][0]}" if has_more else None
+    return chats, next_cursor
+
 def delete_chat_session(user_id: str, chat_id: str):
     if not redis_client:
         return
+
+    from search_index import remove_chat
+    remove_chat(user_id, chat_id)
     
-    # 1. Remove from user's list
-    redis_client.hdel(f"user:{user_id}:chats", chat_id)
-    
-    # 2. Delete the message history
-    redis_client.delete(f"chat:{chat_id}:messages")
+    # Remove from user's list and delete the message history in one MULTI/EXEC
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hdel(f"user:{user_id}:chats", chat_id)
+    pipe.zrem(f"user:{user_id}:chats:recent", chat_id)
+    pipe.zrem(CHAT_ACTIVITY_KEY, f"{user_id}:{chat_id}")
+    pipe.srem(ARCHIVED_CHATS_KEY, chat_id)
+    pipe.delete(f"chat:{chat_id}:messages")
+    pipe.incr(version_key(chats_scope(user_id)))
+    pipe.incr(version_key(history_scope(chat_id)))
+    pipe.execute()
 
 def update_chat_title(user_id: str, chat_id: str, new_title: str):
     if not redis_client:
@@ -70,26 +206,181 @@ def update_chat_title(user_id: str, chat_id: str, new_title: str):
         meta = json.loads(raw_meta)
         meta['title'] = new_title
         redis_client.hset(f"user:{user_id}:chats", chat_id, json.dumps(meta))
+        bump_versions(chats_scope(user_id))
 
 # --- Message History ---
 
-def get_chat_history(chat_id: str):
+def get_chat_history(chat_id: str, start: int = 0):
+    """Messages of a chat from index `start` on (start > 0 for incremental sync)."""
     if not redis_client:
         return []
     
     # Get all messages
     # Key: chat:{chat_id}:messages
-    history = redis_client.lrange(f"chat:{chat_id}:messages", 0, -1)
-    return [json.loads(msg) for msg in history]
+    history = redis_bin.lrange(f"chat:{chat_id}:messages", start, -1)
+    if not history and redis_client.sismember(ARCHIVED_CHATS_KEY, chat_id) and not redis_bin.exists(f"chat:{chat_id}:messages"):
+        # Idle chat moved to Postgres: bring it back into Redis for a while
+        from archiver import rehydrate_chat
+        return rehydrate_chat(chat_id)[start:]
+    return [decode_message(msg) for msg in history]
+
+def restore_chat_messages(chat_id: str, messages: list, ttl_seconds: int):
+    """Loads archived messages back into Redis as an expiring (cache) copy."""
+    if not redis_client:
+        return
+
+    key = f"chat:{chat_id}:messages"
+    pipe = redis_bin.pipeline(transaction=True)
+    pipe.delete(key)
+    if messages:
+        pipe.rpush(key, *[encode_message(m["role"], m["parts"]) for m in messages])
+        pipe.expire(key, ttl_seconds)
+    pipe.execute()
 
-def add_message(chat_id: str, role: str, content: str):
+def add_message(chat_id: str, role: str, content: str, user_id: str = None):
     if not redis_client:
         return
     
-    message = {"role": role, "parts": [content]}
-    redis_client.rpush(f"chat:{chat_id}:messages", json.dumps(message))
+    length = redis_bin.rpush(f"chat:{chat_id}:messages", encode_message(role, [content]))
+    bump_versions(history_scope(chat_id))
+    if user_id is not None and length > 0:
+        _index_for_search(user_id, chat_id, length - 1, [content])
+
+def _index_for_search(user_id: str, chat_id: str, first_index: int, texts: list):
+    # The messages are already saved: a search index failure must not fail the request
+    from search_index import index_messages
+    try:
+        index_messages(user_id, chat_id, first_index, texts)
+    except Exception as e:
+        print(f"⚠️ Could not index chat {chat_id} for search: {e}")
+
+def reencode_chat_messages(chat_id: str) -> int:
+    """
+    Rewrites a chat's message list with the current codec. Uses WATCH so a turn
+    committed meanwhile aborts the rewrite instead of being lost. Returns the
+    number of re-encoded entries.
+    """
+    if not redis_client:
+        return 0
+
+    key = f"chat:{chat_id}:messages"
+    with redis_bin.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            entries = pipe.lrange(key, 0, -1)
+            if not entries:
+                return 0
+            encoded = [encode_message(m["role"], m["parts"]) for m in map(decode_message, entries)]
+            if encoded == entries:
+                return 0
+            pipe.multi()
+            pipe.delete(key)
+            pipe.rpush(key, *encoded)
+            pipe.execute()
+            return len(encoded)
+        except redis.WatchError:
+            return 0
+
+def reencode_all_chats():
+    """Migrates every stored chat to the configured codec (see manage.py)."""
+    if not redis_client:
+        return 0
+
+    total = 0
+    for key in redis_client.scan_iter(match="chat:*:messages", count=500):
+        total += reencode_chat_messages(key.split(":")[1])
+    return total
+
+# Appends both messages of a turn and refreshes the chat metadata atomically.
+# KEYS[1] = chat:{chat_id}:messages   KEYS[2] = user:{user_id}:chats   KEYS[3] = user:{user_id}:chats:recent
+# KEYS[4] = chats:activity            KEYS[5] = chats:archived
+# KEYS[6] = version of the chat list  KEYS[7] = version of the chat history
+# ARGV    = chat_id, user message, model message, new title ('' keeps the current one), timestamp, user_id
+# Returns -1 (and writes nothing) if the chat is archived and not loaded in Redis.
+COMMIT_TURN_LUA = """
+if redis.call('SISMEMBER', KEYS[5], ARGV[1]) == 1 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return -1
+    end
+    -- The chat is active again: the Redis copy becomes the source of truth
+    redis.call('PERSIST', KEYS[1])
+    redis.call('SREM', KEYS[5], ARGV[1])
+end
+local length = redis.call('RPUSH', KEYS[1], ARGV[2], ARGV[3])
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[6] .. ':' .. ARGV[1])
+local raw = redis.call('HGET', KEYS[2], ARGV[1])
+if raw then
+    local meta = cjson.decode(raw)
+    if ARGV[4] ~= '' then
+        meta['title'] = ARGV[4]
+    end
+    meta['last_active'] = tonumber(ARGV[5])
+    redis.call('HSET', KEYS[2], ARGV[1], cjson.encode(meta))
+    redis.call('ZADD', KEYS[3], ARGV[5], ARGV[1])
+    redis.call('INCR', KEYS[6])
+end
+redis.call('INCR', KEYS[7])
+return length
+"""
+
+commit_turn_script = redis_bin.register_script(COMMIT_TURN_LUA) if redis_client else None
+
+def commit_chat_turn(user_id: str, chat_id: str, user_message: str, model_message: str, new_title: str = None):
+    """
+    Persists a full chat turn (user message, model reply, optional title and the
+    chat's last-active time) in a single round-trip. Either all of it lands or none.
+    Returns the new message count.
+    """
+    if not redis_client:
+        return 0
+
+    keys = [
+        f"chat:{chat_id}:messages", f"user:{user_id}:chats", f"user:{user_id}:chats:recent",
+        CHAT_ACTIVITY_KEY, ARCHIVED_CHATS_KEY,
+        version_key(chats_scope(user_id)), version_key(history_scope(chat_id))
+    ]
+    args = [
+        chat_id,
+        encode_message("user", [user_message]),
+        encode_message("model", [model_message]),
+        new_title or "",
+        time.time(),
+        user_id,
+    ]
+    length = commit_turn_script(keys=keys, args=args)
+    if length == -1:
+        # The rehydrated copy expired before this turn landed: reload it and retry
+        get_chat_history(chat_id)
+        length = commit_turn_script(keys=keys, args=args)
+    if length < 2:
+        print(f"⚠️ Chat {chat_id} turn not saved: its archived history could not be rehydrated")
+        return length
+
+    _index_for_search(user_id, chat_id, length - 2, [user_message, model_message])
+    return length
 
 # --- User Profile (Personalization) ---
+# Redis is the hot copy. Every write marks the user in facts:dirty and the worker
+# flushes dirty users to the user_facts table (see fact_store.py). If both keys
+# are missing (eviction / flush) the profile is rebuilt once from Postgres.
+
+DIRTY_FACTS_KEY = "facts:dirty"
+
+def set_user_facts_structured(user_id: str, facts: list, mark_dirty: bool = True):
+    """Writes the structured facts and the plain text copy in one round-trip."""
+    if not redis_client:
+        return
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(f"user:{user_id}:profile_structured", json.dumps(facts))
+    pipe.set(f"user:{user_id}:profile", "\n".join([f['text'] for f in facts]))
+    if mark_dirty:
+        pipe.sadd(DIRTY_FACTS_KEY, user_id)
+    pipe.execute()
+
+def _rebuild_profile(user_id: str):
+    from fact_store import load_user_facts_into_redis
+    return load_user_facts_into_redis(user_id)
 
 def get_user_profile(user_id: str) -> str:
     """Retrieve the personalized profile string for a user."""
@@ -104,7 +395,12 @@ def get_user_profile(user_id: str) -> str:
         return "\n".join([f['text'] for f in facts])
     
     # Fallback to old simple string format
-    return redis_client.get(f"user:{user_id}:profile") or ""
+    old_str = redis_client.get(f"user:{user_id}:profile")
+    if old_str is not None:
+        return old_str
+
+    # Redis lost this user's memory: restore it from Postgres
+    return "\n".join([f['text'] for f in _rebuild_profile(user_id)])
 
 def get_user_facts_structured(user_id: str):
     """Retrieve the raw structured list of fact objects."""
@@ -122,8 +418,10 @@ def get_user_facts_structured(user_id: str):
         facts_list = [line.strip() for line in old_str.split('\n') if line.strip()]
         structured = [{"text": f, "created_at": time.time(), "expiry": None} for f in facts_list]
         return structured
+    if old_str is not None:
+        return []
         
-    return []
+    return _rebuild_profile(user_id)
 
 def update_user_profile(user_id: str, profile_data: str):
     """
@@ -178,6 +476,7 @@ def update_user_profile(user_id: str, profile_data: str):
             })
             
     redis_client.set(f"user:{user_id}:profile_structured", json.dumps(new_structured))
+    redis_client.sadd(DIRTY_FACTS_KEY, user_id)
 
 def clean_expired_facts(user_id: str):
     """Checks and removes expired facts."""
@@ -192,9 +491,96 @@ def clean_expired_facts(user_id: str):
     
     if len(valid_facts) < len(facts):
         print(f"🧹 Use {user_id}: Cleaned {len(facts) - len(valid_facts)} expired memories.")
-        # Update Redis
-        redis_client.set(f"user:{user_id}:profile_structured", json.dumps(valid_facts))
-        
-        # Sync plain text version
-        plain_text = "\n".join([f['text'] for f in valid_facts])
-        redis_client.set(f"user:{user_id}:profile", plain_text)
+        # Update Redis (structured + plain text version) and schedule the Postgres sync
+        set_user_facts_structured(user_id, valid_facts)
+
+# --- Shared Reward Catalogs ---
+# Catalogs depend only on the favorites text, so users with the same interests
+# share one generated list.
+# Key: rewards:catalog:{sha256(normalized favorites)}  Value: JSON(list of items)
+
+REWARD_STATS_KEY = "rewards:catalog:stats"
+REWARD_LATENCY_KEY = "rewards:catalog:latencies"
+
+def normalize_favorites(favorites: str) -> str:
+    """Lowercase, de-duplicate and sort the comma separated interests."""
+    parts = [p.strip().lower() for p in (favorites or "").split(",")]
+    parts = sorted({" ".join(p.split()) for p in parts if p})
+    return ", ".join(parts)
+
+def reward_catalog_key(favorites: str) -> str:
+    return hashlib.sha256(normalize_favorites(favorites).encode("utf-8")).hexdigest()
+
+def get_reward_catalog(catalog_key: str):
+    """
+    Returns the cached catalog list, or None if it has not been generated yet.
+    An empty list is a recently failed generation (cached briefly, see store_reward_catalog).
+    """
+    if not redis_client:
+        return None
+
+    raw = redis_client.get(f"rewards:catalog:{catalog_key}")
+    if raw is None:
+        return None
+    items = json.loads(raw)
+    if items:
+        redis_client.hincrby(REWARD_STATS_KEY, "hits", 1)
+    return items
+
+def claim_reward_catalog_generation(catalog_key: str) -> bool:
+    """
+    Single-flight guard: only the caller that wins the lock generates the catalog,
+    everyone else keeps serving the "generating" placeholder.
+    """
+    if not redis_client:
+        return False
+    claimed = bool(redis_client.set(
+        f"rewards:catalog:{catalog_key}:lock", "1", nx=True, ex=REWARD_CATALOG_LOCK_SECONDS
+    ))
+    # A miss is a build, not every poll while the build runs
+    if claimed:
+        redis_client.hincrby(REWARD_STATS_KEY, "misses", 1)
+    return claimed
+
+def store_reward_catalog(catalog_key: str, items: list, generation_seconds: float):
+    if not redis_client:
+        return
+
+    # Empty results (LLM failure) are only cached briefly so we retry soon.
+    ttl = REWARD_CATALOG_TTL_SECONDS if items else REWARD_CATALOG_EMPTY_TTL_SECONDS
+    pipe = redis_client.pipeline()
+    pipe.set(f"rewards:catalog:{catalog_key}", json.dumps(items), ex=ttl)
+    pipe.delete(f"rewards:catalog:{catalog_key}:lock")
+    pipe.hincrby(REWARD_STATS_KEY, "generations" if items else "failures", 1)
+    pipe.hincrbyfloat(REWARD_STATS_KEY, "generation_seconds_total", generation_seconds)
+    pipe.lpush(REWARD_LATENCY_KEY, round(generation_seconds, 3))
+    pipe.ltrim(REWARD_LATENCY_KEY, 0, 199)
+    pipe.execute()
+
+def get_reward_catalog_stats():
+    if not redis_client:
+        return {}
+
+    raw = redis_client.hgetall(REWARD_STATS_KEY)
+    latencies = sorted(float(x) for x in redis_client.lrange(REWARD_LATENCY_KEY, 0, -1))
+    hits = int(raw.get("hits", 0))
+    misses = int(raw.get("misses", 0))
+    generations = int(raw.get("generations", 0))
+    failures = int(raw.get("failures", 0))
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    total_runs = generations + failures
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        "generations": generations,
+        "failures": failures,
+        "generation_seconds_avg": round(float(raw.get("generation_seconds_total", 0)) / total_runs, 3) if total_runs else None,
+        "generation_seconds_p50": percentile(0.50),
+        "generation_seconds_p95": percentile(0.95),
+    }
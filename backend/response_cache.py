@@ -0,0 +1,204 @@
+"""
+Response cache of /chat answers for introductory questions ("teach me
+recursion", "what is a derivative") that would otherwise go to the expensive
+teaching/academic models every time. Opt-in with RESPONSE_CACHE_ENABLED.
+
+Only first-turn, non-personal questions are eligible (eligible()). Their
+answers are generated without the user's profile or name, so they can be
+served to anyone. A question is reduced to its content terms in order
+(content_terms()): lowercased words with light plural folding, minus common
+stopwords and filler such as "teach", "explain", "please". Numbers, single
+characters and negations are kept, so "World War 1" / "World War 2" and
+"is Pluto a planet" / "is Pluto not a planet" stay apart. Two questions share
+an answer only when their term lists are identical: rephrasings hit, while
+near-misses such as "supervised" / "unsupervised" learning do not.
+
+rcache:e:{entry_id}                    Hash  mode, query, terms, payload, created_at, hits  (TTL)
+rcache:{mode}:{version}:x:{digest}     entry id for a term list  (TTL)
+rcache:{mode}:{version}:lru            Sorted set entry id -> last use (LRU eviction)
+
+`version` hashes the mode's model and system prompt, so changing either starts
+a fresh cache instead of serving answers from the old prompt. Only answers
+from the mode's own model are stored (see groq_service.get_ai_response). Hit
+rate and the age of served answers: GET /admin/llm/response-cache.
+"""
+import re
+import json
+import time
+import uuid
+import hashlib
+from redis_client import get_redis_client
+from search_index import STOPWORDS, TOKEN_RE, _stem
+from config import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MODES, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES
+
+STATS_KEY = "rcache:stats"
+AGES_KEY = "rcache:hit_ages"
+MAX_QUERY_CHARS = 200
+
+FILLER = set("""
+teach explain learn tell show understand help please know want need give introduction intro basic simple simply
+step mean meaning define definition concept quick quickly brief briefly overview can could would you me
+""".split())
+NEGATIONS = {"no", "not", "nor", "never", "without"}
+IGNORED = (STOPWORDS | FILLER) - NEGATIONS
+PERSONAL_RE = re.compile(r"\b(my|mine|myself|i'm|im|i am|i was|i feel|i have|i've|i'd|we|our|us)\b", re.IGNORECASE)
+
+
+def eligible(history, user_message):
+    """First turn of a chat, short, and not about the user themselves."""
+    return (
+        RESPONSE_CACHE_ENABLED
+        and not history
+        and len(user_message) <= MAX_QUERY_CHARS
+        and not PERSONAL_RE.search(user_message)
+        and bool(content_terms(user_message))
+    )
+
+
+def content_terms(text):
+    """The question's meaningful words in order, e.g. "What caused World War 1?" -> [caused, world, war, 1]."""
+    text = re.sub(r"n't\b", " not", (text or "").lower())
+    terms = [_stem(t) for t in TOKEN_RE.findall(text) if t not in IGNORED]
+    return list(dict.fromkeys(terms))
+
+
+def _namespace(mode, version):
+    return f"rcache:{mode}:{version}"
+
+
+def _digest(terms):
+    return hashlib.sha256(" ".join(terms).encode()).hexdigest()[:32]
+
+
+def _hit(redis_client, entry_id, entry):
+    now = time.time()
+    age = now - float(entry["created_at"])
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hincrby(f"rcache:e:{entry_id}", "hits", 1)
+    pipe.zadd(f"{_namespace(entry['mode'], entry['version'])}:lru", {entry_id: now})
+    pipe.hincrby(STATS_KEY, "hits", 1)
+    pipe.hincrby(STATS_KEY, f"hits:{entry['mode']}", 1)
+    pipe.lpush(AGES_KEY, round(age))
+    pipe.ltrim(AGES_KEY, 0, 999)
+    pipe.execute()
+    print(f"📚 Response cache hit ({entry['mode']}, {age / 3600:.1f}h old): {entry['query'][:60]}")
+    return {**json.loads(entry["payload"]), "mode": entry["mode"]}
+
+
+def lookup(user_message, versions):
+    """
+    The cached answer payload (plus "mode") for a question with the same content
+    terms as user_message, or None. versions maps each cached mode to its current version.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return None
+    try:
+        return _lookup(redis_client, user_message, versions)
+    except Exception as e:
+        print(f"⚠️ Response cache lookup failed: {e}")
+        return None
+
+
+def _lookup(redis_client, user_message, versions):
+    digest = _digest(content_terms(user_message))
+    for mode in RESPONSE_CACHE_MODES:
+        entry_id = redis_client.get(f"{_namespace(mode, versions[mode])}:x:{digest}")
+        entry = redis_client.hgetall(f"rcache:e:{entry_id}") if entry_id else None
+        if entry:
+            return _hit(redis_client, entry_id, entry)
+    return None
+
+
+def store(user_message, mode, version, payload):
+    """
+    Caches the generic answer payload (JSON-serializable dict) for user_message in `mode`.
+    Called after every miss in a cached mode, so it also counts the misses.
+    """
+    redis_client = get_redis_client()
+    if not redis_client or mode not in RESPONSE_CACHE_MODES:
+        return
+    try:
+        _store(redis_client, user_message, mode, version, payload)
+    except Exception as e:
+        print(f"⚠️ Could not cache response: {e}")
+
+
+def _store(redis_client, user_message, mode, version, payload):
+    terms = content_terms(user_message)
+    namespace = _namespace(mode, version)
+    entry_id = uuid.uuid4().hex[:16]
+    now = time.time()
+    pipe = redis_client.pipeline()
+    pipe.hset(f"rcache:e:{entry_id}", mapping={
+        "mode": mode,
+        "version": version,
+        "query": user_message,
+        "terms": json.dumps(terms),
+        "payload": json.dumps(payload),
+        "created_at": now,
+        "hits": 0,
+    })
+    pipe.expire(f"rcache:e:{entry_id}", RESPONSE_CACHE_TTL_SECONDS)
+    pipe.set(f"{namespace}:x:{_digest(terms)}", entry_id, ex=RESPONSE_CACHE_TTL_SECONDS)
+    pipe.zadd(f"{namespace}:lru", {entry_id: now})
+    pipe.zremrangebyscore(f"{namespace}:lru", "-inf", now - RESPONSE_CACHE_TTL_SECONDS)
+    pipe.hincrby(STATS_KEY, "misses", 1)
+    pipe.execute()
+
+    overflow = redis_client.zcard(f"{namespace}:lru") - RESPONSE_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = redis_client.zrange(f"{namespace}:lru", 0, overflow - 1)
+        pipe = redis_client.pipeline()
+        pipe.zrem(f"{namespace}:lru", *evicted)
+        pipe.delete(*[f"rcache:e:{entry_id}" for entry_id in evicted])  # their x: keys then point nowhere until they expire
+        pipe.hincrby(STATS_KEY, "evictions", len(evicted))
+        pipe.execute()
+
+
+def clear():
+    """Drops every cached answer (e.g. after a content issue). Returns the number of keys deleted."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+    keys = [k for k in redis_client.scan_iter(match="rcache:*", count=1000) if k not in (STATS_KEY, AGES_KEY)]
+    for i in range(0, len(keys), 500):
+        redis_client.delete(*keys[i:i + 500])
+    return len(keys)
+
+
+def get_response_cache_stats(versions):
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    raw = redis_client.hgetall(STATS_KEY)
+    ages = sorted(float(x) for x in redis_client.lrange(AGES_KEY, 0, -1))
+    hits = int(raw.get("hits", 0))
+    misses = int(raw.get("misses", 0))
+
+    def percentile(p):
+        if not ages:
+            return None
+        return ages[min(len(ages) - 1, int(p * len(ages)))]
+
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        "evictions": int(raw.get("evictions", 0)),
+        "modes": {
+            mode: {
+                "version": versions[mode],
+                "entries": redis_client.zcard(f"{_namespace(mode, versions[mode])}:lru"),
+                "hits": int(raw.get(f"hits:{mode}", 0)),
+            }
+            for mode in RESPONSE_CACHE_MODES
+        },
+        # Staleness: how old the answers served from the cache were (last 1000 hits)
+        "served_age_seconds_p50": percentile(0.50),
+        "served_age_seconds_p95": percentile(0.95),
+        "served_age_seconds_max": ages[-1] if ages else None,
+        "ttl_seconds": RESPONSE_CACHE_TTL_SECONDS,
+    }
@@ -0,0 +1,64 @@
+import time
+from redis_client import (
+    get_redis_client, normalize_favorites, reward_catalog_key,
+    get_reward_catalog, claim_reward_catalog_generation, store_reward_catalog
+)
+from groq_service import generate_personalized_rewards
+import jobs
+
+
+def format_reward_items(ai_rewards):
+    """Normalizes raw AI output into the item shape the store frontend expects."""
+    items = []
+    for idx, r in enumerate(ai_rewards or []):
+        items.append({
+            "id": f"rew_{idx}",
+            "name": r.get("name", "Reward"),
+            "cost": r.get("cost", 50),
+            "icon": r.get("icon", "gift"),
+            "category": r.get("category", "General")
+        })
+    return items
+
+
+def build_reward_catalog(catalog_key: str, favorites: str):
+    """
+    Runs the (slow) LLM generation and publishes the result to the shared cache.
+    Only called by the request that won the single-flight lock.
+    """
+    started = time.perf_counter()
+    items = []
+    try:
+        print(f"Generating shared reward catalog {catalog_key[:12]} for: {favorites}")
+        items = format_reward_items(generate_personalized_rewards(favorites))
+    finally:
+        store_reward_catalog(catalog_key, items, time.perf_counter() - started)
+    return items
+
+
+def get_or_schedule_catalog(favorites: str):
+    """
+    Returns (items, status) for the given favorites.
+
+    status is "ready" when the catalog is cached, "generating" when a
+    "reward_catalog" job is building it in the background, or "failed" when the
+    last build came back empty (retried once REWARD_CATALOG_EMPTY_TTL_SECONDS pass).
+    """
+    normalized = normalize_favorites(favorites)
+
+    if not get_redis_client():
+        # No shared cache available: fall back to generating inline.
+        return format_reward_items(generate_personalized_rewards(normalized)), "ready"
+
+    catalog_key = reward_catalog_key(normalized)
+    cached = get_reward_catalog(catalog_key)
+    if cached:
+        return cached, "ready"
+    if cached is not None:
+        return [], "failed"
+
+    if claim_reward_catalog_generation(catalog_key):
+        # Catalogs are shared, so neither the job nor its dedupe belongs to the requesting user
+        jobs.enqueue("reward_catalog", {"catalog_key": catalog_key, "favorites": normalized}, dedupe_id=catalog_key)
+
+    return [], "generating"
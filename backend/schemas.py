@@ -37,6 +37,19 @@ class ChatMetadata(BaseModel):
     id: str
     title: str
     created_at: float
+    last_active: Optional[float] = None
+
+class ChatPage(BaseModel):
+    chats: List[ChatMetadata]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
+class ChatSearchResult(BaseModel):
+    chat_id: str
+    title: Optional[str] = None
+    score: float
+    message_index: int
+    snippet: str
+    highlights: List[List[int]] = []  # [start, end) offsets of matches inside snippet
 
 class ChatRequest(BaseModel):
     message: str
@@ -47,8 +60,9 @@ class ChatResponse(BaseModel):
     chat_id: str
     title: Optional[str] = None
     mode: str
-    memory_updated: bool = False
-    goal_created: Optional[str] = None
+    # Emotion log, profile facts and auto goal, written after the reply:
+    # poll GET /jobs/{job_id} for their result (memory_updated, goal_created)
+    side_effects: Optional["JobStatus"] = None
 
 class UpdateProfileRequest(BaseModel):
     profile_text: str
@@ -79,9 +93,72 @@ class Goal(GoalBase):
     status: str
     created_at: datetime
     subtasks: Optional[str] = None
+    subtask_count: int = 0
+    completed_count: int = 0
 
     class Config:
         from_attributes = True
 
+class GoalWithJob(Goal):
+    job_id: Optional[str] = None
+
+class GoalProjection(BaseModel):
+    """GET /goals?fields=... - only the requested fields are serialized."""
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    duration: Optional[int] = None
+    duration_unit: Optional[str] = None
+    priority: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    subtasks: Optional[str] = None
+    subtask_count: Optional[int] = None
+    completed_count: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class GoalProgress(BaseModel):
+    goal_id: int
+    title: str
+    status: str
+    priority: Optional[str] = None
+    subtask_count: int
+    completed_count: int
+    completion_pct: float
+    current_day: int
+    total_days: int
+    overdue_count: int
+    streak: int
+
+class Subtask(BaseModel):
+    text: str
+    completed: bool
+
+class SubtaskUpdate(BaseModel):
+    completed: Optional[bool] = None
+    text: Optional[str] = None
+
+class SubtaskProgress(BaseModel):
+    goal_id: int
+    index: int
+    text: str
+    completed: bool
+    completed_count: int
+    subtask_count: int
+    status: str
+    job_id: Optional[str] = None
+
+# Job Schemas
+class JobStatus(BaseModel):
+    job_id: Optional[str] = None
+    kind: str
+    status: str  # 'queued', 'running', 'retrying', 'succeeded', 'failed'
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
 class RedeemRequest(BaseModel):
     cost: int
@@ -0,0 +1,340 @@
+"""
+Per-user inverted index over chat messages, maintained incrementally on every
+committed turn.
+
+search:{user_id}:t:{term}              Sorted set  member "{chat_id}:{message_index}"  score = term frequency
+search:{user_id}:c:{chat_id}:postings  Set of "{term}:{message_index}" indexed for a chat (for cleanup)
+search:{user_id}:docs                  Number of indexed messages with at least one term (for idf)
+search:{user_id}:chats              Sorted set  indexed chat_id -> last activity
+search:users                        Sorted set  user_id -> last index write
+search:dropped                      Set of users whose idle index was dropped
+
+Only the SEARCH_INDEX_MAX_CHATS most recently active chats of a user are
+indexed; older ones are trimmed and re-indexed whole if they become active
+again. Both run as search_reindex jobs, off the /chat path. The index of a user
+idle for SEARCH_INDEX_IDLE_DAYS is dropped by the worker and rebuilt in the
+background on their next search.
+"""
+import re
+import json
+import math
+import time
+import uuid
+from collections import Counter
+from redis_client import get_redis_client, get_redis_binary_client, ARCHIVED_CHATS_KEY
+from chat_codec import decode_message
+from single_flight import release_script
+from config import SEARCH_INDEX_MAX_CHATS, SEARCH_INDEX_IDLE_DAYS
+
+STOPWORDS = set("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+out over own same she should so some such than that the their them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with you your yours
+""".split())
+
+USERS_KEY = "search:users"
+DROPPED_KEY = "search:dropped"
+JANITOR_LOCK_KEY = "search:janitor:lock"
+
+MAX_QUERY_TERMS = 8
+SNIPPET_RADIUS = 60
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _stem(token: str) -> str:
+    # Light plural folding so "eigenvectors" finds "eigenvector"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    return [
+        _stem(t) for t in TOKEN_RE.findall((text or "").lower())
+        if len(t) > 1 and t not in STOPWORDS
+    ]
+
+
+def _term_key(user_id, term):
+    return f"search:{user_id}:t:{term}"
+
+
+def _chats_key(user_id):
+    return f"search:{user_id}:chats"
+
+
+def _postings_key(user_id, chat_id):
+    return f"search:{user_id}:c:{chat_id}:postings"
+
+
+def index_messages(user_id: str, chat_id: str, first_index: int, texts):
+    """
+    Adds messages (stored at first_index, first_index + 1, ...) to the index. Called on
+    the /chat path: indexing a whole chat and trimming the index are left to a job.
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return
+
+    if first_index > 0 and redis_client.zscore(_chats_key(user_id), chat_id) is None:
+        # Trimmed or dropped earlier: index the whole chat in the background
+        _schedule_reindex(user_id, chat_id)
+        return
+
+    if _add_postings(redis_client, user_id, chat_id, first_index, texts) > SEARCH_INDEX_MAX_CHATS:
+        _schedule_reindex(user_id, None, trim_only=True)
+
+
+def _schedule_reindex(user_id, chat_id, trim_only=False):
+    import jobs
+    payload = {"user_id": user_id, "chat_id": chat_id, "trim_only": trim_only}
+    jobs.enqueue("search_reindex", payload, user_id=user_id, dedupe_id=chat_id or "trim")
+
+
+def _add_postings(redis_client, user_id, chat_id, first_index, texts, last_active=None):
+    """Writes the postings of the messages; returns the number of chats indexed for the user."""
+    pipe = redis_client.pipeline(transaction=False)
+    postings = set()
+    docs = 0
+    for offset, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        if not counts:
+            continue
+        docs += 1
+        index = first_index + offset
+        for term, tf in counts.items():
+            pipe.zadd(_term_key(user_id, term), {f"{chat_id}:{index}": tf})
+            postings.add(f"{term}:{index}")
+    if postings:
+        pipe.sadd(_postings_key(user_id, chat_id), *postings)
+        pipe.incrby(f"search:{user_id}:docs", docs)
+    pipe.zadd(_chats_key(user_id), {chat_id: last_active or time.time()})
+    pipe.zadd(USERS_KEY, {user_id: time.time()})
+    pipe.zcard(_chats_key(user_id))
+    return pipe.execute()[-1]
+
+
+def remove_chat(user_id: str, chat_id: str):
+    """Drops every posting of a chat (called when the chat is deleted or trimmed)."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return
+
+    postings_key = _postings_key(user_id, chat_id)
+    members = {}
+    for posting in redis_client.smembers(postings_key):
+        term, index = posting.rsplit(":", 1)
+        members.setdefault(term, []).append(f"{chat_id}:{index}")
+    docs = {member for term_members in members.values() for member in term_members}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for term, term_members in members.items():
+        pipe.zrem(_term_key(user_id, term), *term_members)
+    pipe.delete(postings_key)
+    pipe.zrem(_chats_key(user_id), chat_id)
+    if docs:
+        pipe.decrby(f"search:{user_id}:docs", len(docs))
+    pipe.execute()
+
+
+def trim_chats(user_id: str):
+    """Drops the postings of the user's least recently active chats beyond SEARCH_INDEX_MAX_CHATS."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    overflow = redis_client.zcard(_chats_key(user_id)) - SEARCH_INDEX_MAX_CHATS
+    old_chat_ids = redis_client.zrange(_chats_key(user_id), 0, overflow - 1) if overflow > 0 else []
+    for chat_id in old_chat_ids:
+        remove_chat(user_id, chat_id)
+    return len(old_chat_ids)
+
+
+def reindex_chat(user_id: str, chat_id: str):
+    """Rebuilds the postings of one chat from its stored history."""
+    from redis_client import get_chat_history
+    redis_client = get_redis_client()
+    remove_chat(user_id, chat_id)
+    history = get_chat_history(chat_id)
+    last_active = redis_client.zscore(f"user:{user_id}:chats:recent", chat_id)
+    _add_postings(redis_client, user_id, chat_id, 0, [" ".join(map(str, m["parts"])) for m in history], last_active)
+    return len(history)
+
+
+def reindex_user(user_id: str):
+    """Rebuilds the index of a user's SEARCH_INDEX_MAX_CHATS most recently active chats."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    total = 0
+    for chat_id in redis_client.zrevrange(f"user:{user_id}:chats:recent", 0, SEARCH_INDEX_MAX_CHATS - 1):
+        total += reindex_chat(user_id, chat_id)
+    trim_chats(user_id)
+    redis_client.srem(DROPPED_KEY, user_id)
+    return total
+
+
+def drop_idle_indexes(idle_days: int = SEARCH_INDEX_IDLE_DAYS, batch_size: int = 100):
+    """Drops the index of users who have not written a message in idle_days (periodic worker task)."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    # Only one janitor at a time across all workers
+    token = uuid.uuid4().hex
+    if not redis_client.set(JANITOR_LOCK_KEY, token, nx=True, ex=600):
+        return 0
+
+    dropped = 0
+    try:
+        cutoff = time.time() - idle_days * 86400
+        for user_id in redis_client.zrangebyscore(USERS_KEY, "-inf", cutoff, start=0, num=batch_size):
+            for chat_id in redis_client.zrange(_chats_key(user_id), 0, -1):
+                remove_chat(user_id, chat_id)
+            pipe = redis_client.pipeline()
+            pipe.delete(f"search:{user_id}:docs", _chats_key(user_id))
+            pipe.zrem(USERS_KEY, user_id)
+            pipe.sadd(DROPPED_KEY, user_id)
+            pipe.execute()
+            dropped += 1
+    finally:
+        release_script(keys=[JANITOR_LOCK_KEY], args=[token])
+
+    if dropped:
+        print(f"🧹 Dropped the search index of {dropped} idle users")
+    return dropped
+
+
+def reindex_all():
+    """Backfills the index for every user's chats (see manage.py)."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    from redis_client import migrate_chat_index
+    total = 0
+    for key in redis_client.scan_iter(match="user:*:chats", count=500):
+        user_id = key.split(":")[1]
+        migrate_chat_index(user_id)
+        total += reindex_user(user_id)
+    return total
+
+
+def _message_texts(hits):
+    """Texts of the (chat_id, message_index) hits: one Redis round-trip, one query for archived chats."""
+    pipe = get_redis_binary_client().pipeline(transaction=False)
+    for chat_id, index in hits:
+        pipe.lindex(f"chat:{chat_id}:messages", index)
+    texts = {}
+    missing = []
+    for (chat_id, index), raw in zip(hits, pipe.execute()):
+        if raw is None:
+            missing.append((chat_id, index))
+        else:
+            texts[chat_id] = " ".join(map(str, decode_message(raw)["parts"]))
+
+    pipe = get_redis_client().pipeline(transaction=False)
+    for chat_id, _ in missing:
+        pipe.sismember(ARCHIVED_CHATS_KEY, chat_id)
+    archived = [hit for hit, is_archived in zip(missing, pipe.execute()) if is_archived]
+    if archived:
+        # Archived chats keep their postings; read the snippets from Postgres
+        from archiver import load_archived_messages_many
+        archives = load_archived_messages_many([chat_id for chat_id, _ in archived])
+        for chat_id, index in archived:
+            messages = archives.get(chat_id) or []
+            if index < len(messages):
+                texts[chat_id] = " ".join(map(str, messages[index]["parts"]))
+    return texts
+
+
+def _snippet(text: str, terms):
+    """Returns (snippet, [[start, end], ...]) around the first matching term."""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+    first = pattern.search(text)
+    if not first:
+        return text[:2 * SNIPPET_RADIUS], []
+
+    start = max(0, first.start() - SNIPPET_RADIUS)
+    end = min(len(text), first.end() + SNIPPET_RADIUS)
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if end < len(text) else ""
+    snippet = prefix + text[start:end] + suffix
+    highlights = [
+        [m.start() + len(prefix), m.end() + len(prefix)]
+        for m in pattern.finditer(text[start:end])
+    ]
+    return snippet, highlights
+
+
+def search_chats(user_id: str, query: str, limit: int = 20):
+    """
+    Ranks the user's chats for `query` (tf-idf over messages, best message per
+    chat) and returns [{chat_id, title, score, message_index, snippet, highlights}].
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return []
+
+    if redis_client.sismember(DROPPED_KEY, user_id):
+        # Dropped while the user was idle: rebuild it in the background
+        import jobs
+        jobs.enqueue("search_reindex", {"user_id": user_id}, user_id=user_id)
+
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(f"search:{user_id}:docs")
+    for term in terms:
+        pipe.zcard(_term_key(user_id, term))
+    total_docs, *dfs = pipe.execute()
+    total_docs = max(int(total_docs or 0), 1)
+
+    weights = {
+        _term_key(user_id, term): math.log(1 + total_docs / df)
+        for term, df in zip(terms, dfs) if df
+    }
+    if not weights:
+        return []
+
+    # Score every matching message, then keep the best message per chat
+    tmp_key = f"search:{user_id}:tmp:{uuid.uuid4().hex}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zunionstore(tmp_key, weights, aggregate="SUM")
+    pipe.zrevrange(tmp_key, 0, limit * 5 - 1, withscores=True)
+    pipe.delete(tmp_key)
+    _, hits, _ = pipe.execute()
+
+    best = {}
+    for member, score in hits:
+        chat_id, index = member.rsplit(":", 1)
+        if chat_id not in best:
+            best[chat_id] = (score, int(index))
+        if len(best) >= limit:
+            break
+    if not best:
+        return []
+
+    chat_ids = list(best)
+    metas = redis_client.hmget(f"user:{user_id}:chats", chat_ids)
+    # Chats deleted but whose postings are not yet cleaned up have no meta
+    live = [(chat_id, raw_meta) for chat_id, raw_meta in zip(chat_ids, metas) if raw_meta is not None]
+    texts = _message_texts([(chat_id, best[chat_id][1]) for chat_id, _ in live])
+    results = []
+    for chat_id, raw_meta in live:
+        score, index = best[chat_id]
+        snippet, highlights = _snippet(texts.get(chat_id, ""), terms)
+        results.append({
+            "chat_id": chat_id,
+            "title": json.loads(raw_meta).get("title"),
+            "score": round(score, 4),
+            "message_index": index,
+            "snippet": snippet,
+            "highlights": highlights,
+        })
+    return results
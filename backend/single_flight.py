@@ -0,0 +1,158 @@
+"""
+Single-flight for LLM generations: double-clicks, frontend retries and two
+goals created with the same title start identical decompose_goal,
+generate_goal_quiz or generate_personalized_rewards calls at the same time.
+The first call (the leader) goes upstream; concurrent duplicates with the same
+(function, normalized arguments) wait for its result instead.
+
+Within a process duplicates wait on the leader's thread. Across API and worker
+processes the leader holds singleflight:lock:{key} in Redis and publishes its
+result to singleflight:result:{key} for SINGLE_FLIGHT_RESULT_TTL_SECONDS;
+followers poll for it. When the leader fails (or its lock expires) without a
+result, the next follower takes over.
+
+Upstream calls saved: GET /admin/llm/single-flight.
+"""
+import json
+import time
+import uuid
+import hashlib
+import threading
+from functools import wraps
+import metrics
+from redis_client import get_redis_client
+from config import SINGLE_FLIGHT_LOCK_SECONDS, SINGLE_FLIGHT_RESULT_TTL_SECONDS
+
+STATS_KEY = "singleflight:stats"
+POLL_SECONDS = 0.1
+
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_redis = get_redis_client()
+release_script = _redis.register_script(RELEASE_LUA) if _redis else None
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+_flights = {}  # key -> _Flight led by a thread of this process
+_flights_lock = threading.Lock()
+
+
+def normalize_text(text):
+    return " ".join(str(text or "").split()).casefold()
+
+
+def _count(function, role):
+    metrics.LLM_SINGLE_FLIGHT.labels(function=function, role=role).inc()
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            redis_client.hincrby(STATS_KEY, f"{function}:{role}", 1)
+        except Exception as e:
+            print(f"⚠️ Could not update single-flight stats: {e}")
+
+
+def _shared(function, key, compute):
+    """Coalesces across processes through Redis; returns compute()'s result or the leader's."""
+    redis_client = get_redis_client()
+    if not redis_client:
+        _count(function, "leader")
+        return compute()
+
+    lock_key, result_key = f"singleflight:lock:{key}", f"singleflight:result:{key}"
+    token = uuid.uuid4().hex
+    try:
+        while not redis_client.set(lock_key, token, nx=True, ex=SINGLE_FLIGHT_LOCK_SECONDS):
+            cached = redis_client.get(result_key)
+            if cached is not None:
+                _count(function, "coalesced")
+                return json.loads(cached)
+            time.sleep(POLL_SECONDS)
+        # A leader may have finished between our last poll and taking the lock
+        cached = redis_client.get(result_key)
+    except Exception as e:
+        print(f"⚠️ Single-flight unavailable for {function}: {e}")
+        _count(function, "leader")
+        return compute()
+    if cached is not None:
+        release_script(keys=[lock_key], args=[token])
+        _count(function, "coalesced")
+        return json.loads(cached)
+
+    _count(function, "leader")
+    try:
+        value = compute()
+        if SINGLE_FLIGHT_RESULT_TTL_SECONDS > 0:
+            redis_client.set(result_key, json.dumps(value), ex=SINGLE_FLIGHT_RESULT_TTL_SECONDS)
+        return value
+    finally:
+        try:
+            release_script(keys=[lock_key], args=[token])
+        except Exception as e:
+            print(f"⚠️ Could not release single-flight lock for {function}: {e}")
+
+
+def coalesce(function, key):
+    """
+    Decorator: concurrent calls whose key(*args, **kwargs) matches share one execution.
+    Results must be JSON-serializable; callbacks passed to followers are not called.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            digest = hashlib.sha256(json.dumps(key(*args, **kwargs), default=str).encode()).hexdigest()[:32]
+            flight_key = f"{function}:{digest}"
+
+            with _flights_lock:
+                flight = _flights.get(flight_key)
+                leading = flight is None
+                if leading:
+                    flight = _flights[flight_key] = _Flight()
+
+            if not leading:
+                flight.done.wait()
+                if flight.ok:
+                    _count(function, "coalesced")
+                    return flight.value
+                # The leader failed: try on our own
+                return _shared(function, flight_key, lambda: fn(*args, **kwargs))
+
+            try:
+                flight.value = _shared(function, flight_key, lambda: fn(*args, **kwargs))
+                flight.ok = True
+                return flight.value
+            finally:
+                with _flights_lock:
+                    _flights.pop(flight_key, None)
+                flight.done.set()
+        return wrapper
+    return decorator
+
+
+def get_single_flight_stats():
+    redis_client = get_redis_client()
+    if not redis_client:
+        return {}
+
+    stats = {}
+    for field, value in redis_client.hgetall(STATS_KEY).items():
+        function, _, role = field.rpartition(":")
+        stats.setdefault(function, {"leader": 0, "coalesced": 0})[role] = int(value)
+    for counts in stats.values():
+        total = counts["leader"] + counts["coalesced"]
+        counts["upstream_calls_saved"] = counts["coalesced"]
+        counts["saved_ratio"] = round(counts["coalesced"] / total, 4) if total else None
+    return {
+        "functions": stats,
+        "upstream_calls_saved": sum(c["coalesced"] for c in stats.values()),
+    }
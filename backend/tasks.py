@@ -0,0 +1,191 @@
+import re
+import json
+import models
+from database import SessionLocal
+from jobs import job_handler, completed_steps, mark_step
+from redis_client import bump_versions, goals_scope, get_user_profile, update_user_profile
+import emotion_service
+from groq_service import decompose_goal, generate_goal_quiz
+import reward_service
+import search_index
+
+# Handlers for LLM side tasks executed by the job worker (see worker.py), and
+# for the /chat side-effects the API runs itself after replying (jobs.claim).
+# Each handler receives the JSON payload it was enqueued with and returns a
+# JSON-serializable result that is exposed through GET /jobs/{id}.
+
+
+@job_handler("goal_quiz")
+def generate_quiz_job(payload):
+    db = SessionLocal()
+    try:
+        db_goal = db.query(models.Goal).filter(
+            models.Goal.id == payload["goal_id"], models.Goal.user_id == payload["user_id"]
+        ).first()
+        # The user may have un-checked a task while the job was queued
+        if not db_goal or db_goal.quiz_content or not db_goal.all_subtasks_completed:
+            return {"generated": False}
+
+        subtasks = db_goal.subtask_list()
+
+        print(f"🎉 Goal {db_goal.id} completed! Generating quiz...")
+        quiz_data = generate_goal_quiz(db_goal.title, subtasks)
+        if quiz_data:
+            db_goal.quiz_content = json.dumps(quiz_data)
+            db.commit()
+        return {"generated": bool(quiz_data)}
+    finally:
+        db.close()
+
+
+def _keep_ticks(db, db_goal, subtasks, published):
+    """
+    Carries the checkboxes the user ticked on the first `published` subtasks (shown
+    by an earlier partial write of this breakdown) over to the list about to replace them.
+    """
+    if not published:
+        return subtasks
+    # Toggles are written by other requests: reload the rows instead of trusting the session
+    db.expire(db_goal, ["subtask_rows"])
+    current = db_goal.subtask_list()[:published]
+    merged = [dict(item) if isinstance(item, dict) else {"text": str(item), "completed": False} for item in subtasks]
+    for item, row in zip(merged, current):
+        if row["completed"] and str(item.get("text", "")) == row["text"]:
+            item["completed"] = True
+    return merged
+
+
+@job_handler("goal_decompose")
+def decompose_goal_job(payload):
+    db = SessionLocal()
+    try:
+        db_goal = db.query(models.Goal).filter(
+            models.Goal.id == payload["goal_id"], models.Goal.user_id == payload["user_id"]
+        ).first()
+        if not db_goal:
+            return {"goal_id": payload["goal_id"], "subtask_count": 0}
+
+        published = [0]
+
+        def persist_partial(partial_subtasks):
+            # Long goals are generated in chunks; show finished weeks while the rest runs
+            db_goal.subtasks = _keep_ticks(db, db_goal, partial_subtasks, published[0])
+            db_goal.quiz_content = None
+            db.commit()
+            published[0] = len(partial_subtasks)
+            bump_versions(goals_scope(db_goal.user_id))
+
+        subtasks_list = decompose_goal(
+            db_goal.title, db_goal.duration, db_goal.duration_unit, payload.get("breakdown_type", "daily"),
+            on_progress=persist_partial
+        )
+
+        db_goal.subtasks = _keep_ticks(db, db_goal, subtasks_list, published[0])
+        db_goal.status = "in_progress" # Reset status if it was completed
+        db_goal.quiz_content = None   # Reset quiz since tasks changed
+        db.commit()
+        bump_versions(goals_scope(db_goal.user_id))
+        return {"goal_id": db_goal.id, "subtask_count": len(subtasks_list)}
+    finally:
+        db.close()
+
+
+@job_handler("search_reindex")
+def search_reindex_job(payload):
+    # One chat that became active again, only the trim, or the whole (dropped) index of the user
+    user_id = str(payload["user_id"])
+    if payload.get("trim_only"):
+        return {"indexed_messages": 0, "trimmed_chats": search_index.trim_chats(user_id)}
+    if payload.get("chat_id"):
+        indexed = search_index.reindex_chat(user_id, payload["chat_id"])
+        return {"indexed_messages": indexed, "trimmed_chats": search_index.trim_chats(user_id)}
+    return {"indexed_messages": search_index.reindex_user(user_id)}
+
+
+@job_handler("reward_catalog")
+def reward_catalog_job(payload):
+    items = reward_service.build_reward_catalog(payload["catalog_key"], payload["favorites"])
+    return {"catalog_key": payload["catalog_key"], "item_count": len(items)}
+
+
+def _goal_data(suggested_goal):
+    # The model sometimes returns just a string instead of a dict
+    if isinstance(suggested_goal, dict):
+        return suggested_goal
+    if not isinstance(suggested_goal, str):
+        raise ValueError("Invalid format for suggested_goal")
+
+    duration, unit = 7, "days"
+    # Try to extract the duration ("1 week", "2 days", ...) from the string itself
+    match = re.search(r'(\d+)\s*(day|week|month)s?', suggested_goal, re.IGNORECASE)
+    if match:
+        duration = int(match.group(1))
+        unit = {"day": "days", "week": "weeks", "month": "months"}[match.group(2).lower()]
+    return {"title": suggested_goal, "duration": duration, "duration_unit": unit, "priority": "Medium"}
+
+
+@job_handler("chat_side_effects")
+def chat_side_effects_job(payload):
+    """
+    The writes of a /chat turn that the reply does not wait for: the emotion log,
+    facts learned for the profile and the goal the model suggested. Each step is
+    recorded once done, so a retry after a later step failed does not repeat it.
+    """
+    user_id = payload["user_id"]
+    result = {"emotion_logged": False, "memory_updated": False, "goal_created": None, "goal_id": None}
+    done = completed_steps()
+    db = SessionLocal()
+    try:
+        if "emotion" in done:
+            result["emotion_logged"] = done["emotion"]
+        elif payload.get("emotion"):
+            emotion_service.log_emotion(db, user_id, payload["emotion"], payload["score"])
+            result["emotion_logged"] = True
+            mark_step("emotion")
+
+        new_facts = payload.get("new_facts")
+        if "memory" in done:
+            result["memory_updated"] = done["memory"]
+        elif new_facts:
+            if isinstance(new_facts, dict):
+                new_facts = "\n".join(f"{k}: {v}" for k, v in new_facts.items())
+            elif isinstance(new_facts, list):
+                new_facts = "\n".join(str(f) for f in new_facts)
+            else:
+                new_facts = str(new_facts)
+            # Re-read the profile: it may have changed since the chat request read it
+            profile = get_user_profile(str(user_id))
+            if not profile or new_facts not in profile:
+                update_user_profile(str(user_id), profile + "\n" + new_facts if profile else new_facts)
+                result["memory_updated"] = True
+            mark_step("memory", result["memory_updated"])
+
+        if "goal" in done:
+            result["goal_created"], result["goal_id"] = done["goal"]
+            bump_versions(goals_scope(user_id))  # the attempt that created it may have failed before bumping
+        elif payload.get("suggested_goal"):
+            print(f"🎯 Auto-creating goal input: {payload['suggested_goal']}")
+            try:
+                goal_data = _goal_data(payload["suggested_goal"])
+                new_goal = models.Goal(
+                    user_id=user_id,
+                    title=goal_data.get("title", "New Goal"),
+                    duration=goal_data.get("duration", 7),
+                    duration_unit=goal_data.get("duration_unit", "days"),
+                    priority=goal_data.get("priority", "Medium"),
+                    description="Auto-generated from chat conversation",
+                    subtasks=json.dumps([])
+                )
+                db.add(new_goal)
+                db.commit()
+            except Exception as e:
+                # A malformed suggestion is not worth a retry of the whole job
+                db.rollback()
+                print(f"❌ Failed to auto-create goal: {e}")
+            else:
+                result["goal_created"], result["goal_id"] = new_goal.title, new_goal.id
+                mark_step("goal", [new_goal.title, new_goal.id])
+                bump_versions(goals_scope(user_id))
+        return result
+    finally:
+        db.close()
@@ -0,0 +1,259 @@
+"""
+Lightweight request tracing in the OpenTelemetry data model.
+
+A trace starts at the HTTP middleware (or per background job) with
+start_trace(); every span() opened while it is active becomes a child:
+/chat stages, Redis commands, SQL statements and LLM calls. Finished traces
+are written as OTLP/JSON, either one trace per line to TRACE_FILE or POSTed to
+an OTLP/HTTP collector (TRACE_OTLP_ENDPOINT), from a background thread.
+
+Sampling:
+    TRACE_SAMPLE_RATE   fraction of traces kept (decided up front; unsampled
+                        requests only pay for a contextvar lookup per span)
+    TRACE_SLOW_MS       also keep any trace slower than this. Requires
+                        recording every request, so it costs more; 0 disables.
+
+An incoming W3C `traceparent` header continues the caller's trace (and its
+sampling decision); the response carries the trace id in `traceparent`.
+"""
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from config import (
+    TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT, TRACE_SERVICE_NAME
+)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id, sampled):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []  # list.append is atomic, so pool threads may add spans too
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def enabled():
+    return TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0
+
+
+def current_span():
+    """The active span (or a no-op), e.g. to attach attributes known late."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def _parse_traceparent(header):
+    # version-traceid-parentid-flags
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+@contextmanager
+def start_trace(name, traceparent=None, **attributes):
+    """Root span of a request or job; yields the span (or a no-op when not recorded)."""
+    if not enabled() or _current_span.get() is not None:
+        with span(name, **attributes) as nested:
+            yield nested
+        return
+
+    parent = _parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+    if not sampled and TRACE_SLOW_MS <= 0:
+        yield NOOP_SPAN
+        return
+
+    trace = Trace(trace_id, sampled)
+    root = Span(trace, name, parent_id, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end_ns = time.time_ns()
+        trace.spans.append(root)
+        slow = TRACE_SLOW_MS > 0 and (root.end_ns - root.start_ns) / 1e6 >= TRACE_SLOW_MS
+        if trace.sampled or slow:
+            _exporter().submit(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the active trace; a no-op outside a recorded trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end_ns = time.time_ns()
+        parent.trace.spans.append(child)
+
+
+def start_span(name, **attributes):
+    """For callback-style hooks (SQLAlchemy events): returns (span, token) or None; close with end_span."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    return child, _current_span.set(child)
+
+
+def end_span(handle, error=None):
+    if handle is None:
+        return
+    child, token = handle
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Closed from a different context than it was opened in
+        _current_span.set(None)
+    child.end_ns = time.time_ns()
+    child.error = error
+    child.trace.spans.append(child)
+
+
+def traceparent_header():
+    span = _current_span.get()
+    if span is None:
+        return None
+    return f"00-{span.trace.trace_id}-{span.span_id}-{'01' if span.trace.sampled else '00'}"
+
+
+def propagate(fn):
+    """Wraps fn so it runs in the caller's context (use when submitting to a thread pool)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+# --- Export ---
+
+class _Exporter:
+    """Writes finished traces from a daemon thread so requests never block on I/O."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1000)
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def submit(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            pass  # Drop traces rather than slow down requests
+
+    def _payload(self, traces):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "lumina.tracing"},
+                "spans": [s.to_otlp() for trace in traces for s in trace.spans],
+            }],
+        }]}
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 50:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if TRACE_EXPORTER == "otlp":
+                    request = urllib.request.Request(
+                        TRACE_OTLP_ENDPOINT, data=json.dumps(self._payload(batch)).encode(),
+                        headers={"Content-Type": "application/json"}, method="POST"
+                    )
+                    urllib.request.urlopen(request, timeout=5).close()
+                else:
+                    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                        for trace in batch:
+                            f.write(json.dumps(self._payload([trace])) + "\n")
+            except Exception as e:
+                print(f"⚠️ Failed to export {len(batch)} traces: {e}")
+
+
+_exporter_instance = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter():
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _exporter_lock:
+            if _exporter_instance is None:
+                _exporter_instance = _Exporter()
+    return _exporter_instance
@@ -0,0 +1,44 @@
+"""
+Background job worker.
+
+    python worker.py --concurrency 4 [--metrics-port 9101]
+
+Run one or more of these next to the API; they all consume the same Redis queue.
+Workers also run the periodic maintenance (idle chat archiving, flushing user
+facts to Postgres, the daily fact reconciliation and dropping idle search indexes).
+"""
+import argparse
+from prometheus_client import start_http_server
+import jobs
+import tasks  # noqa: F401  (registers the job handlers)
+import archiver
+import fact_store
+import search_index
+from config import (
+    WORKER_CONCURRENCY, CHAT_ARCHIVE_INTERVAL_SECONDS,
+    FACTS_FLUSH_INTERVAL_SECONDS, FACTS_RECONCILE_INTERVAL_SECONDS, SEARCH_INDEX_JANITOR_INTERVAL_SECONDS
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lumina background job worker")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics (LLM, Redis, SQL) on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    jobs.run_worker(
+        concurrency=args.concurrency,
+        periodic_tasks=[
+            (CHAT_ARCHIVE_INTERVAL_SECONDS, archiver.archive_idle_chats),
+            (FACTS_FLUSH_INTERVAL_SECONDS, fact_store.flush_dirty_facts),
+            (FACTS_RECONCILE_INTERVAL_SECONDS, fact_store.reconcile_all_facts),
+            (SEARCH_INDEX_JANITOR_INTERVAL_SECONDS, search_index.drop_idle_indexes),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ import rehypeKatex from 'rehype-katex';
 import 'katex/dist/katex.min.css';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { oneDark } from 'react-syntax-highlighter/dist/esm/styles/prism';
-import { sendMessage, getHistory, getMe, getChats, createChat, deleteChat, ChatSession, getProfile, updateProfile, updateFavorites } from './api';
+import { sendMessage, getHistory, getMe, getChats, createChat, deleteChat, ChatSession, getProfile, updateProfile, updateFavorites, Job, waitForJob } from './api';
 import { GoalDashboard } from './components/GoalDashboard';
 import { RewardDashboard } from './components/RewardDashboard';
 import './index.css';
@@ -340,6 +340,7 @@ function ChatInterface() {
     const [input, setInput] = useState('');
     const [messages, setMessages] = useState<Message[]>([]);
     const [chats, setChats] = useState<ChatSession[]>([]);
+    const [chatsCursor, setChatsCursor] = useState<string | null>(null);
     const [currentChatId, setCurrentChatId] = useState<string | null>(null);
     const [loading, setLoading] = useState(false);
     const [sidebarOpen, setSidebarOpen] = useState(true);
@@ -382,8 +383,9 @@ function ChatInterface() {
                 const user = await getMe();
                 setUserData(user);
 
-                const userChats = await getChats();
-                setChats(userChats);
+                const page = await getChats();
+                setChats(page.chats);
+                setChatsCursor(page.next_cursor);
 
                 // Default to New Chat instead of opening last chat
                 handleNewChat();
@@ -436,6 +438,17 @@ function ChatInterface() {
         }
     };
 
+    const loadMoreChats = async () => {
+        if (chatsCursor === null) return;
+        try {
+            const page = await getChats(chatsCursor);
+            setChats(prev => [...prev, ...page.chats]);
+            setChatsCursor(page.next_cursor);
+        } catch (e) {
+            console.error("Failed to load more chats", e);
+        }
+    };
+
     const selectChat = async (id: string | null) => {
         if (!id) return;
         setCurrentChatId(id);
@@ -495,6 +508,19 @@ function ChatInterface() {
         scrollToBottom();
     }, [messages]);
 
+    // The backend writes memory and auto-created goals after replying; poll their job in the background
+    const notifySideEffects = (job: Job | null | undefined, memoryMessage: string) => {
+        if (!job) return;
+        waitForJob(job).then(done => {
+            if (done.result?.memory_updated) {
+                setToastMessage(memoryMessage);
+            }
+            if (done.result?.goal_created) {
+                setToastMessage(`Goal created: ${done.result.goal_created}`);
+            }
+        }).catch(console.error);
+    };
+
     const handleSend = async () => {
         if (!input.trim()) return;
 
@@ -513,16 +539,8 @@ function ChatInterface() {
                 const data = await sendMessage(newChat.id, userMsg);
                 setMessages(prev => [...prev, { role: 'model', content: data.response, mode: data.mode }]);
 
-                // Show Notifications based on flags
-                if (data.memory_updated) {
-                    // Using a separate simple global toast or just reuse the existing one with a custom message
-                    // For now, let's reuse the success toast logic slightly modified or add a new state
-                    // Since we only have 'showSuccessToast', let's add a dynamic toast state
-                    setToastMessage("Memory updated with new facts!");
-                }
-                if (data.goal_created) {
-                    setToastMessage(`Goal created: ${data.goal_created}`);
-                }
+                // Show Notifications once the memory / goal updates have landed
+                notifySideEffects(data.side_effects, "Memory updated with new facts!");
 
                 // Update chat title if backend returned one
                 if (data.title) {
@@ -533,16 +551,15 @@ function ChatInterface() {
                 const data = await sendMessage(currentChatId, userMsg);
                 setMessages(prev => [...prev, { role: 'model', content: data.response, mode: data.mode }]);
 
-                if (data.memory_updated) {
-                    setToastMessage("Lumina remembered that!");
-                }
-                if (data.goal_created) {
-                    setToastMessage(`Goal created: ${data.goal_created}`);
-                }
+                notifySideEffects(data.side_effects, "Lumina remembered that!");
             }
-        } catch (error) {
+        } catch (error: any) {
             console.error(error);
-            setMessages(prev => [...prev, { role: 'model', content: "Error: Could not reach the AI companion." }]);
+            // 429: shed under load or over the chat rate; the backend says when to retry
+            const content = error?.response?.status === 429
+                ? `${error.response.data?.detail ?? "Lumina is busy right now."} (try again in ${error.response.headers?.['retry-after'] ?? 'a few'}s)`
+                : "Error: Could not reach the AI companion.";
+            setMessages(prev => [...prev, { role: 'model', content }]);
         } finally {
             setLoading(false);
         }
@@ -656,6 +673,14 @@ function ChatInterface() {
                                     </button>
                                 </div>
                             ))}
+                            {chatsCursor !== null && (
+                                <button
+                                    onClick={loadMoreChats}
+                                    className="w-full p-2 text-xs text-muted hover:text-text transition-all"
+                                >
+                                    Load more
+                                </button>
+                            )}
                         </div>
 
                         {/* User Profile Footer (Same as before) */}
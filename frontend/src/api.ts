@@ -38,6 +38,12 @@ export interface ChatSession {
     id: string;
     title: string;
     created_at: number;
+    last_active?: number;
+}
+
+export interface ChatPage {
+    chats: ChatSession[];
+    next_cursor: string | null;  // opaque, pass back as-is
 }
 
 // --- Auth ---
@@ -71,7 +77,7 @@ export const updateFavorites = async (favorites: string) => {
 
 export const getRewards = async () => {
     const response = await axios.get(`${API_URL}/users/me/rewards`);
-    return response.data; // { coins: number, items: RewardItem[] }
+    return response.data; // { coins: number, items: RewardItem[], history, status: 'ready' | 'generating' }
 }
 
 export const redeemReward = async (cost: number) => {
@@ -96,9 +102,25 @@ export const createChat = async (title: string = "New Chat") => {
     return response.data; // { id, title, created_at }
 }
 
-export const getChats = async () => {
-    const response = await axios.get(`${API_URL}/chats`);
-    return response.data; // [ { id, ... }, ... ]
+export const getChats = async (cursor?: string | null, limit = 50) => {
+    const response = await axios.get(`${API_URL}/chats`, {
+        params: { cursor: cursor ?? undefined, limit }
+    });
+    return response.data as ChatPage; // most recently active first
+}
+
+export interface ChatSearchResult {
+    chat_id: string;
+    title: string | null;
+    score: number;
+    message_index: number;
+    snippet: string;
+    highlights: [number, number][]; // [start, end) offsets inside snippet
+}
+
+export const searchChats = async (q: string, limit = 20) => {
+    const response = await axios.get(`${API_URL}/chats/search`, { params: { q, limit } });
+    return response.data as ChatSearchResult[];
 }
 
 export const deleteChat = async (chatId: string) => {
@@ -113,11 +135,16 @@ export const sendMessage = async (chatId: string, message: string) => {
         chat_id: chatId,
         message: message
     });
-    return response.data; // { response: string, chat_id: string, title?: string, mode: string }
+    return response.data; // { response: string, chat_id: string, title?: string, mode: string, side_effects?: Job }
 };
 
-export const getHistory = async (chatId: string) => {
-    const response = await axios.get(`${API_URL}/chats/${chatId}/history`);
+// GET endpoints send ETags with `Cache-Control: no-cache`, so the browser revalidates
+// polls with If-None-Match and unchanged data comes back as an empty 304.
+// Pass `since` (the number of messages already shown) to fetch only newer ones.
+export const getHistory = async (chatId: string, since = 0) => {
+    const response = await axios.get(`${API_URL}/chats/${chatId}/history`, {
+        params: since ? { since } : undefined
+    });
     return response.data;
 };
 
@@ -132,14 +159,57 @@ export interface Goal {
     priority: string;
     status: string;
     created_at: string;
-    subtasks: string; // JSON string
+    subtasks?: string; // JSON string (omitted by field projections)
+    subtask_count?: number;
+    completed_count?: number;
+}
+
+export interface SubtaskProgress {
+    goal_id: number;
+    index: number;
+    text: string;
+    completed: boolean;
+    completed_count: number;
+    subtask_count: number;
+    status: string;
+    job_id: string | null;
+}
+
+export interface GoalProgress {
+    goal_id: number;
+    title: string;
+    status: string;
+    priority: string | null;
+    subtask_count: number;
+    completed_count: number;
+    completion_pct: number;
+    current_day: number;
+    total_days: number;
+    overdue_count: number;
+    streak: number;
+}
+
+export interface Subtask {
+    text: string;
+    completed: boolean;
 }
 
-export const getGoals = async () => {
-    const response = await axios.get(`${API_URL}/goals`);
+// Pass `fields` (e.g. "id,title,status") to skip large columns such as subtasks
+export const getGoals = async (fields?: string) => {
+    const response = await axios.get(`${API_URL}/goals`, { params: fields ? { fields } : undefined });
     return response.data; // Goal[]
 }
 
+export const getGoalSummary = async () => {
+    const response = await axios.get(`${API_URL}/goals/summary`);
+    return response.data as GoalProgress[];
+}
+
+export const getGoalSubtasks = async (goalId: number) => {
+    const response = await axios.get(`${API_URL}/goals/${goalId}/subtasks`);
+    return response.data as Subtask[];
+}
+
 export const createGoal = async (goal: Omit<Goal, 'id' | 'created_at' | 'status'>) => {
     const response = await axios.post(`${API_URL}/goals`, goal);
     return response.data;
@@ -150,6 +220,11 @@ export const updateGoal = async (id: number, updates: Partial<Goal>) => {
     return response.data;
 }
 
+export const updateSubtask = async (goalId: number, index: number, updates: { completed?: boolean; text?: string }) => {
+    const response = await axios.patch(`${API_URL}/goals/${goalId}/subtasks/${index}`, updates);
+    return response.data as SubtaskProgress;
+}
+
 export const deleteGoal = async (id: number) => {
     const response = await axios.delete(`${API_URL}/goals/${id}`);
     return response.data;
@@ -159,10 +234,39 @@ export const decomposeGoal = async (id: number, breakdownType: 'daily' | 'weekly
     const response = await axios.post(`${API_URL}/goals/${id}/decompose`, null, {
         params: { breakdown_type: breakdownType }
     });
-    return response.data;
+    return response.data; // Job
 }
 
 export const getGoalQuiz = async (id: number) => {
     const response = await axios.get(`${API_URL}/goals/${id}/quiz`);
     return response.data;
 }
+
+// --- Background Jobs ---
+
+export interface Job {
+    job_id: string | null;
+    kind: string;
+    status: 'queued' | 'running' | 'retrying' | 'succeeded' | 'failed';
+    attempts: number;
+    result: any;
+    error: string | null;
+}
+
+export const getJob = async (jobId: string) => {
+    const response = await axios.get(`${API_URL}/jobs/${jobId}`);
+    return response.data as Job;
+}
+
+// Polls a job until it finishes (or the timeout elapses) and returns its final state
+export const waitForJob = async (job: Job, onPoll?: (job: Job) => void, intervalMs = 1500, timeoutMs = 180000) => {
+    const deadline = Date.now() + timeoutMs;
+    let current = job;
+    while (current.job_id && (current.status === 'queued' || current.status === 'running' || current.status === 'retrying')) {
+        if (Date.now() > deadline) break;
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        current = await getJob(current.job_id);
+        onPoll?.(current);
+    }
+    return current;
+}
@@ -1,13 +1,18 @@
 import { useState, useEffect } from 'react';
 import { Target, CheckCircle2, Circle, CalendarCheck, Trash2, Clock, ChevronDown, ChevronUp, Loader2, Plus, Edit2, X, AlertTriangle, RefreshCw, BrainCircuit } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { Goal, getGoals, createGoal, updateGoal, deleteGoal, decomposeGoal, getGoalQuiz } from '../api';
+import { Goal, GoalProgress, Subtask, getGoals, getGoalSummary, getGoalSubtasks, createGoal, updateGoal, updateSubtask, deleteGoal, decomposeGoal, getGoalQuiz, waitForJob } from '../api';
+
+// Everything the cards render; subtasks are fetched per goal when its roadmap is opened
+const DASHBOARD_FIELDS = 'id,title,description,duration,duration_unit,priority,status,created_at,subtask_count,completed_count';
 
 export function GoalDashboard() {
     const [goals, setGoals] = useState<Goal[]>([]);
     const [loading, setLoading] = useState(true);
     const [expandingId, setExpandingId] = useState<number | null>(null);
     const [processingId, setProcessingId] = useState<number | null>(null);
+    const [progressById, setProgressById] = useState<Record<number, GoalProgress>>({});
+    const [subtasksById, setSubtasksById] = useState<Record<number, Subtask[]>>({});
 
     // Modal States
     const [isEditModalOpen, setIsEditModalOpen] = useState(false);
@@ -26,10 +31,13 @@ export function GoalDashboard() {
         loadGoals();
     }, []);
 
-    const loadGoals = async () => {
+    const loadGoals = async (refreshSubtasksOf: number | null = expandingId) => {
         try {
-            const data = await getGoals();
+            const [data, summary] = await Promise.all([getGoals(DASHBOARD_FIELDS), getGoalSummary()]);
             setGoals(data);
+            setProgressById(Object.fromEntries(summary.map(p => [p.goal_id, p])));
+            setSubtasksById({});
+            if (refreshSubtasksOf !== null) await loadSubtasks(refreshSubtasksOf);
         } catch (e) {
             console.error("Failed to load goals", e);
         } finally {
@@ -37,6 +45,24 @@ export function GoalDashboard() {
         }
     };
 
+    const loadSubtasks = async (goalId: number) => {
+        try {
+            const subtasks = await getGoalSubtasks(goalId);
+            setSubtasksById(prev => ({ ...prev, [goalId]: subtasks }));
+        } catch (e) {
+            console.error("Failed to load subtasks", e);
+        }
+    };
+
+    const toggleRoadmap = (goal: Goal) => {
+        if (expandingId === goal.id) {
+            setExpandingId(null);
+            return;
+        }
+        setExpandingId(goal.id);
+        if (!subtasksById[goal.id]) loadSubtasks(goal.id);
+    };
+
     const handleSaveGoal = async (e: React.FormEvent) => {
         e.preventDefault();
         if (!editingGoal || !editingGoal.title) return;
@@ -92,8 +118,15 @@ export function GoalDashboard() {
         setBreakdownGoalId(null);
         setProcessingId(id);
         try {
-            const updatedGoal = await decomposeGoal(id, breakdownType);
-            setGoals(prev => prev.map(g => g.id === id ? updatedGoal : g));
+            // Long goals are generated week by week; refresh to show finished weeks early
+            const job = await waitForJob(await decomposeGoal(id, breakdownType), (j) => {
+                if (j.status === 'running') loadGoals(id);
+            });
+            if (job.status === 'failed') {
+                console.error("Failed to decompose", job.error);
+                return;
+            }
+            await loadGoals(id);
             setExpandingId(id); // Auto expand to show steps
         } catch (e) {
             console.error("Failed to decompose", e);
@@ -103,14 +136,12 @@ export function GoalDashboard() {
     };
 
     const toggleSubtask = async (goal: Goal, index: number) => {
-        const subtasks = getSubtasks(goal.subtasks);
-        if (subtasks[index] && typeof subtasks[index] === 'object') {
-            subtasks[index].completed = !subtasks[index].completed;
-        } else {
-            return;
-        }
+        const subtasks = (subtasksById[goal.id] || []).map(t => ({ ...t }));
+        if (!subtasks[index]) return;
+        subtasks[index].completed = !subtasks[index].completed;
 
-        const allCompleted = subtasks.length > 0 && subtasks.every((t: any) => t.completed);
+        const completedCount = subtasks.filter(t => t.completed).length;
+        const allCompleted = subtasks.length > 0 && completedCount === subtasks.length;
         let newStatus = goal.status;
 
         if (allCompleted && goal.status !== 'completed') {
@@ -120,11 +151,19 @@ export function GoalDashboard() {
         }
 
         // Optimistic Update
-        const updatedSubtasksJson = JSON.stringify(subtasks);
-        setGoals(prev => prev.map(g => g.id === goal.id ? { ...g, subtasks: updatedSubtasksJson, status: newStatus } : g));
+        setSubtasksById(prev => ({ ...prev, [goal.id]: subtasks }));
+        setGoals(prev => prev.map(g => g.id === goal.id ? { ...g, completed_count: completedCount, status: newStatus } : g));
 
         try {
-            await updateGoal(goal.id, { subtasks: updatedSubtasksJson, status: newStatus });
+            // Only the toggled subtask is sent; the server keeps the counts and status in sync
+            const progress = await updateSubtask(goal.id, index, { completed: subtasks[index].completed });
+            setGoals(prev => prev.map(g => g.id === goal.id ? {
+                ...g,
+                status: progress.status,
+                subtask_count: progress.subtask_count,
+                completed_count: progress.completed_count
+            } : g));
+            getGoalSummary().then(summary => setProgressById(Object.fromEntries(summary.map(p => [p.goal_id, p]))));
         } catch (e) {
             console.error("Failed to update subtask", e);
             loadGoals(); // Revert
@@ -160,15 +199,6 @@ export function GoalDashboard() {
         setIsEditModalOpen(true);
     }
 
-    const getSubtasks = (jsonStr: string) => {
-        try {
-            const parsed = JSON.parse(jsonStr);
-            return Array.isArray(parsed) ? parsed : [];
-        } catch {
-            return [];
-        }
-    };
-
     const handleTakeQuiz = async (goalId: number) => {
         setLoadingQuiz(true);
         try {
@@ -372,18 +402,25 @@ export function GoalDashboard() {
 
                                     {/* Roadmap Section */}
                                     <div className="mt-5 pt-4 border-t border-white/5">
-                                        {getSubtasks(goal.subtasks).length > 0 ? (
+                                        {(goal.subtask_count ?? 0) > 0 ? (
                                             <div>
                                                 <button
-                                                    onClick={() => setExpandingId(expandingId === goal.id ? null : goal.id)}
+                                                    onClick={() => toggleRoadmap(goal)}
                                                     className="w-full flex items-center justify-between group/btn text-sm font-medium text-text/80 hover:text-text bg-surface/50 hover:bg-surface border border-white/5 rounded-lg px-3 py-2 transition-all"
                                                 >
                                                     <div className="flex items-center gap-2">
                                                         <Target className="w-4 h-4 text-secondary" />
                                                         <span>View Roadmap</span>
                                                         <span className="bg-primary/20 text-primary text-[10px] px-1.5 py-0.5 rounded-full">
-                                                            {getSubtasks(goal.subtasks).filter((t: any) => typeof t === 'object' ? t.completed : false).length} / {getSubtasks(goal.subtasks).length}
+                                                            {goal.completed_count ?? 0} / {goal.subtask_count ?? 0}
                                                         </span>
+                                                        {progressById[goal.id] && goal.status !== 'completed' && (
+                                                            <span className="text-[10px] text-muted">
+                                                                Day {progressById[goal.id].current_day}/{progressById[goal.id].total_days}
+                                                                {progressById[goal.id].streak > 1 && ` · ${progressById[goal.id].streak} day streak`}
+                                                                {progressById[goal.id].overdue_count > 0 && ` · ${progressById[goal.id].overdue_count} behind`}
+                                                            </span>
+                                                        )}
                                                     </div>
                                                     {expandingId === goal.id ? <ChevronUp className="w-4 h-4" /> : <ChevronDown className="w-4 h-4" />}
                                                 </button>
@@ -397,10 +434,12 @@ export function GoalDashboard() {
                                                             className="overflow-hidden"
                                                         >
                                                             <div className="mt-3 space-y-2 pl-1">
-                                                                {getSubtasks(goal.subtasks).map((step: any, i: number) => {
-                                                                    const isObj = typeof step === 'object';
-                                                                    const text = isObj ? step.text : step;
-                                                                    const isCompleted = isObj ? step.completed : false;
+                                                                {!subtasksById[goal.id] && (
+                                                                    <div className="flex justify-center py-2"><Loader2 className="w-4 h-4 animate-spin text-muted" /></div>
+                                                                )}
+                                                                {(subtasksById[goal.id] || []).map((step, i) => {
+                                                                    const text = step.text;
+                                                                    const isCompleted = step.completed;
 
                                                                     return (
                                                                         <div
@@ -426,7 +465,7 @@ export function GoalDashboard() {
                                                             </div>
 
                                                             {/* Quiz Button if Completed */}
-                                                            {getSubtasks(goal.subtasks).every((t: any) => typeof t === 'object' && t.completed) && (
+                                                            {goal.completed_count === goal.subtask_count && (
                                                                 <div className="mt-4 px-2">
                                                                     <button
                                                                         onClick={() => handleTakeQuiz(goal.id)}
@@ -31,17 +31,29 @@ export function RewardDashboard({ favorites }: { favorites?: string }) {
     const [redeeming, setRedeeming] = useState<string | null>(null);
     const [showHistory, setShowHistory] = useState(false);
 
+    const [generating, setGenerating] = useState(false);
+    const [failed, setFailed] = useState(false);
+
     useEffect(() => {
         setLoading(true);
         loadRewards();
     }, [favorites]); // Reload when favorites change
 
+    // The catalog is built in the background; poll until it is ready (slowly after a failed build)
+    useEffect(() => {
+        if (!generating && !failed) return;
+        const timer = setTimeout(loadRewards, generating ? 3000 : 30000);
+        return () => clearTimeout(timer);
+    }, [generating, failed, items]);
+
     const loadRewards = async () => {
         try {
             const data = await getRewards();
             setBalance(data.coins);
             setItems(data.items);
             setHistory(data.history || []);
+            setGenerating(data.status === 'generating');
+            setFailed(data.status === 'failed');
         } catch (e) {
             console.error(e);
         } finally {
@@ -98,6 +110,14 @@ export function RewardDashboard({ favorites }: { favorites?: string }) {
                 </div>
             </div>
 
+            {generating && (
+                <div className="p-8 text-center text-muted animate-pulse">Curating rewards for your favorites...</div>
+            )}
+
+            {failed && (
+                <div className="p-8 text-center text-muted">Couldn't curate rewards right now. Trying again shortly...</div>
+            )}
+
             {/* Reward Grid */}
             <div className="space-y-12">
                 {categories.map((cat) => {